@@ -0,0 +1 @@
+"""Benchmarks for DrawWrite. Run each one from drawwritesite/ with python -m."""
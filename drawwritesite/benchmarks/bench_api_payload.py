@@ -0,0 +1,242 @@
+"""
+Compare the bytes a game takes over the pages with the JSON API.
+
+Plays the same game of --players players twice, once through the pages
+the browser uses and once through drawwrite.api, and adds up the bytes
+of every request and response body along the way. Each wait is polled
+once. The static files the pages load are left out, as browsers cache
+them. Run from drawwritesite/:
+
+    python -m benchmarks.bench_api_payload --players 6
+
+The run uses a throwaway test database created from the configured
+settings. Prints a JSON document with, for each flow, the requests made
+and the bytes sent, received and received after gzip, per step and in
+total.
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from base64 import b64encode
+from urllib.parse import urlencode, urlparse
+
+import django
+
+# A 1x1 transparent PNG, used for every drawing.
+PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)
+PNG_DATA_URL = 'data:image/png;base64,' + b64encode(PNG).decode('ascii')
+
+# Tally {{{
+class Tally:
+    """Bytes sent and received per step of a flow."""
+
+    def __init__(self):
+        """Initialize the object"""
+        self.steps = {}
+
+    def add(self, step, sent, response):
+        """Count one request of step and its response."""
+        entry = self.steps.setdefault(step, {
+            'requests': 0, 'sent': 0, 'received': 0, 'received_gzip': 0,
+        })
+        entry['requests'] += 1
+        entry['sent'] += sent
+        entry['received'] += len(response.content)
+        entry['received_gzip'] += len(gzip.compress(response.content))
+
+    def report(self):
+        """Return the steps along with their total."""
+        total = {'requests': 0, 'sent': 0, 'received': 0, 'received_gzip': 0}
+        for entry in self.steps.values():
+            for key in total:
+                total[key] += entry[key]
+        return {'steps': self.steps, 'total': total}
+# }}}
+
+# Page flow {{{
+def play_pages(name, players):
+    """Play a game through the pages, and return its tally."""
+    from django.test import Client
+    from django.urls import resolve, reverse
+
+    tally = Tally()
+
+    def get(client, step, path):
+        """GET path, counting it under step."""
+        response = client.get(path)
+        tally.add(step, 0, response)
+        return response
+
+    def post(client, step, path, data):
+        """POST data to path and follow any redirect, counting both under step."""
+        response = client.post(path, data)
+        tally.add(step, len(urlencode(data)), response)
+        if response.status_code == 302:
+            response = get(client, step, response.url)
+        return response
+
+    clients = []
+    for num in range(players):
+        client = Client()
+        response = post(
+            client, 'enter',
+            reverse('drawwrite:createGame' if num == 0 else 'drawwrite:joinGame'),
+            {'username': 'player{0}'.format(num), 'gamename': name},
+        )
+        player_id = resolve(urlparse(response.request['PATH_INFO']).path).kwargs['player_id']
+        clients.append((client, player_id))
+    for client, player_id in clients:
+        get(client, 'lobby', reverse('drawwrite:checkGameStart', args=[player_id]))
+    creator, creator_id = clients[0]
+    post(creator, 'start', reverse('drawwrite:startGame', args=[creator_id]), {})
+
+    for _ in range(players):
+        for client, player_id in clients:
+            response = get(client, 'task', reverse('drawwrite:play', args=[player_id]))
+            if response.context['prev_link_type'] == 'write':
+                data = {'drawing': PNG_DATA_URL}
+            else:
+                data = {'description': 'a sentence'}
+            response = post(client, 'submit',
+                            reverse('drawwrite:createLink', args=[player_id]), data)
+            if response.status_code != 200:
+                continue
+            template = response.templates[0].name
+            if template == 'drawwrite/roundWaiting.html':
+                get(client, 'wait', reverse('drawwrite:checkRoundDone', args=[player_id]))
+            elif template == 'drawwrite/gameWaiting.html':
+                get(client, 'wait', reverse('drawwrite:checkGameDone',
+                                            args=[response.context['game_id']]))
+
+    for client, player_id in clients:
+        response = get(client, 'results', reverse('drawwrite:play', args=[player_id]))
+        get(client, 'results', response.url)
+        get(client, 'results', reverse('drawwrite:showChain', args=[player_id]))
+    return tally
+# }}}
+
+# API flow {{{
+def play_api(name, players):
+    """Play a game through the JSON API, and return its tally."""
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.test import Client
+    from django.urls import reverse
+
+    tally = Tally()
+    client = Client()
+
+    def call(step, path, data=None, sent=None):
+        """GET path, or POST data to it, counting it under step."""
+        if data is None:
+            response = client.get(path)
+            sent = 0
+        elif sent is None:
+            body = json.dumps(data, separators=(',', ':'))
+            response = client.post(path, body, content_type='application/json')
+            sent = len(body)
+        else:
+            response = client.post(path, data)
+        tally.add(step, sent, response)
+        return response.json()
+
+    tokens = []
+    for num in range(players):
+        data = call(
+            'enter',
+            reverse('drawwrite:apiCreateGame' if num == 0 else 'drawwrite:apiJoinGame'),
+            {'game': name, 'player': 'player{0}'.format(num)},
+        )
+        tokens.append(data['token'])
+        game_id = data['game']
+    for token in tokens:
+        call('lobby', reverse('drawwrite:apiLobby', args=[token]))
+    call('start', reverse('drawwrite:apiStartGame', args=[tokens[0]]), {})
+
+    # Submitting a link returns the next task, so the task is only fetched
+    # when that said to wait.
+    tasks = {}
+    for _ in range(players):
+        for token in tokens:
+            task = tasks.get(token)
+            if task is None or task['state'] != 'add':
+                task = call('task', reverse('drawwrite:apiTask', args=[token]))
+            path = reverse('drawwrite:apiCreateLink', args=[token])
+            if task['type'] == 'draw':
+                drawing = SimpleUploadedFile('drawing.png', PNG, 'image/png')
+                task = call('submit', path, {'drawing': drawing}, sent=len(PNG))
+            else:
+                task = call('submit', path, {'text': 'a sentence'})
+            if task['state'] in ('roundWaiting', 'gameWaiting'):
+                call('wait', reverse('drawwrite:apiTask', args=[token]))
+            tasks[token] = task
+
+    page = 1
+    while True:
+        results = call('results', '{0}?page={1}'.format(
+            reverse('drawwrite:apiResults', args=[game_id]), page))
+        if page >= results['pages']:
+            break
+        page += 1
+    return tally
+# }}}
+
+# run {{{
+def run(options):
+    """Play the game through both flows, and return a report."""
+    from django.test.utils import override_settings
+
+    media_root = tempfile.mkdtemp(prefix='drawwrite-payload-media-')
+    try:
+        with override_settings(MEDIA_ROOT=media_root, DEBUG=False):
+            pages = play_pages('pages', options.players)
+            api = play_api('api', options.players)
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+    pages, api = pages.report(), api.report()
+    return {
+        'config': {'players': options.players},
+        'pages': pages,
+        'api': api,
+        'received_ratio': api['total']['received'] / pages['total']['received'],
+        'received_gzip_ratio': api['total']['received_gzip'] / pages['total']['received_gzip'],
+        'sent_ratio': api['total']['sent'] / pages['total']['sent'],
+    }
+# }}}
+
+def main():
+    """Set up a test database, run the benchmark, print the report."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=6)
+    options = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drawwritesite.settings")
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    logging.disable(logging.CRITICAL)
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        report = run(options)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
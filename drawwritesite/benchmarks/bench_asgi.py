@@ -0,0 +1,217 @@
+"""
+Compare how many idle long-polling clients one process can hold under WSGI
+and under ASGI.
+
+--pollers clients each poll checkGameStart for a game that never starts,
+asking to be held for --wait seconds, and the process has --threads
+threads to serve them with. Under WSGI a held request keeps its thread
+for the whole wait, checking every --interval seconds, so at most
+--threads clients are held at once and the rest queue behind them. Under
+ASGI (drawwrite.asgi.ASGIHandler) a held request only takes a thread for
+each check. Run from drawwritesite/:
+
+    python -m benchmarks.bench_asgi --pollers 200 --threads 8 --wait 2
+
+The run uses a throwaway test database created from the configured
+settings. Prints a JSON document with, for each server, the wall time to
+serve every client, the most clients held at once, and the number of
+checks made.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+# Held {{{
+class Held:
+    """Thread-safe count of the clients being held, and its peak."""
+
+    def __init__(self):
+        """Initialize the object"""
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+        self.checks = 0
+
+    def enter(self):
+        """Count one more held client."""
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def leave(self):
+        """Count one fewer held client."""
+        with self.lock:
+            self.current -= 1
+
+    def check(self):
+        """Count one check."""
+        with self.lock:
+            self.checks += 1
+# }}}
+
+# WSGI {{{
+def run_wsgi(path, options):
+    """Hold every poller with a sync handler, a thread per held request."""
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test.client import RequestFactory
+
+    handler = WSGIHandler()
+    held = Held()
+
+    def check():
+        """Serve one check of the game's status."""
+        held.check()
+        environ = RequestFactory().get(path).environ
+        response = handler(environ, lambda status, headers, exc_info=None: None)
+        content = b''.join(response)
+        response.close()
+        return content
+
+    def poll():
+        """Hold one poller for the wait, checking every interval."""
+        held.enter()
+        try:
+            deadline = time.perf_counter() + options.wait
+            first = check()
+            while time.perf_counter() < deadline:
+                time.sleep(min(options.interval, deadline - time.perf_counter()))
+                if check() != first:
+                    break
+        finally:
+            held.leave()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options.threads) as pool:
+        for future in [pool.submit(poll) for _ in range(options.pollers)]:
+            future.result()
+    return {'wall_s': time.perf_counter() - start, 'peak_held': held.peak, 'checks': held.checks}
+# }}}
+
+# ASGI {{{
+def run_asgi(path, options):
+    """Hold every poller with the ASGI handler."""
+    from drawwrite.asgi import ASGIHandler
+
+    handler = ASGIHandler(threads=options.threads)
+    held = Held()
+    run_wsgi_once = handler.run_wsgi
+
+    def counted(environ):
+        """Serve one check, counting it."""
+        held.check()
+        return run_wsgi_once(environ)
+    handler.run_wsgi = counted
+
+    async def poll():
+        """Make one held request."""
+        messages = [{'type': 'http.request', 'body': b''}]
+
+        async def receive():
+            """Return the request."""
+            return messages.pop()
+
+        async def send(message): #pylint: disable=unused-argument
+            """Ignore the response."""
+
+        held.enter()
+        try:
+            await handler({
+                'type': 'http',
+                'method': 'GET',
+                'path': path,
+                'query_string': 'wait={0}'.format(options.wait).encode('ascii'),
+                'headers': [],
+            }, receive, send)
+        finally:
+            held.leave()
+
+    loop = asyncio.new_event_loop()
+    start = time.perf_counter()
+    try:
+        loop.run_until_complete(asyncio.gather(*[poll() for _ in range(options.pollers)], loop=loop))
+    finally:
+        loop.close()
+        handler.executor.shutdown()
+    return {'wall_s': time.perf_counter() - start, 'peak_held': held.peak, 'checks': held.checks}
+# }}}
+
+def run(options):
+    """Make a lobby that never starts, and hold pollers on it both ways."""
+    from django.test.utils import override_settings
+    from django.urls import reverse
+    from drawwrite import services
+
+    game = services.new_game('bench-asgi')
+    player = services.new_player(game, 'host', True)
+    path = reverse('drawwrite:checkGameStart', args=[player.pk])
+    with override_settings(DRAWWRITE_LONG_POLL_INTERVAL=options.interval,
+                           DRAWWRITE_LONG_POLL_SECONDS=options.wait, DEBUG=False):
+        wsgi = run_wsgi(path, options)
+        asgi = run_asgi(path, options)
+    return {
+        'config': {
+            'pollers': options.pollers,
+            'threads': options.threads,
+            'wait_s': options.wait,
+            'interval_s': options.interval,
+        },
+        'wsgi': wsgi,
+        'asgi': asgi,
+        'held_ratio': asgi['peak_held'] / wsgi['peak_held'],
+    }
+
+def main():
+    """Set up a test database, run the benchmark, print the report."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pollers', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--wait', type=float, default=2.0,
+                        help='seconds each poller asks to be held')
+    parser.add_argument('--interval', type=float, default=0.5,
+                        help='seconds between checks of a held poller')
+    options = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drawwritesite.settings")
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    # The threads need a real file to share, not an in-memory database.
+    db_dir = None
+    if connection.vendor == 'sqlite':
+        db_dir = tempfile.mkdtemp(prefix='drawwrite-asgi-db-')
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = os.path.join(
+            db_dir, 'asgi.sqlite3',
+        )
+
+    # Polls aren't interesting to log.
+    logging.disable(logging.CRITICAL)
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        report = run(options)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        if db_dir is not None:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
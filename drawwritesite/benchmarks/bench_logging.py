@@ -0,0 +1,78 @@
+"""
+Measure the per-request cost of debug logging when DEBUG is disabled.
+
+Compares the old ``LOG.debug(__('...', ...))`` pattern against
+drawwrite.kvlog, replaying the debug calls that ``play`` makes on its
+longest path. Run from drawwritesite/:
+
+    python -m benchmarks.bench_logging [--requests N] [--repeat R]
+
+Prints a JSON document with the best time per simulated request.
+"""
+
+import argparse
+import json
+import logging
+import timeit
+
+from drawwrite.bracefmt import BraceFormatter as __
+from drawwrite.kvlog import KeyValueLogger
+
+# The number of debug calls on the longest path through views.play.
+CALLS_PER_REQUEST = 10
+
+def brace_request(log, player_id, game_id):
+    """Replay play's debug calls using BraceFormatter."""
+    for _ in range(CALLS_PER_REQUEST // 2):
+        log.debug(__('successfully retreived player {0}', player_id))
+        log.debug(__('player {0} needs position {1}s chain', player_id, game_id))
+
+def kv_request(log, player_id, game_id):
+    """Replay play's debug calls using KeyValueLogger."""
+    for _ in range(CALLS_PER_REQUEST // 2):
+        log.debug('successfully retreived player', player_id=player_id)
+        log.debug('player needs chain', player_id=player_id, position=game_id)
+
+def baseline_request(log, player_id, game_id): #pylint: disable=unused-argument
+    """Do no logging at all, to measure the loop overhead."""
+    for _ in range(CALLS_PER_REQUEST // 2):
+        pass
+
+def best_per_request(func, log, requests, repeat):
+    """Return the best observed time for one simulated request, in ns."""
+    timer = timeit.Timer(lambda: func(log, 12, 3))
+    return min(timer.repeat(repeat=repeat, number=requests)) / requests * 1e9
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    std_log = logging.getLogger('bench.brace')
+    std_log.setLevel(logging.INFO)
+    kv_log = KeyValueLogger('bench.kv')
+    kv_log.logger.setLevel(logging.INFO)
+    sampled_log = KeyValueLogger('bench.kv.sampled', sample_rate=0.01)
+    sampled_log.logger.setLevel(logging.DEBUG)
+    sampled_log.logger.addHandler(logging.NullHandler())
+    sampled_log.logger.propagate = False
+
+    results = {
+        'calls_per_request': CALLS_PER_REQUEST,
+        'ns_per_request': {
+            'no_logging': best_per_request(
+                baseline_request, None, args.requests, args.repeat),
+            'brace_formatter_disabled': best_per_request(
+                brace_request, std_log, args.requests, args.repeat),
+            'kvlog_disabled': best_per_request(
+                kv_request, kv_log, args.requests, args.repeat),
+            'kvlog_enabled_sampled_1pct': best_per_request(
+                kv_request, sampled_log, args.requests, args.repeat),
+        },
+    }
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Simulate total game duration with and without pipelined rounds.
+
+Every player takes a random time for each link. Per-link times are
+lognormal around --median seconds with a spread of --sigma, and each
+player also has a lognormal speed factor with a spread of --player-sigma,
+so slow players are consistently slow. Drawing links take --draw-factor
+times as long as writing links.
+
+In a normal game every round ends when its slowest player finishes, so
+the game takes the sum of the round maxima. In a pipelined game, player p
+adds link r to chain p + r as soon as both p has finished round r - 1 and
+player p + 1 has added link r - 1 to that chain, which is the same
+rotation that views.play and views.create_link enforce. Run from
+drawwritesite/:
+
+    python -m benchmarks.bench_pipelined [--players 4 8 16] [--games 2000]
+
+Prints a JSON document with the mean, p50 and p95 game duration in
+seconds for both modes, per number of players.
+"""
+
+import argparse
+import json
+import random
+import statistics
+
+def link_times(players, options, rng):
+    """Return a players x rounds table of the seconds each link takes."""
+    times = []
+    for _ in range(players):
+        speed = rng.lognormvariate(0, options.player_sigma)
+        row = []
+        for link in range(players):
+            seconds = options.median * speed * rng.lognormvariate(0, options.sigma)
+            if link % 2 == 1:
+                seconds *= options.draw_factor
+            row.append(seconds)
+        times.append(row)
+    return times
+
+def barrier_duration(times):
+    """Return how long a game takes when every round waits for everyone."""
+    players = len(times)
+    return sum(max(times[player][link] for player in range(players)) for link in range(players))
+
+def pipelined_duration(times):
+    """Return how long a game takes when each chain moves on by itself."""
+    players = len(times)
+    # done[p] is when player p finished their latest link.
+    done = [0.0] * players
+    for link in range(players):
+        previous = list(done)
+        for player in range(players):
+            # Link r of chain p + r follows link r - 1, which player p + 1
+            # added to the same chain.
+            ready = previous[player]
+            if link > 0:
+                ready = max(ready, previous[(player + 1) % players])
+            done[player] = ready + times[player][link]
+    return max(done)
+
+def summarize(durations):
+    """Return the mean, p50 and p95 of a list of durations."""
+    durations = sorted(durations)
+    return {
+        'mean_s': statistics.mean(durations),
+        'p50_s': durations[len(durations) // 2],
+        'p95_s': durations[min(int(len(durations) * 0.95), len(durations) - 1)],
+    }
+
+def main():
+    """Run the simulation and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--median', type=float, default=30.0,
+                        help='median seconds to write a link')
+    parser.add_argument('--sigma', type=float, default=0.5,
+                        help='spread of one player\'s link times')
+    parser.add_argument('--player-sigma', type=float, default=0.4,
+                        help='spread of speeds between players')
+    parser.add_argument('--draw-factor', type=float, default=2.0,
+                        help='how much longer drawing takes than writing')
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args()
+
+    rng = random.Random(options.seed)
+    results = {'config': vars(options), 'players': {}}
+    for players in options.players:
+        barrier = []
+        pipelined = []
+        for _ in range(options.games):
+            times = link_times(players, options, rng)
+            barrier.append(barrier_duration(times))
+            pipelined.append(pipelined_duration(times))
+        barrier_summary = summarize(barrier)
+        pipelined_summary = summarize(pipelined)
+        results['players'][players] = {
+            'barrier': barrier_summary,
+            'pipelined': pipelined_summary,
+            'mean_speedup': barrier_summary['mean_s'] / pipelined_summary['mean_s'],
+        }
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Compare browsing a finished game chain by chain with the one-page results.
+
+Builds a finished game of --players players, then reads all of it two
+ways: the game page followed by every page of every chain page, the way
+the chain page's infinite scroll loads them, and the single results page
+(and its JSON document). Counts the requests, queries and bytes each way
+takes, and times them over --repeat runs. Run from drawwritesite/:
+
+    python -m benchmarks.bench_results --players 40
+
+The run uses a throwaway test database created from the configured
+settings. Prints a JSON document with, for each way, the requests,
+queries and bytes, and the median and fastest seconds.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import django
+
+# A 1x1 transparent PNG, used for every drawing.
+PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)
+
+# build_game {{{
+def build_game(name, num_players):
+    """Return a finished game of num_players players, played through services."""
+    from django.core.files.base import ContentFile
+    from drawwrite import services
+    from drawwrite.models import Chain
+
+    game = services.new_game(name)
+    players = [
+        services.new_player(game, 'player{0}'.format(num), num == 0)
+        for num in range(num_players)
+    ]
+    services.start_game(game)
+    for player in players:
+        services.new_chain(player)
+    for round_num in range(num_players):
+        for player in players:
+            player.refresh_from_db()
+            chain = Chain.objects.get( #pylint: disable=no-member
+                player__game=game,
+                player__position=(player.position + round_num) % num_players,
+            )
+            if round_num % 2 == 0:
+                services.new_write_link(chain, 'words from {0}'.format(player.name), player)
+            else:
+                drawing = ContentFile(PNG, name='{0}-{1}.png'.format(player.pk, round_num))
+                services.new_draw_link(chain, drawing, player)
+            services.player_finished(player)
+    game.refresh_from_db()
+    return game, players
+# }}}
+
+# The ways of reading {{{
+def chain_by_chain(client, game, players):
+    """Get the game page, then every page of every chain. Return the responses."""
+    from django.urls import reverse
+
+    responses = [client.get(reverse('drawwrite:showGame', args=[game.pk]))]
+    for player in players:
+        responses.append(client.get(reverse('drawwrite:showChain', args=[player.pk])))
+        page = 2
+        while True:
+            response = client.get('{0}?page={1}'.format(
+                reverse('drawwrite:showChainLinks', args=[player.pk]), page))
+            if response.status_code != 200:
+                break
+            responses.append(response)
+            if response.json()['next'] is None:
+                break
+            page += 1
+    return responses
+
+def one_page(client, game, players): #pylint: disable=unused-argument
+    """Get the results page. Return the responses."""
+    from django.urls import reverse
+
+    return [client.get(reverse('drawwrite:showResults', args=[game.pk]))]
+
+def one_document(client, game, players): #pylint: disable=unused-argument
+    """Get the results document. Return the responses."""
+    from django.urls import reverse
+
+    return [client.get(reverse('drawwrite:resultsDocument', args=[game.pk]))]
+
+WAYS = {
+    'chain_by_chain': chain_by_chain,
+    'one_page': one_page,
+    'one_document': one_document,
+}
+# }}}
+
+# run {{{
+def body(response):
+    """Return the whole body of a response, streamed or not."""
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+def run(options):
+    """Read the game every way, and return a report."""
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext, override_settings
+
+    report = {'config': {'players': options.players, 'repeat': options.repeat}}
+    media_root = tempfile.mkdtemp(prefix='drawwrite-results-media-')
+    try:
+        with override_settings(MEDIA_ROOT=media_root, DEBUG=False):
+            game, players = build_game('results', options.players)
+            client = Client()
+            for way, read in sorted(WAYS.items()):
+                times = []
+                for _ in range(options.repeat):
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        responses = read(client, game, players)
+                        received = sum(len(body(response)) for response in responses)
+                        times.append(time.perf_counter() - started)
+                report[way] = {
+                    'requests': len(responses),
+                    'queries': len(captured.captured_queries),
+                    'received': received,
+                    'seconds_median': statistics.median(times),
+                    'seconds_min': min(times),
+                }
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+    return report
+# }}}
+
+def main():
+    """Set up a test database, run the benchmark, print the report."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=5)
+    options = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drawwritesite.settings")
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    logging.disable(logging.CRITICAL)
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        report = run(options)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
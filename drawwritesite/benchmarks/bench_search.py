@@ -0,0 +1,126 @@
+"""
+Time searches of a large search index.
+
+Fills the index of a throwaway test database with --chains chains, each of
+--links write links of words drawn from a --vocabulary word vocabulary,
+with a few words far more common than the rest, the way real writing goes.
+The rows are written straight into the index, as archived games' chains
+would be, so no games are built. Then times searches for a common word, a
+rare word, two words and a word that is nowhere, on the first and last
+pages, over --repeat runs. Run from drawwritesite/:
+
+    python -m benchmarks.bench_search --chains 200000
+
+Prints a JSON document with the time it took to fill the index and, for
+each search, the results found and the median and fastest seconds.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import time
+
+import django
+
+# fill {{{
+def fill(options, rng):
+    """Write the chains into the index, and return the words by frequency."""
+    from django.db import connection, transaction
+    from drawwrite import search
+
+    words = ['word{0}'.format(num) for num in range(options.vocabulary)]
+    # Zipf-like weights, so word0 is the most common.
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    index = search.INDEXES[connection.vendor]
+    for start in range(0, options.chains, 10000):
+        with transaction.atomic(), connection.cursor() as cursor:
+            for chain_id in range(start + 1, min(start + 10000, options.chains) + 1):
+                text = '\n'.join(
+                    ' '.join(rng.choices(words, cum_weights=cum_weights, k=6)) for _ in range(options.links))
+                index.save(cursor, (chain_id, chain_id, 'game', chain_id, 'player', text))
+    return words
+# }}}
+
+# run {{{
+def run(options):
+    """Fill the index, run every search, and return a report."""
+    from django.test.utils import override_settings
+    from drawwrite import search
+
+    rng = random.Random(options.seed)
+    report = {
+        'config': {
+            'chains': options.chains,
+            'links': options.links,
+            'vocabulary': options.vocabulary,
+            'candidates': options.candidates,
+            'repeat': options.repeat,
+        },
+    }
+    started = time.perf_counter()
+    words = fill(options, rng)
+    report['fill_seconds'] = time.perf_counter() - started
+
+    queries = {
+        'common': words[0],
+        'rare': words[-1],
+        'two_words': '{0} {1}'.format(words[1], words[len(words) // 2]),
+        'missing': 'nowhere',
+    }
+    with override_settings(DRAWWRITE_SEARCH_MAX_PAGES=options.pages,
+                           DRAWWRITE_SEARCH_CANDIDATES=options.candidates):
+        for name, query in sorted(queries.items()):
+            for page in (1, options.pages):
+                times = []
+                for _ in range(options.repeat):
+                    started = time.perf_counter()
+                    results, _ = search.search(query, page)
+                    times.append(time.perf_counter() - started)
+                report['{0}_page{1}'.format(name, page)] = {
+                    'results': len(results),
+                    'seconds_median': statistics.median(times),
+                    'seconds_min': min(times),
+                }
+    return report
+# }}}
+
+def main():
+    """Set up a test database, run the benchmark, print the report."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chains', type=int, default=200000)
+    parser.add_argument('--links', type=int, default=4,
+                        help='write links in each chain')
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--pages', type=int, default=10,
+                        help='the last page to search')
+    parser.add_argument('--candidates', type=int, default=10000,
+                        help='DRAWWRITE_SEARCH_CANDIDATES')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drawwritesite.settings")
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    logging.disable(logging.CRITICAL)
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        report = run(options)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
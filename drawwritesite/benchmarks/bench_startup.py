@@ -0,0 +1,202 @@
+"""
+Measure how long a fresh worker takes to serve its first requests, with and
+without warming up at startup.
+
+Each trial starts a new Python process, the way a server starts a worker
+after a deploy. It loads the WSGI application, optionally runs
+drawwrite.warmup.warm_up, and then serves the index, getAvailableGames,
+play, showChain and showGame pages once each. The time-to-first-byte of
+each request is measured, that is the time until the handler returns its
+response. Run from drawwritesite/:
+
+    python -m benchmarks.bench_startup --trials 5
+
+The run uses a throwaway test database created from the configured
+settings, with DEBUG off so that templates are cached as in production.
+Prints a JSON document with, for cold and warmed workers, the median
+startup time and the median time-to-first-byte of each request in
+milliseconds.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import django
+
+# A 1x1 transparent PNG, used for every drawing.
+PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)
+
+# The database that the child processes use, set by the parent.
+DATABASE_NAME_VARIABLE = 'DRAWWRITE_BENCH_DATABASE_NAME'
+
+# child {{{
+def child(options):
+    """Start up as a fresh worker, serve the requests, print the timings."""
+    start = time.perf_counter()
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drawwritesite.settings")
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.environ[DATABASE_NAME_VARIABLE]
+    settings.MEDIA_ROOT = os.environ['DRAWWRITE_BENCH_MEDIA_ROOT']
+    settings.DEBUG = False
+    logging.disable(logging.CRITICAL)
+
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+    loaded = time.perf_counter()
+    warm_seconds = 0.0
+    if options.warm:
+        from drawwrite import warmup
+        warmup.warm_up()
+        warm_seconds = time.perf_counter() - loaded
+
+    from django.test.client import RequestFactory
+    from django.urls import reverse
+    paths = [
+        ('index', reverse('drawwrite:index')),
+        ('getAvailableGames', reverse('drawwrite:getAvailableGames')),
+        ('play', reverse('drawwrite:play', args=[options.player_id])),
+        ('showChain', reverse('drawwrite:showChain', args=[options.player_id])),
+        ('showGame', reverse('drawwrite:showGame', args=[options.game_id])),
+    ]
+    first_byte = {}
+    for name, path in paths:
+        environ = RequestFactory().get(path).environ
+        request_start = time.perf_counter()
+        response = application(environ, lambda status, headers, exc_info=None: None)
+        first_byte[name] = (time.perf_counter() - request_start) * 1000
+        b''.join(response)
+        response.close()
+    print(json.dumps({
+        'load_s': loaded - start,
+        'warm_up_s': warm_seconds,
+        'first_byte_ms': first_byte,
+    }))
+# }}}
+
+# parent {{{
+def run_trial(options, warm):
+    """Run one fresh worker, return its timings."""
+    command = [
+        sys.executable, '-m', 'benchmarks.bench_startup', '--child',
+        '--game-id', str(options.game_id), '--player-id', str(options.player_id),
+    ]
+    if warm:
+        command.append('--warm')
+    output = subprocess.check_output(command, env=options.child_environment)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+def summarize(trials):
+    """Return the medians of a list of trial timings."""
+    return {
+        'load_s': statistics.median(trial['load_s'] for trial in trials),
+        'warm_up_s': statistics.median(trial['warm_up_s'] for trial in trials),
+        'first_byte_ms': {
+            name: statistics.median(trial['first_byte_ms'][name] for trial in trials)
+            for name in trials[0]['first_byte_ms']
+        },
+        'first_request_ms': statistics.median(
+            trial['first_byte_ms']['index'] for trial in trials
+        ),
+    }
+
+def build_finished_game(size):
+    """Play a whole game of size players, and return it and its players."""
+    from django.core.files.base import ContentFile
+    from drawwrite import services
+    from drawwrite.models import Chain, Player
+
+    game = services.new_game('bench-startup')
+    players = [services.new_player(game, 'player{0}'.format(i), i == 0) for i in range(size)]
+    services.start_game(game)
+    for player in players:
+        services.new_chain(player)
+    for round_num in range(size):
+        for position in range(size):
+            player = Player.objects.select_related('game').get(pk=players[position].pk) #pylint: disable=no-member
+            chain = Chain.objects.get( #pylint: disable=no-member
+                player=players[(position + round_num) % size],
+            )
+            if chain.next_link_position % 2 == 0:
+                services.new_write_link(chain, 'a sentence', player)
+            else:
+                drawing = ContentFile(PNG, name='drawing-{0}.png'.format(position))
+                services.new_draw_link(chain, drawing, player)
+            services.player_finished(player)
+    return game, players
+
+def run(options):
+    """Make a finished game to show, then time cold and warm workers."""
+    game, players = build_finished_game(3)
+    options.game_id = game.pk
+    options.player_id = players[0].pk
+
+    results = {}
+    for warm in (False, True):
+        trials = [run_trial(options, warm) for _ in range(options.trials)]
+        results['warm' if warm else 'cold'] = summarize(trials)
+    results['config'] = {'trials': options.trials}
+    return results
+# }}}
+
+def main():
+    """Set up a test database, run the trials, print the report."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trials', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--warm', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--game-id', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--player-id', type=int, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+    if options.child:
+        child(options)
+        return
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drawwritesite.settings")
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    # The workers are separate processes, so they need a real file.
+    db_dir = None
+    if connection.vendor == 'sqlite':
+        db_dir = tempfile.mkdtemp(prefix='drawwrite-startup-db-')
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = os.path.join(
+            db_dir, 'startup.sqlite3',
+        )
+    logging.disable(logging.CRITICAL)
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    media_root = tempfile.mkdtemp(prefix='drawwrite-startup-media-')
+    try:
+        settings.MEDIA_ROOT = media_root
+        options.child_environment = dict(os.environ, **{
+            DATABASE_NAME_VARIABLE: settings.DATABASES['default']['NAME'],
+            'DRAWWRITE_BENCH_MEDIA_ROOT': media_root,
+        })
+        report = run(options)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(media_root, ignore_errors=True)
+        if db_dir is not None:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
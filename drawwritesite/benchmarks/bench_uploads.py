@@ -0,0 +1,237 @@
+"""
+Measure the bytes sent to submit a drawing over a lossy connection, with
+and without resumable uploads.
+
+Each trial submits one --size byte drawing through drawwrite.api, either
+as one multipart POST that is sent again whole after every failure, or as
+a chunked upload (see drawwrite.uploads) of --chunk-size byte chunks that
+carries on from the bytes received. Both submit with an Idempotency-Key.
+Each packet of a request body, and each response, is lost with probability
+--loss. A lost packet drops the request there, so the server never sees
+it; a lost response comes after the server handled the request. Run from
+drawwritesite/:
+
+    python -m benchmarks.bench_uploads --loss 0 0.001 0.01 --trials 20
+
+The run uses a throwaway test database created from the configured
+settings. Prints a JSON document with, for each loss rate and way of
+sending, the mean requests and bytes sent per drawing, and the bytes sent
+beyond the drawing's size.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import uuid
+
+import django
+
+# Bytes of request body per packet.
+PACKET_SIZE = 1460
+
+# Connection {{{
+class Lost(Exception):
+    """A request or its response was lost."""
+
+class Connection:
+    """A test client whose requests fail at random, counting bytes sent."""
+
+    def __init__(self, client, loss, rng):
+        """Initialize the object"""
+        self.client = client
+        self.loss = loss
+        self.rng = rng
+        self.requests = 0
+        self.sent = 0
+
+    def send(self, size, make_request):
+        """
+        Send a request with a size byte body by calling make_request, and
+        return its response, or raise Lost.
+        """
+        self.requests += 1
+        for packet in range(max(1, -(-size // PACKET_SIZE))):
+            if self.rng.random() < self.loss:
+                self.sent += packet * PACKET_SIZE
+                raise Lost()
+        self.sent += size
+        response = make_request()
+        if self.rng.random() < self.loss:
+            raise Lost()
+        return response
+# }}}
+
+# Ways of sending {{{
+def send_whole(connection, token, drawing):
+    """Post the whole drawing until a response arrives."""
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.urls import reverse
+
+    key = uuid.uuid4().hex
+    while True:
+        try:
+            return connection.send(len(drawing), lambda: connection.client.post(
+                reverse('drawwrite:apiCreateLink', args=[token]),
+                {'drawing': SimpleUploadedFile('drawing.png', drawing)},
+                HTTP_IDEMPOTENCY_KEY=key,
+            ))
+        except Lost:
+            continue
+
+def send_chunked(connection, token, drawing, chunk_size):
+    """Upload the drawing in chunks, resuming after failures, then submit it."""
+    from django.urls import reverse
+
+    client = connection.client
+    start = json.dumps({'size': len(drawing)})
+    while True:
+        try:
+            upload_id = connection.send(len(start), lambda: client.post(
+                reverse('drawwrite:apiStartUpload', args=[token]),
+                start,
+                content_type='application/json',
+            )).json()['upload']
+            break
+        except Lost:
+            continue
+
+    url = reverse('drawwrite:apiUpload', args=[token, upload_id])
+    received = 0
+    while received < len(drawing):
+        chunk = drawing[received:received + chunk_size]
+        try:
+            response = connection.send(len(chunk), lambda: client.put(
+                '{0}?offset={1}'.format(url, received),
+                chunk,
+                content_type='application/octet-stream',
+            ))
+            received = response.json()['received']
+        except Lost:
+            # Ask where to carry on from.
+            try:
+                received = connection.send(0, lambda: client.get(url)).json()['received']
+            except Lost:
+                continue
+
+    key = uuid.uuid4().hex
+    submit = json.dumps({'upload': upload_id})
+    while True:
+        try:
+            return connection.send(len(submit), lambda: client.post(
+                reverse('drawwrite:apiCreateLink', args=[token]),
+                submit,
+                content_type='application/json',
+                HTTP_IDEMPOTENCY_KEY=key,
+            ))
+        except Lost:
+            continue
+# }}}
+
+# run {{{
+def drawing_round(client, name):
+    """
+    Play a two player game through the API up to its drawing round, and
+    return the first player's token.
+    """
+    from django.urls import reverse
+
+    tokens = []
+    for url_name, player in (('apiCreateGame', 'ann'), ('apiJoinGame', 'bob')):
+        tokens.append(client.post(
+            reverse('drawwrite:' + url_name),
+            json.dumps({'game': name, 'player': player}),
+            content_type='application/json',
+        ).json()['token'])
+    client.post(reverse('drawwrite:apiStartGame', args=[tokens[0]]))
+    for token in tokens:
+        client.post(
+            reverse('drawwrite:apiCreateLink', args=[token]),
+            json.dumps({'text': 'words'}),
+            content_type='application/json',
+        )
+    return tokens[0]
+
+def run(options):
+    """Submit drawings every way at every loss rate, and return a report."""
+    from django.test import Client
+    from django.test.utils import override_settings
+
+    rng = random.Random(options.seed)
+    drawing = b'\x89PNG\r\n\x1a\n' + bytes(rng.getrandbits(8) for _ in range(options.size - 8))
+    report = {
+        'config': {
+            'size': options.size,
+            'chunk_size': options.chunk_size,
+            'trials': options.trials,
+        },
+        'loss': {},
+    }
+
+    media_root = tempfile.mkdtemp(prefix='drawwrite-uploads-media-')
+    try:
+        with override_settings(MEDIA_ROOT=media_root, DEBUG=False,
+                               DRAWWRITE_UPLOAD_CHUNK_BYTES=options.chunk_size):
+            for num, loss in enumerate(options.loss):
+                results = {}
+                for way in ('whole', 'chunked'):
+                    requests = sent = 0
+                    for trial in range(options.trials):
+                        client = Client()
+                        token = drawing_round(client, '{0}-{1}-{2}'.format(way, num, trial))
+                        connection = Connection(client, loss, rng)
+                        if way == 'whole':
+                            response = send_whole(connection, token, drawing)
+                        else:
+                            response = send_chunked(connection, token, drawing, options.chunk_size)
+                        if response.status_code != 201:
+                            raise RuntimeError('submission failed: {0}'.format(response.content))
+                        requests += connection.requests
+                        sent += connection.sent
+                    results[way] = {
+                        'requests': requests / options.trials,
+                        'sent': sent / options.trials,
+                        'wasted': sent / options.trials - options.size,
+                    }
+                report['loss'][str(loss)] = results
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+    return report
+# }}}
+
+def main():
+    """Set up a test database, run the benchmark, print the report."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=200 * 1024,
+                        help='bytes in each drawing')
+    parser.add_argument('--chunk-size', type=int, default=32 * 1024)
+    parser.add_argument('--loss', type=float, nargs='+', default=[0.0, 0.001, 0.01],
+                        help='chances of each packet being lost')
+    parser.add_argument('--trials', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drawwritesite.settings")
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    logging.disable(logging.CRITICAL)
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        report = run(options)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
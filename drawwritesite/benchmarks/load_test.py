@@ -0,0 +1,353 @@
+"""
+Load test DrawWrite by playing whole games with simulated players.
+
+Spawns --players simulated players split across --games games. Every
+player runs in its own thread with its own Django test client, and goes
+through create/join, waiting for the start, start_game (creator only),
+alternating write and draw create_link submissions with the polling in
+between, and finally show_game and show_chain. At most --concurrency
+requests are served at once, like a server with that many workers.
+
+The run uses a throwaway test database created from the configured
+settings. SQLite databases get a temporary file so that the threads can
+share it, and default to a concurrency of 1 because SQLite fails
+concurrent writers with "database is locked". Run from drawwritesite/:
+
+    python -m benchmarks.load_test --players 40 --games 8
+
+Prints a JSON document with overall throughput and, per endpoint, the
+request count, p50/p95/p99 latency in milliseconds and query counts.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from base64 import b64encode
+from urllib.parse import urlparse
+
+import django
+
+# A 1x1 transparent PNG, used for every drawing.
+PNG_DATA_URL = 'data:image/png;base64,' + b64encode(bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)).decode('ascii')
+
+# Stats {{{
+class Stats:
+    """Thread-safe collection of per-endpoint request measurements."""
+
+    def __init__(self):
+        """Initialize the object"""
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, seconds, queries, status):
+        """Record one request to endpoint."""
+        with self.lock:
+            entry = self.endpoints.setdefault(endpoint, {
+                'latencies': [],
+                'queries': [],
+                'errors': 0,
+            })
+            entry['latencies'].append(seconds)
+            entry['queries'].append(queries)
+            if status >= 400:
+                entry['errors'] += 1
+
+    def report(self):
+        """Return a dict summarizing every endpoint."""
+        report = {}
+        for endpoint, entry in sorted(self.endpoints.items()):
+            latencies = sorted(entry['latencies'])
+            queries = entry['queries']
+            report[endpoint] = {
+                'count': len(latencies),
+                'errors': entry['errors'],
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'mean_queries': sum(queries) / len(queries),
+                'max_queries': max(queries),
+                'total_queries': sum(queries),
+            }
+        return report
+
+def percentile(sorted_values, pct):
+    """Return the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+# }}}
+
+# GameCoordinator {{{
+class GameCoordinator: #pylint: disable=too-few-public-methods
+    """Synchronize the simulated players of one game through the lobby."""
+
+    def __init__(self, name, size):
+        """Initialize the object"""
+        self.name = name
+        self.created = threading.Event()
+        self.joined = threading.Barrier(size)
+# }}}
+
+# SimulatedPlayer {{{
+class SimulatedPlayer(threading.Thread):
+    """A thread that plays one player's part of a game."""
+
+    def __init__(self, stats, coordinator, name, is_creator, options, workers):
+        """Initialize the thread."""
+        super(SimulatedPlayer, self).__init__(name=name)
+        self.stats = stats
+        self.coordinator = coordinator
+        self.is_creator = is_creator
+        self.options = options
+        self.workers = workers
+        self.player_id = None
+        self.finished = False
+        self.error = None
+
+    def run(self):
+        """Play the game, recording any failure instead of raising."""
+        from django.db import connection
+        try:
+            self.play()
+            self.finished = True
+        except Exception as exception: #pylint: disable=broad-except
+            self.error = '{0}: {1}'.format(type(exception).__name__, exception)
+        finally:
+            connection.close()
+
+    def request(self, method, path, data=None):
+        """Make a request, record its latency and query count, return it."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import resolve
+
+        endpoint = resolve(urlparse(path).path).url_name
+        with self.workers, CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            try:
+                if method == 'POST':
+                    response = self.client.post(path, data)
+                else:
+                    response = self.client.get(path)
+            except Exception:
+                self.stats.record(endpoint, time.perf_counter() - start, len(queries), 500)
+                raise
+            elapsed = time.perf_counter() - start
+        self.stats.record(endpoint, elapsed, len(queries), response.status_code)
+        return response
+
+    def poll(self, path, done):
+        """Poll path until done(json) is true or the deadline passes."""
+        while time.time() < self.options.deadline:
+            if done(self.request('GET', path).json()):
+                return
+            time.sleep(self.options.poll_interval)
+        raise TimeoutError('gave up polling {0}'.format(path))
+
+    def play(self):
+        """Go through a whole game as this player."""
+        from django.test import Client
+        from django.urls import resolve, reverse
+
+        self.client = Client() #pylint: disable=attribute-defined-outside-init
+        game_name = self.coordinator.name
+
+        # Create or join the game.
+        if self.is_creator:
+            response = self.request('POST', reverse('drawwrite:createGame'), {
+                'username': self.name,
+                'gamename': game_name,
+            })
+            self.coordinator.created.set()
+        else:
+            self.coordinator.created.wait(self.options.timeout)
+            response = self.request('POST', reverse('drawwrite:joinGame'), {
+                'username': self.name,
+                'gamename': game_name,
+            })
+        match = resolve(urlparse(response.url).path)
+        if match.url_name != 'play':
+            raise RuntimeError('could not enter game {0}'.format(game_name))
+        self.player_id = match.kwargs['player_id']
+        play_url = reverse('drawwrite:play', args=[self.player_id])
+
+        # Wait in the lobby, then start the game.
+        self.request('GET', play_url)
+        self.coordinator.joined.wait(self.options.timeout)
+        if self.is_creator:
+            self.request('POST', reverse('drawwrite:startGame', args=[self.player_id]))
+        else:
+            self.poll(
+                reverse('drawwrite:checkGameStart', args=[self.player_id]),
+                lambda data: data['started'],
+            )
+
+        # Play rounds until play sends us to the finished game.
+        while time.time() < self.options.deadline:
+            response = self.request('GET', play_url)
+            if response.status_code == 302:
+                break
+            template = response.templates[0].name
+            if template == 'drawwrite/chainAdd.html':
+                time.sleep(self.options.think_time)
+                if response.context['prev_link_type'] == 'write':
+                    data = {'drawing': PNG_DATA_URL}
+                else:
+                    data = {'description': 'a sentence from {0}'.format(self.name)}
+                self.request(
+                    'POST',
+                    reverse('drawwrite:createLink', args=[self.player_id]),
+                    data,
+                )
+            elif template == 'drawwrite/roundWaiting.html':
+                self.poll(
+                    reverse('drawwrite:checkRoundDone', args=[self.player_id]),
+                    lambda data: data['finished'],
+                )
+            elif template == 'drawwrite/gameWaiting.html':
+                self.poll(
+                    reverse('drawwrite:checkGameDone', args=[response.context['game_id']]),
+                    lambda data: data['finished'],
+                )
+            else:
+                raise RuntimeError('unexpected page {0}'.format(template))
+        else:
+            raise TimeoutError('game did not finish')
+
+        # Look at the results.
+        self.request('GET', response.url)
+        self.request('GET', reverse('drawwrite:showChain', args=[self.player_id]))
+# }}}
+
+# run {{{
+def run(options):
+    """Play options.games games with options.players players, return a report."""
+    from django.test.utils import override_settings
+
+    stats = Stats()
+    per_game = [options.players // options.games] * options.games
+    for i in range(options.players % options.games):
+        per_game[i] += 1
+    if min(per_game) < 1:
+        raise SystemExit('every game needs at least one player')
+
+    threads = []
+    workers = threading.BoundedSemaphore(options.concurrency)
+    run_id = int(time.time())
+    for game_num, size in enumerate(per_game):
+        coordinator = GameCoordinator('load-{0}-{1}'.format(run_id, game_num), size)
+        for player_num in range(size):
+            threads.append(SimulatedPlayer(
+                stats,
+                coordinator,
+                'player-{0}-{1}'.format(game_num, player_num),
+                player_num == 0,
+                options,
+                workers,
+            ))
+
+    media_root = tempfile.mkdtemp(prefix='drawwrite-load-media-')
+    try:
+        with override_settings(MEDIA_ROOT=media_root, DEBUG=False):
+            start = time.perf_counter()
+            options.deadline = time.time() + options.timeout
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+    endpoints = stats.report()
+    total_requests = sum(entry['count'] for entry in endpoints.values())
+    return {
+        'config': {
+            'players': options.players,
+            'games': options.games,
+            'concurrency': options.concurrency,
+            'poll_interval_s': options.poll_interval,
+            'think_time_s': options.think_time,
+            'database_vendor': django.db.connection.vendor,
+        },
+        'wall_time_s': elapsed,
+        'total_requests': total_requests,
+        'throughput_rps': total_requests / elapsed if elapsed else 0.0,
+        'players_finished': sum(1 for thread in threads if thread.finished),
+        'player_errors': sorted(set(
+            thread.error for thread in threads if thread.error is not None
+        )),
+        'endpoints': endpoints,
+    }
+# }}}
+
+def main():
+    """Set up a test database, run the load test, print the report."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=20)
+    parser.add_argument('--games', type=int, default=4)
+    parser.add_argument('--concurrency', type=int,
+                        help='requests served at once (default: 1 on SQLite, else --players)')
+    parser.add_argument('--poll-interval', type=float, default=0.05,
+                        help='seconds between polls of the status endpoints')
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help='seconds a player spends on each link')
+    parser.add_argument('--timeout', type=float, default=300.0,
+                        help='give up on players still playing after this many seconds')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    options = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drawwritesite.settings")
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    # SQLite's shared in-memory test database can't take concurrent writers,
+    # so give the threads a real file to share.
+    db_dir = None
+    if connection.vendor == 'sqlite':
+        db_dir = tempfile.mkdtemp(prefix='drawwrite-load-db-')
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = os.path.join(
+            db_dir, 'load.sqlite3',
+        )
+        if options.concurrency is None:
+            options.concurrency = 1
+    if options.concurrency is None:
+        options.concurrency = options.players
+
+    # Failed requests are counted in the report, don't also log them.
+    logging.disable(logging.CRITICAL)
+
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        report = run(options)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        if db_dir is not None:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as out:
+            out.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,182 @@
 """Configure the drawwrite admin page."""
 
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Max
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html, format_html_join
 
 from .models import Chain, DrawLink, Game, Player, WriteLink
 
+# How many related rows to show on a change page before linking to the
+# paginated changelist instead.
+RELATED_PREVIEW_SIZE = 20
+
+# Unfiltered tables estimated to have fewer rows than this are counted
+# exactly.
+EXACT_COUNT_BELOW = 10000
+
+def estimate_row_count(queryset):
+    """
+    Return a cheap estimate of the number of rows in queryset's table.
+    PostgreSQL's planner statistics are used when available, otherwise the
+    largest primary key, which is never less than the real count.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table], #pylint: disable=protected-access
+            )
+            row = cursor.fetchone()
+        if row is not None and row[0] >= 0:
+            return row[0]
+    return queryset.order_by().aggregate(max_pk=Max('pk'))['max_pk'] or 0
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator that avoids COUNT(*) over whole, very large tables by
+    estimating the size of unfiltered changelists.
+    """
+
+    @cached_property
+    def count(self):
+        """Return the exact count when cheap, otherwise an estimate."""
+        if self.object_list.query.where:
+            return super(EstimatedCountPaginator, self).count
+        estimate = estimate_row_count(self.object_list)
+        if estimate < EXACT_COUNT_BELOW:
+            return super(EstimatedCountPaginator, self).count
+        return estimate
+
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    Shared settings for admins of tables that grow without bound.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = ('pk',)
+
+    # Maps the search box to exact matches on these indexed fields, so that
+    # searching never falls back to LIKE '%...%' over the whole table.
+    indexed_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        """Search the indexed fields for exact matches of search_term."""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        matches = queryset.none()
+        for field in self.indexed_search_fields:
+            matches |= queryset.filter(**{field: search_term})
+        if search_term.isdigit():
+            matches |= queryset.filter(pk=search_term)
+        return matches, False
+
+def related_preview(model, queryset, label, total, changelist_filter):
+    """
+    Return HTML linking to the first RELATED_PREVIEW_SIZE objects of
+    queryset, and to the changelist of all total of them.
+    """
+    # pylint: disable=protected-access
+    opts = model._meta
+    rows = format_html_join(
+        '',
+        '<li><a href="{0}">{1}</a></li>',
+        (
+            (reverse('admin:{0}_{1}_change'.format(opts.app_label, opts.model_name),
+                     args=[obj.pk]), label(obj))
+            for obj in queryset[:RELATED_PREVIEW_SIZE]
+        ),
+    )
+    changelist = reverse('admin:{0}_{1}_changelist'.format(opts.app_label, opts.model_name))
+    return format_html(
+        '<ul>{0}</ul><a href="{1}?{2}">All {3} {4}</a>',
+        rows,
+        changelist,
+        changelist_filter,
+        total,
+        opts.verbose_name_plural,
+    )
+
+# Games {{{
+class FinishedFilter(admin.SimpleListFilter):
+    """Filter games by whether every round has been played."""
+    title = 'finished'
+    parameter_name = 'finished'
+
+    def lookups(self, request, model_admin):
+        """Return the filter's options."""
+        return (('yes', 'Yes'), ('no', 'No'))
+
+    def queryset(self, request, queryset):
+        """Filter the games by the selected option."""
+        finished = {'started': True, 'round_num__gte': F('num_players')}
+        if self.value() == 'yes':
+            return queryset.filter(**finished)
+        if self.value() == 'no':
+            return queryset.exclude(**finished)
+        return queryset
+
+class GameAdmin(ScalableAdmin):
+    """Configure the top level Game view."""
+    list_display = (
+        'pk',
+        'name',
+        'started',
+        'num_players',
+        'round_num',
+        'time_created',
+    )
+    list_filter = ('started', FinishedFilter)
+    indexed_search_fields = ('name',)
+    readonly_fields = ('pk', 'players')
+
+    def players(self, game):
+        """Link to the game's players."""
+        return related_preview(
+            Player,
+            Player.objects.filter(game=game).order_by('position'), #pylint: disable=no-member
+            lambda player: '{0}. {1}'.format(player.position, player.name),
+            game.num_players,
+            'game__id__exact={0}'.format(game.pk),
+        )
+# }}}
+
+# Players {{{
+def get_game_name_from_player(player):
+    """Return the name of the game that player belongs to."""
+    return player.game.name
+get_game_name_from_player.short_description = 'Game Name'
+get_game_name_from_player.admin_order_field = 'game__name'
+
+class PlayerAdmin(ScalableAdmin):
+    """Configure the top level Player view."""
+    list_display = (
+        'pk',
+        'name',
+        get_game_name_from_player,
+        'position',
+        'current_round',
+        'was_creator',
+    )
+    list_select_related = ('game',)
+    indexed_search_fields = ('name', 'game__name')
+    raw_id_fields = ('game',)
+# }}}
+
+# Chains {{{
 def get_game_name_from_chain(chain):
     """Return the name of the game that chain belongs to."""
     return chain.player.game.name
 get_game_name_from_chain.short_description = 'Game Name'
+get_game_name_from_chain.admin_order_field = 'player__game__name'
 
-class DrawLinkInline(admin.StackedInline):
-    """Configure the inline DrawLinks."""
-    model = DrawLink
-    extra = 0
-
-class WriteLinkInline(admin.StackedInline):
-    """Configure the inline WriteLinks view."""
-    model = WriteLink
-    extra = 0
-
-class ChainAdmin(admin.ModelAdmin):
+class ChainAdmin(ScalableAdmin):
     """Configure the top level Chain view."""
-    inlines = [WriteLinkInline, DrawLinkInline]
     list_display = (
         'pk',
         get_game_name_from_chain,
@@ -29,23 +184,50 @@ class ChainAdmin(admin.ModelAdmin):
         'next_link_position',
         'time_created',
     )
-    readonly_fields = ('pk',)
+    list_select_related = ('player__game',)
+    indexed_search_fields = ('player__name', 'player__game__name')
+    raw_id_fields = ('player',)
+    readonly_fields = ('pk', 'write_links', 'draw_links')
 
-class PlayerAdmin(admin.ModelAdmin):
-    """Configure the top level Player view."""
-    readonly_fields = ('pk',)
+    def write_links(self, chain):
+        """Link to the chain's write links."""
+        return related_preview(
+            WriteLink,
+            WriteLink.objects.filter(chain=chain).order_by('link_position'), #pylint: disable=no-member
+            lambda link: '{0}. {1}'.format(link.link_position, link.text[:80]),
+            (chain.next_link_position + 1) // 2,
+            'chain__id__exact={0}'.format(chain.pk),
+        )
 
-class PlayerInline(admin.StackedInline):
-    """Configure the inline Player view."""
-    model = Player
-    extra = 0
-    readonly_fields = ('pk',)
+    def draw_links(self, chain):
+        """Link to the chain's draw links."""
+        return related_preview(
+            DrawLink,
+            DrawLink.objects.filter(chain=chain).order_by('link_position'), #pylint: disable=no-member
+            lambda link: '{0}. {1}'.format(link.link_position, link.drawing.name),
+            chain.next_link_position // 2,
+            'chain__id__exact={0}'.format(chain.pk),
+        )
+# }}}
 
-class GameAdmin(admin.ModelAdmin):
-    """Configure the top level Game view."""
-    inlines = [PlayerInline]
-    readonly_fields = ('pk',)
+# Links {{{
+class LinkAdmin(ScalableAdmin):
+    """Shared configuration of the WriteLink and DrawLink views."""
+    list_select_related = ('added_by', 'chain__player')
+    raw_id_fields = ('chain', 'added_by')
+    indexed_search_fields = ('added_by__name',)
+
+class WriteLinkAdmin(LinkAdmin):
+    """Configure the top level WriteLink view."""
+    list_display = ('pk', 'chain', 'link_position', 'added_by', 'text')
+
+class DrawLinkAdmin(LinkAdmin):
+    """Configure the top level DrawLink view."""
+    list_display = ('pk', 'chain', 'link_position', 'added_by', 'drawing')
+# }}}
 
 admin.site.register(Game, GameAdmin)
 admin.site.register(Player, PlayerAdmin)
 admin.site.register(Chain, ChainAdmin)
+admin.site.register(WriteLink, WriteLinkAdmin)
+admin.site.register(DrawLink, DrawLinkAdmin)
@@ -0,0 +1,128 @@
+"""Turn away clients that poll or submit too often, and shed load.
+
+Each drawwrite view may have a Limit in drawwrite.urls.ADMISSION, which
+allows each player, game or client IP address some number of requests
+per period. Requests over the limit are answered with a 429 before any
+database access, see middleware.AdmissionControl.
+
+When the mean time of the database queries made in the last
+DRAWWRITE_SHED_WINDOW_SECONDS rises above DRAWWRITE_SHED_DB_MS, the views
+whose limits are sheddable (the polling ones) are answered with a 503
+until it comes back down.
+
+Counts are kept in the process, so each worker allows the full limit.
+"""
+
+# Imports {{{
+import collections
+import math
+import threading
+import time
+
+from django.conf import settings
+# }}}
+
+# Limit {{{
+class Limit(collections.namedtuple('Limit', ['key', 'requests', 'seconds', 'sheddable'])):
+    """
+    Allow requests requests per seconds seconds to a view, counted
+    separately for each value of key: 'player' or 'game' for the view's
+    player_id or game_id argument, or 'ip' for the client's address.
+    Sheddable views are turned away while the database is slow.
+    """
+    __slots__ = ()
+
+    def __new__(cls, key, requests, seconds, sheddable=False):
+        return super(Limit, cls).__new__(cls, key, requests, seconds, sheddable)
+# }}}
+
+# RateLimiter {{{
+class RateLimiter:
+    """
+    Token buckets, one per key, that each hold up to a limit's number of
+    requests and refill at its rate. The least recently used buckets are
+    dropped past max_keys.
+    """
+
+    def __init__(self, max_keys=100000):
+        """Initialize the object"""
+        self.max_keys = max_keys
+        self.buckets = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def acquire(self, key, limit, now=None):
+        """
+        Take one request from key's bucket. Return 0 if it was allowed, or
+        else the whole seconds until it would be.
+        """
+        now = time.monotonic() if now is None else now
+        rate = limit.requests / limit.seconds
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (limit.requests, now))
+            tokens = min(limit.requests, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                wait = 0
+                tokens -= 1
+            else:
+                wait = max(1, int(math.ceil((1 - tokens) / rate)))
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait
+# }}}
+
+# LoadShedder {{{
+class LoadShedder:
+    """
+    Keep the database time and query count of recent requests, and say
+    whether the mean query time over the window is above the threshold.
+    """
+
+    def __init__(self, threshold_ms, window_seconds=10, min_queries=20):
+        """Initialize the object"""
+        self.threshold = threshold_ms / 1000.0
+        self.window = window_seconds
+        self.min_queries = min_queries
+        self.samples = collections.deque()
+        self.seconds = 0.0
+        self.queries = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds, queries, now=None):
+        """Add a request that spent seconds on queries queries."""
+        if not queries:
+            return
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.samples.append((now, seconds, queries))
+            self.seconds += seconds
+            self.queries += queries
+            self.expire(now)
+
+    def expire(self, now):
+        """Drop the samples that have left the window. Hold the lock."""
+        while self.samples and self.samples[0][0] < now - self.window:
+            _, seconds, queries = self.samples.popleft()
+            self.seconds -= seconds
+            self.queries -= queries
+
+    def overloaded(self, now=None):
+        """Return whether recent queries have been slower than the threshold."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.expire(now)
+            if self.queries < self.min_queries:
+                return False
+            return self.seconds / self.queries > self.threshold
+
+def get_shedder():
+    """Return a LoadShedder configured by the settings, or None if disabled."""
+    threshold = getattr(settings, 'DRAWWRITE_SHED_DB_MS', None)
+    if threshold is None:
+        return None
+    return LoadShedder(
+        threshold,
+        getattr(settings, 'DRAWWRITE_SHED_WINDOW_SECONDS', 10),
+        getattr(settings, 'DRAWWRITE_SHED_MIN_QUERIES', 20),
+    )
+# }}}
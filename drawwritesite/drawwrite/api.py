@@ -0,0 +1,512 @@
+"""A compact JSON API for playing DrawWrite without the pages.
+
+Every URL starts with api/v<API_VERSION>/. Games are created and joined by
+POSTing a JSON object (or form data) with 'game' and 'player' names, which
+returns a token for the new player. The token is signed, so it can't be
+guessed from a player id, and every other call about that player takes it
+in place of the id:
+
+    POST api/v1/games                      {"game": ..., "player": ...}
+    POST api/v1/games/join                 {"game": ..., "player": ...}
+    GET  api/v1/players/<token>/lobby
+    POST api/v1/players/<token>/start
+    GET  api/v1/players/<token>/task
+    POST api/v1/players/<token>/uploads    {"size": ...}
+    PUT  api/v1/players/<token>/uploads/<upload_id>?offset=<bytes received>
+    POST api/v1/players/<token>/links      {"text": ...}, {"upload": ...} or a 'drawing' PNG file
+    GET  api/v1/games/<game_id>/results?page=1
+
+Drawings may be sent in chunks that survive dropped connections, and link
+submissions may carry an Idempotency-Key header so that they can be
+retried safely, see drawwrite.uploads.
+
+Errors are {"error": <code>} with a 4xx status. Payloads leave out
+whitespace and anything a client already knows.
+"""
+
+# Imports {{{
+import functools
+import json
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+
+from .forms import CreateGameForm
+from .models import Chain, Game, Player
+from . import archive, kvlog, linklist, services, sharding, uploads, views
+# }}}
+
+LOG = kvlog.get_logger(__name__)
+
+API_VERSION = 1
+
+# Helpers {{{
+def respond(data, status=200):
+    """Return data as JSON without any whitespace."""
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+def error(code, status=400):
+    """Return an error response."""
+    return respond({'error': code}, status=status)
+
+def read_body(request):
+    """Return the fields of a JSON or form encoded request body."""
+    if request.content_type == 'application/json':
+        try:
+            body = json.loads(request.body.decode('utf-8'))
+        except ValueError:
+            return None
+        return body if isinstance(body, dict) else None
+    return request.POST
+
+def get_signer():
+    """Return the signer used for player tokens."""
+    return signing.Signer(salt='drawwrite.api.player')
+
+def make_token(player):
+    """Return the token that stands for player in API URLs."""
+    return get_signer().sign(str(player.pk))
+
+def read_token(token):
+    """Return the player id in token, or None if it wasn't signed by us."""
+    try:
+        return int(get_signer().unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
+
+def with_player(view):
+    """
+    Decorate an API view taking a token so that it is called on the
+    player's shard with the player, and their game, in place of the token.
+    """
+    @functools.wraps(view)
+    def wrapper(request, token, **kwargs):
+        """Check the token and load the player."""
+        player_id = read_token(token)
+        if player_id is None:
+            LOG.info('got bad api token')
+            return error('badToken', status=403)
+        with sharding.use_shard(sharding.shard_for_id(player_id)):
+            player = Player.objects.select_related('game').filter( #pylint: disable=no-member
+                pk=player_id,
+            ).first()
+            if player is None:
+                LOG.info('api player does not exist', player_id=player_id)
+                return error('noPlayer', status=404)
+            return view(request, player, **kwargs)
+    return wrapper
+
+def entered(player, status):
+    """Return the response for a player who has just entered a game."""
+    return respond({
+        'token': make_token(player),
+        'player': player.pk,
+        'game': player.game.pk,
+    }, status=status)
+
+def task(player):
+    """
+    Return what the player does next, as a dict whose 'state' is one of
+    those of views.next_move. Players adding a link get the 'type' of link
+    to add and the previous link, if any, as {"text": ...} or {"drawing":
+    url}.
+    """
+    move = views.next_move(player)
+    data = {'state': move['state']}
+    if move['state'] != 'add':
+        return data
+    prev_link = move['prev_link']
+    if prev_link is None:
+        data['type'] = 'write'
+    elif move['prev_link_type'] == 'write':
+        data['type'] = 'draw'
+        data['prev'] = {'text': prev_link.text}
+    else:
+        data['type'] = 'write'
+        data['prev'] = {'drawing': prev_link.drawing.url}
+    return data
+# }}}
+
+# create_game {{{
+@csrf_exempt
+@sharding.shard_by()
+def create_game(request):
+    """Create a game along with its creator, and return the creator's token."""
+    if request.method != 'POST':
+        return error('methodNotAllowed', status=405)
+    body = read_body(request)
+    if body is None:
+        return error('badBody')
+    form = CreateGameForm({
+        'gamename': body.get('game'),
+        'username': body.get('player'),
+        'pipelined': body.get('pipelined'),
+        'round_minutes': body.get('round_minutes'),
+    })
+    if not form.is_valid():
+        return error('badName')
+
+    sharding.set_shard(sharding.shard_for_name(form.cleaned_data['gamename']))
+    round_minutes = form.cleaned_data['round_minutes']
+    game = services.new_game(
+        form.cleaned_data['gamename'],
+        pipelined=form.cleaned_data['pipelined'],
+        round_seconds=round_minutes * 60 if round_minutes else None,
+    )
+    if game is None:
+        return error('gameExists', status=409)
+    try:
+        player = services.new_player(game, form.cleaned_data['username'], True)
+    except IntegrityError:
+        LOG.info('could not add api game creator', game_id=game.pk)
+        return error('nameTaken', status=409)
+    LOG.debug('created game through api', game_id=game.pk, player_id=player.pk)
+    return entered(player, status=201)
+# }}}
+
+# join_game {{{
+@csrf_exempt
+@sharding.shard_by()
+def join_game(request):
+    """Add a player to a game that hasn't started, and return their token."""
+    if request.method != 'POST':
+        return error('methodNotAllowed', status=405)
+    body = read_body(request)
+    if body is None:
+        return error('badBody')
+    form = CreateGameForm({'gamename': body.get('game'), 'username': body.get('player')})
+    if not form.is_valid():
+        return error('badName')
+
+    gamename = form.cleaned_data['gamename']
+    sharding.set_shard(sharding.shard_for_name(gamename))
+    game = Game.objects.filter(name=gamename, started=False).first() #pylint: disable=no-member
+    if game is None:
+        return error('noGame', status=404)
+    try:
+        player = services.new_player(game, form.cleaned_data['username'], False)
+    except services.GameNotFound:
+        return error('noGame', status=404)
+    except services.GameAlreadyStarted:
+        return error('gameStarted', status=409)
+    except IntegrityError:
+        return error('nameTaken', status=409)
+    LOG.debug('joined game through api', game_id=game.pk, player_id=player.pk)
+    return entered(player, status=201)
+# }}}
+
+# lobby {{{
+@with_player
+def lobby(request, player): #pylint: disable=unused-argument
+    """Return whether the game has started, and who is in it until then."""
+    if player.game.started:
+        return respond({'started': True})
+    names = Player.objects.filter( #pylint: disable=no-member
+        game=player.game,
+    ).order_by('position').values_list('name', flat=True)
+    return respond({
+        'started': False,
+        'creator': player.was_creator,
+        'players': list(names),
+    })
+# }}}
+
+# start_game {{{
+@csrf_exempt
+@with_player
+def start_game(request, player):
+    """Start the player's game, if they created it."""
+    if request.method != 'POST':
+        return error('methodNotAllowed', status=405)
+    if not player.was_creator:
+        return error('notCreator', status=403)
+    if not player.game.started:
+        services.start_game(player.game)
+    return respond(task(player))
+# }}}
+
+# current_task {{{
+@with_player
+def current_task(request, player): #pylint: disable=unused-argument
+    """Return what the player does next, see task."""
+    if not player.game.started:
+        return error('notStarted', status=409)
+    return respond(task(player))
+# }}}
+
+# uploads {{{
+@csrf_exempt
+@with_player
+def start_upload(request, player):
+    """
+    Start a resumable upload of a drawing of 'size' bytes, see
+    drawwrite.uploads, and return its id. Only players whose task is a
+    drawing may start one; everyone else finds out what to do instead.
+    """
+    if request.method != 'POST':
+        return error('methodNotAllowed', status=405)
+    if not player.game.started:
+        return error('notStarted', status=409)
+    round_num, chain = wanted_chain(player)
+    if chain is None or chain.next_link_position != round_num or round_num % 2 == 0:
+        LOG.info('api upload is not wanted', player_id=player.pk, round=round_num)
+        return respond(task(player), status=409)
+    body = read_body(request)
+    try:
+        size = int(body.get('size')) if body is not None else None
+    except (TypeError, ValueError):
+        size = None
+    if size is None or not 0 < size <= uploads.max_size():
+        return error('badSize')
+    upload = uploads.start(player, size)
+    return respond({'upload': upload.pk, 'received': 0, 'size': size}, status=201)
+
+@csrf_exempt
+@with_player
+def upload_chunk(request, player, upload_id):
+    """
+    Return how many bytes of an upload have been received. PUTs (or POSTs)
+    add the request body to the upload, if it starts at the 'offset' query
+    parameter and that is where the bytes received so far end, and get a
+    409 with the bytes received to carry on from otherwise.
+    """
+    if request.method == 'GET':
+        upload = uploads.get(player, upload_id)
+        if upload is None:
+            return error('noUpload', status=404)
+        return respond({'received': upload.received, 'size': upload.size})
+    if request.method not in ('PUT', 'POST'):
+        return error('methodNotAllowed', status=405)
+
+    try:
+        offset = int(request.GET['offset'])
+    except (KeyError, ValueError):
+        return error('badOffset')
+    data = request.body
+    if not data:
+        return error('noData')
+    if len(data) > uploads.max_chunk_size():
+        return error('chunkTooLarge', status=413)
+    received = offset + len(data)
+
+    upload = uploads.add_chunk(player, upload_id, offset, data)
+    if upload is None:
+        return error('noUpload', status=404)
+    status = 200 if upload.received == received else 409
+    return respond({'received': upload.received, 'size': upload.size}, status=status)
+# }}}
+
+# create_link {{{
+@csrf_exempt
+@with_player
+def create_link(request, player):
+    """
+    Add the player's next link and return what they do next, see add_link.
+
+    Requests with an Idempotency-Key header that added the link have their
+    response kept, and retries with the same key get it again, including
+    retries that were waiting on the chain's lock while it was added.
+    """
+    if request.method != 'POST':
+        return error('methodNotAllowed', status=405)
+
+    key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+    if key is not None:
+        if not key or len(key) > 64:
+            return error('badIdempotencyKey')
+        kept = uploads.remembered(player, key)
+        if kept is not None:
+            LOG.info('replaying api response', player_id=player.pk)
+            return replay(kept)
+
+    try:
+        with transaction.atomic(using=sharding.current_shard()):
+            response = add_link(request, player, key)
+            if (key is not None and response.status_code == 201
+                    and not response.has_header('Idempotent-Replayed')):
+                uploads.remember(player, key, response)
+    except IntegrityError:
+        # A retry with the same key may have raced the original.
+        kept = uploads.remembered(player, key) if key is not None else None
+        if kept is None:
+            raise
+        LOG.info('replaying api response after race', player_id=player.pk)
+        return replay(kept)
+    return response
+
+def replay(kept):
+    """Return a kept IdempotencyKey's response again."""
+    response = HttpResponse(kept.response, status=kept.status, content_type='application/json')
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+def wanted_chain(player, lock=False):
+    """
+    Return the player's round and the chain they add to in it, or None if
+    there is no such chain yet. Players of pipelined games add to chains at
+    their own pace. With lock, the chain's row is locked, so that only one
+    submission adds to it.
+    """
+    game = player.game
+    round_num = player.current_round if game.pipelined else game.round_num
+    if round_num >= game.num_players:
+        return round_num, None
+    chains = Chain.objects.filter( #pylint: disable=no-member
+        player__game=game,
+        player__position=(player.position + round_num) % game.num_players,
+    )
+    if lock:
+        chains = chains.select_for_update()
+    return round_num, chains.first()
+
+def add_link(request, player, key=None):
+    """
+    Add the player's next link, from the 'text' field, or the 'drawing' PNG
+    file or the complete 'upload' holding one, and return what they do
+    next. If a request with the same Idempotency-Key added the link while
+    this one waited for the chain, return that request's response instead.
+    """
+    game = player.game
+    if not game.started:
+        return error('notStarted', status=409)
+
+    round_num, chain = wanted_chain(player, lock=True)
+    if key is not None:
+        kept = uploads.remembered(player, key)
+        if kept is not None:
+            LOG.info('replaying api response after waiting', player_id=player.pk)
+            return replay(kept)
+
+    # Players start their own chain with their first link, even if they
+    # never asked for their task.
+    if chain is None and round_num == 0:
+        chain = services.new_chain(player)
+
+    # Links that are early, late or repeated don't count, but the client
+    # finds out what to do instead.
+    if chain is None or chain.next_link_position != round_num:
+        LOG.info('api link is not wanted', player_id=player.pk, round=round_num)
+        return respond(task(player), status=409)
+
+    body = read_body(request)
+    if chain.next_link_position % 2 == 0:
+        text = body.get('text') if body is not None else None
+        if not isinstance(text, str):
+            return error('noText')
+        services.new_write_link(chain, text, player)
+    else:
+        upload_id = body.get('upload') if body is not None else None
+        if upload_id is not None:
+            upload = uploads.get(player, upload_id) if str(upload_id).isdigit() else None
+            if upload is None:
+                return error('noUpload', status=404)
+            if upload.received < upload.size:
+                return respond({'error': 'uploadIncomplete', 'received': upload.received},
+                               status=409)
+            data = uploads.take(upload)
+        else:
+            drawing = request.FILES.get('drawing')
+            if drawing is None:
+                return error('noDrawing')
+            data = drawing.read()
+        if not data.startswith(services.PNG_SIGNATURE):
+            return error('notPng')
+        file_name = 'link-{0}-{1}.png'.format(player.pk, chain.next_link_position)
+        services.new_draw_link(chain, ContentFile(data, name=file_name), player)
+
+    services.player_finished(player, round_num)
+    return respond(task(player), status=201)
+# }}}
+
+# results {{{
+def page_of(request, count):
+    """
+    Return the page number asked for, the page size and the number of pages
+    for count items, or None if the page doesn't exist.
+    """
+    size = getattr(settings, 'DRAWWRITE_API_PAGE_SIZE', 10)
+    pages = max(1, (count + size - 1) // size)
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        return None
+    if not 1 <= page <= pages:
+        return None
+    return page, size, pages
+
+def link_data(entry, drawing_url):
+    """Return the compact form of a chain list entry."""
+    if entry['type'] == 'write':
+        return {'by': entry['name'], 'text': entry['text']}
+    return {'by': entry['name'], 'drawing': drawing_url(entry)}
+
+@sharding.shard_by('game_id')
+def results(request, game_id):
+    """
+    Return one page of a finished game's chains, in the order of their
+    owners, with each chain's links.
+    """
+    game = Game.objects.filter(pk=game_id).first() #pylint: disable=no-member
+    if game is None:
+        archived = archive.get_archived_game(game_id)
+        if archived is None:
+            return error('noGame', status=404)
+        return archived_results(request, archived)
+    if not game.started or game.round_num < game.num_players:
+        return error('notFinished', status=409)
+
+    paging = page_of(request, game.num_players)
+    if paging is None:
+        return error('noPage', status=404)
+    page, size, pages = paging
+    chains = Chain.objects.filter( #pylint: disable=no-member
+        player__game=game,
+    ).select_related('player').order_by('player__position')[(page - 1) * size:page * size]
+
+    chain_data = []
+    for chain in chains:
+        # The chain's own list has every link, unless it is behind.
+        entries = json.loads(chain.links)
+        if len(entries) != chain.next_link_position:
+            entries = [linklist.entry_for(link) for link in views.query_links(chain)]
+        chain_data.append({
+            'player': chain.player.name,
+            'links': [
+                link_data(entry, lambda entry: default_storage.url(entry['media']))
+                for entry in entries
+            ],
+        })
+    return respond({'name': game.name, 'page': page, 'pages': pages, 'chains': chain_data})
+
+def archived_results(request, archived):
+    """Return one page of an archived game's chains, like results."""
+    document = archive.load_document(archived)
+    players = [player for player in document['players'] if player['chain'] is not None]
+    paging = page_of(request, len(players))
+    if paging is None:
+        return error('noPage', status=404)
+    page, size, pages = paging
+    names = {player['id']: player['name'] for player in document['players']}
+
+    def drawing_url(entry):
+        """Return the URL of a drawing in the archive."""
+        return reverse('drawwrite:showArchivedDrawing',
+                       args=[archived.original_id, entry['member']])
+
+    chain_data = []
+    for player in players[(page - 1) * size:page * size]:
+        entries = [
+            dict(link, name=names.get(link['added_by'], '')) for link in player['chain']['links']
+        ]
+        chain_data.append({
+            'player': player['name'],
+            'links': [link_data(entry, drawing_url) for entry in entries],
+        })
+    return respond({'name': archived.name, 'page': page, 'pages': pages, 'chains': chain_data})
+# }}}
@@ -0,0 +1,314 @@
+"""Compact finished games into cold storage, and read them back."""
+
+# Imports {{{
+import json
+import tempfile
+import zipfile
+
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    ArchivedGame, ArchivedPlayer, Chain, DrawLink, Game, GameEvent, IdempotencyKey, Player, Upload,
+    UploadChunk, WriteLink,
+)
+from . import kvlog, sharding, taskqueue
+# }}}
+
+LOG = kvlog.get_logger(__name__)
+
+# Bump this when the layout of ArchivedGame.document changes.
+DOCUMENT_VERSION = 1
+
+# Drawings larger than this are spooled to disk while being packed.
+SPOOL_SIZE = 10 * 1024 * 1024
+
+# finished_games {{{
+def finished_games(older_than_days):
+    """
+    Return a queryset of finished games created more than older_than_days
+    days ago, oldest first.
+    """
+    return Game.objects.filter( #pylint: disable=no-member
+        started=True,
+        round_num__gte=F('num_players'),
+        time_created__lt=timezone.now() - timedelta(days=older_than_days),
+    ).order_by('time_created')
+# }}}
+
+# delete_in_batches {{{
+def delete_in_batches(queryset, batch_size):
+    """Delete every row of queryset, batch_size rows per statement."""
+    deleted = 0
+    while True:
+        batch = list(queryset.order_by().values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        queryset.model.objects.filter(pk__in=batch).delete()
+        deleted += len(batch)
+# }}}
+
+# build_document {{{
+def build_document(game):
+    """
+    Return the archive document for game, and a list of (member name,
+    drawing file name) pairs for the drawings to pack.
+    """
+    players = list(Player.objects.filter(game=game).order_by('position')) #pylint: disable=no-member
+    chains = {
+        chain.player_id: chain
+        for chain in Chain.objects.filter(player__game=game) #pylint: disable=no-member
+    }
+    links = {}
+    for link in WriteLink.objects.filter(chain__player__game=game): #pylint: disable=no-member
+        links.setdefault(link.chain_id, []).append(link)
+    for link in DrawLink.objects.filter(chain__player__game=game): #pylint: disable=no-member
+        links.setdefault(link.chain_id, []).append(link)
+
+    drawings = []
+    player_documents = []
+    for player in players:
+        chain = chains.get(player.pk)
+        chain_document = None
+        if chain is not None:
+            link_documents = []
+            for link in sorted(links.get(chain.pk, []), key=lambda link: link.link_position):
+                link_document = {
+                    'position': link.link_position,
+                    'added_by': link.added_by_id,
+                }
+                if isinstance(link, WriteLink):
+                    link_document['type'] = 'write'
+                    link_document['text'] = link.text
+                else:
+                    member = '{0}-{1}.png'.format(player.position, link.link_position)
+                    link_document['type'] = 'draw'
+                    link_document['member'] = member
+                    if link.width is not None:
+                        link_document['width'] = link.width
+                        link_document['height'] = link.height
+                    drawings.append((member, link.drawing.name))
+                link_documents.append(link_document)
+            chain_document = {
+                'id': chain.pk,
+                'time_created': chain.time_created.isoformat(),
+                'links': link_documents,
+            }
+        player_documents.append({
+            'id': player.pk,
+            'name': player.name,
+            'position': player.position,
+            'was_creator': player.was_creator,
+            'chain': chain_document,
+        })
+
+    document = {
+        'version': DOCUMENT_VERSION,
+        'game': {
+            'id': game.pk,
+            'name': game.name,
+            'time_created': game.time_created.isoformat(),
+            'num_players': game.num_players,
+            'round_num': game.round_num,
+        },
+        'players': player_documents,
+    }
+    return document, drawings
+# }}}
+
+# pack_drawings {{{
+def pack_drawings(game, drawings):
+    """
+    Pack the drawing files into a single zip file in storage, and return its
+    name. Drawings that are missing from storage are left out.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as packed:
+        # PNGs are already compressed, so store them as they are.
+        with zipfile.ZipFile(packed, 'w', zipfile.ZIP_STORED) as archive:
+            for member, file_name in drawings:
+                try:
+                    with default_storage.open(file_name, 'rb') as drawing:
+                        archive.writestr(member, drawing.read())
+                except (IOError, OSError):
+                    LOG.error('drawing missing while archiving', game_id=game.pk,
+                              file_name=file_name)
+        packed.seek(0)
+        return default_storage.save('archives/game-{0}.zip'.format(game.pk), File(packed))
+# }}}
+
+# archive_game {{{
+def archive_game(game, batch_size=500):
+    """
+    Compact game into an ArchivedGame and delete its rows and drawing files.
+    Return the new ArchivedGame.
+    """
+    LOG.info('archiving game', game_id=game.pk)
+    document, drawings = build_document(game)
+    media_name = pack_drawings(game, drawings)
+
+    try:
+        with transaction.atomic(using=sharding.current_shard()):
+            archived = ArchivedGame.objects.create( #pylint: disable=no-member
+                original_id=game.pk,
+                name=game.name,
+                time_created=game.time_created,
+                document=json.dumps(document, separators=(',', ':')),
+                media=media_name,
+            )
+            ArchivedPlayer.objects.bulk_create([ #pylint: disable=no-member
+                ArchivedPlayer(original_id=player['id'], archive=archived)
+                for player in document['players']
+            ])
+
+            # Delete from the leaves up, so that no cascades are needed.
+            delete_in_batches(DrawLink.objects.filter(chain__player__game=game), batch_size) #pylint: disable=no-member
+            delete_in_batches(WriteLink.objects.filter(chain__player__game=game), batch_size) #pylint: disable=no-member
+            delete_in_batches(Chain.objects.filter(player__game=game), batch_size) #pylint: disable=no-member
+            delete_in_batches(UploadChunk.objects.filter(upload__player__game=game), batch_size) #pylint: disable=no-member
+            delete_in_batches(Upload.objects.filter(player__game=game), batch_size) #pylint: disable=no-member
+            delete_in_batches(IdempotencyKey.objects.filter(player__game=game), batch_size) #pylint: disable=no-member
+            delete_in_batches(Player.objects.filter(game=game), batch_size) #pylint: disable=no-member
+            delete_in_batches(GameEvent.objects.filter(game=game), batch_size) #pylint: disable=no-member
+            Game.objects.filter(pk=game.pk).delete() #pylint: disable=no-member
+
+            file_names = [file_name for _, file_name in drawings]
+            delete_files.enqueue(file_names=file_names)
+    except Exception:
+        default_storage.delete(media_name)
+        raise
+
+    LOG.info('archived game', game_id=game.pk, drawings=len(drawings))
+    return archived
+# }}}
+
+# delete_files {{{
+@taskqueue.task()
+def delete_files(file_names):
+    """Delete the given files from storage, ignoring ones that are gone."""
+    for file_name in file_names:
+        try:
+            default_storage.delete(file_name)
+        except (IOError, OSError):
+            LOG.error('could not delete file', file_name=file_name)
+# }}}
+
+# archive_finished_games {{{
+def archive_finished_games(older_than_days, limit=None, batch_size=500, dry_run=False):
+    """
+    Archive up to limit finished games on each shard created more than
+    older_than_days days ago. Return the ids of the games that were (or,
+    in a dry run, would have been) archived.
+    """
+    archived = []
+    for alias in sharding.get_shards():
+        with sharding.use_shard(alias):
+            games = finished_games(older_than_days)
+            if limit is not None:
+                games = games[:limit]
+            for game in list(games):
+                if not dry_run:
+                    archive_game(game, batch_size)
+                archived.append(game.pk)
+    return archived
+
+# }}}
+
+# Reading archives {{{
+def get_archived_game(game_id):
+    """Return the ArchivedGame for the original game_id, or None."""
+    return ArchivedGame.objects.filter(original_id=game_id).first() #pylint: disable=no-member
+
+def get_archived_game_for_player(player_id):
+    """Return the ArchivedGame that the original player_id was in, or None."""
+    archived_player = ArchivedPlayer.objects.select_related( #pylint: disable=no-member
+        'archive',
+    ).filter(original_id=player_id).first()
+    return archived_player.archive if archived_player is not None else None
+
+def load_document(archived):
+    """Return the parsed document of an ArchivedGame."""
+    return json.loads(archived.document)
+
+def archived_players(archived):
+    """
+    Return objects standing in for the archived game's players, with the
+    attributes that the game page uses.
+    """
+    document = load_document(archived)
+    game = SimpleNamespace(pk=document['game']['id'], name=document['game']['name'])
+    return [
+        SimpleNamespace(pk=player['id'], name=player['name'], position=player['position'],
+                        game=game)
+        for player in document['players']
+    ]
+
+def archived_links(document, player, names):
+    """
+    Return objects standing in for the links of an archived player's chain,
+    with the attributes that the chain page uses. names maps player ids to
+    names.
+    """
+    game_id = document['game']['id']
+    links = []
+    for link in player['chain']['links']:
+        added_by = SimpleNamespace(pk=link['added_by'], name=names.get(link['added_by'], ''))
+        if link['type'] == 'write':
+            links.append(SimpleNamespace(
+                link_position=link['position'], added_by=added_by,
+                text=link['text'], drawing=None,
+            ))
+        else:
+            url = reverse('drawwrite:showArchivedDrawing', args=[game_id, link['member']])
+            links.append(SimpleNamespace(
+                link_position=link['position'], added_by=added_by,
+                text='', drawing=SimpleNamespace(url=url, name=link['member']),
+                width=link.get('width'), height=link.get('height'),
+            ))
+    return links
+
+def archived_chain(archived, player_id):
+    """
+    Return (player, links) standing in for the archived chain of player_id,
+    with the attributes that the chain page uses, or None if there is no
+    such chain.
+    """
+    document = load_document(archived)
+    game = SimpleNamespace(pk=document['game']['id'], name=document['game']['name'])
+    names = {player['id']: player['name'] for player in document['players']}
+    for player in document['players']:
+        if player['id'] != int(player_id) or player['chain'] is None:
+            continue
+        links = archived_links(document, player, names)
+        return SimpleNamespace(pk=player['id'], name=player['name'], game=game), links
+    return None
+
+def archived_results(archived):
+    """
+    Return (player, links) pairs standing in for every archived player, in
+    order, and the links of their chain, from one read of the document.
+    """
+    document = load_document(archived)
+    game = SimpleNamespace(pk=document['game']['id'], name=document['game']['name'])
+    names = {player['id']: player['name'] for player in document['players']}
+    return [
+        (
+            SimpleNamespace(pk=player['id'], name=player['name'], position=player['position'],
+                            game=game),
+            archived_links(document, player, names) if player['chain'] is not None else [],
+        )
+        for player in document['players']
+    ]
+
+def read_archived_drawing(archived, member):
+    """Return the bytes of one drawing from an archive's packed file."""
+    with archived.media.storage.open(archived.media.name, 'rb') as packed:
+        with zipfile.ZipFile(packed) as archive:
+            return archive.read(member)
+# }}}
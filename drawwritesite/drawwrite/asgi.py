@@ -0,0 +1,150 @@
+"""Serve DrawWrite to ASGI servers.
+
+ASGIHandler is an ASGI 3 application. It serves every view through
+Django's ordinary WSGI handler, on a pool of DRAWWRITE_ASGI_THREADS
+threads, so sync views and middleware work as they do under WSGI. The
+status endpoints in drawwrite.asyncviews can hold a request open while
+they wait for a change, and they only use a thread while they check.
+"""
+
+# Imports {{{
+import asyncio
+import functools
+import io
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.urls import Resolver404, resolve
+
+from . import asyncviews
+# }}}
+
+# build_environ {{{
+def build_environ(scope, body):
+    """Return a WSGI environ for the HTTP request in an ASGI scope."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('127.0.0.1', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # WSGI strings hold the raw bytes, decoded as latin-1.
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': str(client[0]),
+        'SERVER_PROTOCOL': 'HTTP/{0}'.format(scope.get('http_version', '1.1')),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    return environ
+# }}}
+
+# ASGIHandler {{{
+class ASGIHandler:
+    """An ASGI 3 application serving DrawWrite."""
+
+    def __init__(self, threads=None):
+        """Initialize the object"""
+        self.wsgi = WSGIHandler()
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads or getattr(settings, 'DRAWWRITE_ASGI_THREADS', 8),
+        )
+
+    async def __call__(self, scope, receive, send):
+        """Serve one ASGI connection."""
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError('DrawWrite only serves HTTP, not {0}'.format(scope['type']))
+
+        body = await self.read_body(receive)
+        call_view = functools.partial(self.run_in_thread, scope, body)
+        async_view = asyncviews.ASYNC_VIEWS.get(self.view_name(scope['path']))
+        if async_view is not None:
+            query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+            status, headers, content = await async_view(call_view, query)
+        else:
+            status, headers, content = await call_view()
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (name.encode('latin-1'), value.encode('latin-1')) for name, value in headers
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+    @staticmethod
+    async def read_body(receive):
+        """Return the whole body of the request."""
+        body = b''
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return body
+            body += message.get('body', b'')
+            if not message.get('more_body', False):
+                return body
+
+    @staticmethod
+    def view_name(path):
+        """Return the namespaced URL name of path, or None."""
+        try:
+            return resolve(path).view_name
+        except Resolver404:
+            return None
+
+    async def run_in_thread(self, scope, body):
+        """Serve the request with the WSGI handler on the thread pool."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self.run_wsgi, build_environ(scope, body))
+
+    def run_wsgi(self, environ):
+        """Return the status, headers and body of serving environ."""
+        started = []
+
+        def start_response(status, headers, exc_info=None): #pylint: disable=unused-argument
+            """Remember the status and headers."""
+            started[:] = [status, headers]
+
+        response = self.wsgi(environ, start_response)
+        try:
+            content = b''.join(response)
+        finally:
+            # This sends request_finished, which closes the thread's stale
+            # database connections.
+            if hasattr(response, 'close'):
+                response.close()
+        return int(started[0].split(' ', 1)[0]), started[1], content
+
+    async def lifespan(self, receive, send):
+        """Answer the server's startup and shutdown messages."""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+# }}}
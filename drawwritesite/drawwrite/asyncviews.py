@@ -0,0 +1,78 @@
+"""Long-polling versions of the status endpoints, for the ASGI handler.
+
+Each takes the parsed query string and an async callable that runs the
+endpoint's ordinary view once, through the full middleware stack, on the
+handler's thread pool. When the client passes ?wait=<seconds>, the
+response is held open until it would change, or the wait runs out, and
+between checks the request is only an awaited sleep, not a thread.
+"""
+
+# Imports {{{
+import asyncio
+import json
+
+from django.conf import settings
+# }}}
+
+# long_poll {{{
+def long_poll_seconds():
+    """Return the longest wait a client may ask for, in seconds."""
+    return getattr(settings, 'DRAWWRITE_LONG_POLL_SECONDS', 25)
+
+def long_poll_interval():
+    """Return the seconds between checks of a held request."""
+    return getattr(settings, 'DRAWWRITE_LONG_POLL_INTERVAL', 1.0)
+
+def requested_wait(query):
+    """Return the seconds that the client asked to wait, within limits."""
+    try:
+        wait = float(query.get('wait', ['0'])[0])
+    except ValueError:
+        return 0.0
+    return max(0.0, min(wait, long_poll_seconds()))
+
+async def long_poll(call_view, query, is_final):
+    """
+    Run the view, then run it again every interval until it fails, its
+    response becomes final according to is_final(data), its response
+    changes, or the requested wait runs out. Return the last response.
+    """
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + requested_wait(query)
+    status, headers, content = first = await call_view()
+    while status == 200 and not is_final(json.loads(content.decode('utf-8'))):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(long_poll_interval(), remaining))
+        status, headers, content = await call_view()
+        if content != first[2]:
+            break
+    return status, headers, content
+# }}}
+
+# The endpoints {{{
+async def check_game_start(call_view, query):
+    """Wait for the game to start, or for someone to join it."""
+    return await long_poll(call_view, query, lambda data: data['started'])
+
+async def check_round_done(call_view, query):
+    """Wait for the round to end, or for someone to finish it."""
+    return await long_poll(call_view, query, lambda data: data['finished'])
+
+async def check_game_done(call_view, query):
+    """Wait for the game to end, or for someone to finish it."""
+    return await long_poll(call_view, query, lambda data: data['finished'])
+
+async def get_available_games(call_view, query):
+    """Wait for the list of games that may be joined to change."""
+    return await long_poll(call_view, query, lambda data: False)
+# }}}
+
+# The endpoints above, by URL name.
+ASYNC_VIEWS = {
+    'drawwrite:checkGameStart': check_game_start,
+    'drawwrite:checkRoundDone': check_round_done,
+    'drawwrite:checkGameDone': check_game_done,
+    'drawwrite:getAvailableGames': get_available_games,
+}
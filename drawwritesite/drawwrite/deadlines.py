@@ -0,0 +1,108 @@
+"""Fill in the links of players who run out of time in a round."""
+
+# Imports {{{
+from base64 import b64decode
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Chain, Game, Player
+from . import kvlog, services, sharding
+# }}}
+
+LOG = kvlog.get_logger(__name__)
+
+# What a player who ran out of time writes.
+PLACEHOLDER_TEXT = '(ran out of time)'
+
+# What a player who ran out of time draws: a blank 1x1 PNG.
+PLACEHOLDER_DRAWING = b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNgAAIAAAUAAeImBZsAAAAASUVORK5CYII='
+)
+
+# overdue_games {{{
+def overdue_games(now, limit):
+    """
+    Return the ids of up to limit games on the current shard whose round
+    deadline has passed, most overdue first. This is a single query on the
+    round_deadline index, however many games are running.
+    """
+    return list(Game.objects.filter( #pylint: disable=no-member
+        round_deadline__lte=now,
+    ).order_by('round_deadline').values_list('pk', flat=True)[:limit])
+# }}}
+
+# fill_in_player {{{
+def fill_in_player(player):
+    """Add a placeholder for the link that player owes, and finish their round."""
+    game = player.game
+    round_num = player.current_round if game.pipelined else game.round_num
+    position = (player.position + round_num) % game.num_players
+    chain = Chain.objects.filter( #pylint: disable=no-member
+        player__game=game,
+        player__position=position,
+    ).first()
+    if chain is None:
+        # Chains are started by their owners on their first visit to play.
+        chain = services.new_chain(Player.objects.get(game=game, position=position)) #pylint: disable=no-member
+
+    if chain.next_link_position % 2 == 0:
+        services.new_write_link(chain, PLACEHOLDER_TEXT, player)
+    else:
+        file_name = 'placeholder-{0}-{1}.png'.format(player.pk, chain.next_link_position)
+        services.new_draw_link(chain, ContentFile(PLACEHOLDER_DRAWING, name=file_name), player)
+    services.player_finished(player)
+# }}}
+
+# advance_game {{{
+def advance_game(game_id, now):
+    """
+    Fill in the links of everyone still on the overdue round of game_id,
+    which moves the game on to its next round. Return the number of links
+    filled in, or None if the game was no longer overdue once locked.
+    """
+    with transaction.atomic(using=sharding.current_shard()):
+        # Players may have finished the round since the game was picked.
+        game = Game.objects.select_for_update().filter( #pylint: disable=no-member
+            pk=game_id,
+            round_deadline__lte=now,
+        ).first()
+        if game is None:
+            return None
+        stragglers = list(Player.objects.filter( #pylint: disable=no-member
+            game=game,
+            current_round=game.round_num,
+        ).order_by('position'))
+        for player in stragglers:
+            player.game = game
+            fill_in_player(player)
+
+        # A round that was somehow already complete still needs to end.
+        if not stragglers:
+            game.round_deadline = None
+            game.save()
+    LOG.info('advanced overdue round', game_id=game_id, filled_in=len(stragglers))
+    return len(stragglers)
+# }}}
+
+# tick {{{
+def tick(now=None, limit=500):
+    """
+    Advance up to limit overdue games on each shard. Return a dict with the
+    number of games advanced, links filled in, and games skipped because
+    they finished the round in the meantime.
+    """
+    now = now or timezone.now()
+    metrics = {'games': 0, 'links': 0, 'skipped': 0}
+    for alias in sharding.get_shards():
+        with sharding.use_shard(alias):
+            for game_id in overdue_games(now, limit):
+                filled_in = advance_game(game_id, now)
+                if filled_in is None:
+                    metrics['skipped'] += 1
+                else:
+                    metrics['games'] += 1
+                    metrics['links'] += filled_in
+    return metrics
+# }}}
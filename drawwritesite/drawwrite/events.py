@@ -0,0 +1,136 @@
+"""Record every change to a game in an append-only log, and read it back.
+
+Each service in drawwrite.services records an event in the transaction that
+makes its change. Events are recorded while the game's row is locked, so a
+game's events commit in the order of their ids, and a client that has seen
+every event up to some id can ask for just the ones after it.
+
+The log is complete for games created since it was added, and for those
+the game's counters can be rebuilt from it, see rebuild_counters.
+"""
+
+# Imports {{{
+import json
+
+from .models import Chain, Game, GameEvent, Player
+from . import kvlog, sharding
+# }}}
+
+LOG = kvlog.get_logger(__name__)
+
+# The most events that one page of a game's feed holds.
+PAGE_SIZE = 100
+
+# record {{{
+def record(game_id, kind, **data):
+    """
+    Add an event of kind to game_id's log. The game's row must already be
+    locked or written in the current transaction.
+    """
+    GameEvent.objects.create( #pylint: disable=no-member
+        game_id=game_id,
+        kind=kind,
+        data=json.dumps(data, separators=(',', ':'), sort_keys=True),
+    )
+# }}}
+
+# events_after {{{
+def events_after(game_id, cursor, limit=None):
+    """
+    Return up to limit (by default PAGE_SIZE) of game_id's events with ids
+    after cursor, oldest first, as dicts, and whether there are more.
+    """
+    limit = limit or PAGE_SIZE
+    rows = list(GameEvent.objects.filter( #pylint: disable=no-member
+        game_id=game_id,
+        pk__gt=cursor,
+    ).order_by('pk').values_list('pk', 'kind', 'data', 'time_created')[:limit + 1])
+    events = [
+        {'id': pk, 'kind': kind, 'time': time_created.isoformat(), 'data': json.loads(data)}
+        for pk, kind, data, time_created in rows[:limit]
+    ]
+    return events, len(rows) > limit
+# }}}
+
+# rebuild_counters {{{
+def expected_counters(game_id):
+    """
+    Return what game_id's counters should be according to its log, as
+    (game fields, {player id: current_round}, {chain id: next_link_position}),
+    or None if the log doesn't go back to the game's creation.
+    """
+    logged = GameEvent.objects.filter(game_id=game_id) #pylint: disable=no-member
+    if not logged.filter(kind=GameEvent.CREATED).exists():
+        return None
+
+    game = {'started': False, 'num_players': 0, 'round_num': 0}
+    player_rounds = {}
+    chain_positions = {}
+    events = logged.exclude(kind=GameEvent.CREATED).order_by('pk').values_list('kind', 'data')
+    for kind, data in events:
+        data = json.loads(data)
+        if kind == GameEvent.JOINED:
+            game['num_players'] += 1
+            player_rounds.setdefault(data['player_id'], 0)
+        elif kind == GameEvent.STARTED:
+            game['started'] = True
+        elif kind == GameEvent.ROUND_ADVANCED:
+            game['round_num'] = data['round']
+        elif kind == GameEvent.LINK_ADDED:
+            # Every round each player adds one link, and then moves on.
+            player_rounds[data['added_by']] = player_rounds.get(data['added_by'], 0) + 1
+            chain_positions[data['chain_id']] = data['position'] + 1
+    game['num_finished_current_round'] = sum(
+        1 for current_round in player_rounds.values() if current_round > game['round_num']
+    )
+    return game, player_rounds, chain_positions
+
+@sharding.atomic
+def rebuild_counters(game_id, dry_run=False):
+    """
+    Set game_id's counters, and those of its players and chains, to what its
+    log says they should be. Return a list of (object, field, old value,
+    new value) tuples for the counters that had drifted, or None if the
+    game has no complete log.
+    """
+    game = Game.objects.select_for_update().filter(pk=game_id).first() #pylint: disable=no-member
+    if game is None:
+        return None
+    expected = expected_counters(game_id)
+    if expected is None:
+        return None
+    game_fields, player_rounds, chain_positions = expected
+
+    repairs = []
+    for field, value in sorted(game_fields.items()):
+        if getattr(game, field) != value:
+            repairs.append(('game {0}'.format(game.pk), field, getattr(game, field), value))
+            setattr(game, field, value)
+    players = Player.objects.filter(game=game).values_list('pk', 'current_round') #pylint: disable=no-member
+    for player_id, current_round in players:
+        value = player_rounds.get(player_id, 0)
+        if current_round != value:
+            repairs.append(('player {0}'.format(player_id), 'current_round', current_round, value))
+            if not dry_run:
+                Player.objects.filter(pk=player_id).update(current_round=value) #pylint: disable=no-member
+    chains = Chain.objects.filter(player__game=game).values_list('pk', 'next_link_position') #pylint: disable=no-member
+    for chain_id, next_link_position in chains:
+        value = chain_positions.get(chain_id, 0)
+        if next_link_position != value:
+            repairs.append(('chain {0}'.format(chain_id), 'next_link_position',
+                            next_link_position, value))
+            if not dry_run:
+                Chain.objects.filter(pk=chain_id).update(next_link_position=value) #pylint: disable=no-member
+    if repairs and not dry_run:
+        game.save()
+    for name, field, old, new in repairs:
+        LOG.warning('counter drifted from the event log', object=name, field=field,
+                    old=old, new=new)
+    return repairs
+
+def logged_games():
+    """Return the ids of the games on the current shard with a complete log."""
+    return GameEvent.objects.filter( #pylint: disable=no-member
+        kind=GameEvent.CREATED,
+    ).order_by('game_id').values_list('game_id', flat=True)
+# }}}
@@ -5,7 +5,7 @@ import logging
 from django import forms
 from django.core.validators import validate_slug
 
-from drawwrite.models import Game
+from drawwrite import services
 
 LOG = logging.getLogger(__name__)
 
@@ -17,6 +17,9 @@ class CreateGameForm(forms.Form):
                                validators=[validate_slug])
     gamename = forms.CharField(label='Game Name', max_length=50,
                                validators=[validate_slug])
+    pipelined = forms.BooleanField(label='No waiting between rounds', required=False)
+    round_minutes = forms.IntegerField(label='Minutes per round', required=False,
+                                       min_value=1, max_value=60)
 
 
 class JoinGameForm(forms.Form):
@@ -42,11 +45,11 @@ class JoinGameForm(forms.Form):
 
 def get_available_games():
     """Get a list of games that are available to join."""
-    games = Game.objects.filter(started=False) #pylint: disable=no-member
-    if len(games) == 0:
+    names = services.available_games()
+    if len(names) == 0:
         options = [('', '- None -')]
     else:
         options = [('', '- Select -')]
-    for game in games:
-        options.append((game.name, game.name))
+    for name in names:
+        options.append((name, name))
     return options
@@ -0,0 +1,100 @@
+"""Structured, lazily-formatted logging for DrawWrite.
+
+Calls look like ``LOG.debug('got chain', player_id=player_id)``. When the
+level is disabled the call returns before any message object is built, and
+when it is enabled the record carries the event name and the key-value
+fields (as ``record.event`` and ``record.kv``) alongside a ``key=value``
+rendering for plain text handlers.
+
+Per-logger sampling is configured with the ``DRAWWRITE_LOG_SAMPLING``
+setting, a dict mapping logger names to the fraction of DEBUG and INFO
+records to keep. WARNING and above are never sampled.
+"""
+
+import logging
+import random
+import sys
+
+from django.conf import settings
+
+class KeyValueMessage: #pylint: disable=too-few-public-methods
+    """A log message rendered as 'event key=value ...' only when needed."""
+
+    __slots__ = ('event', 'fields')
+
+    def __init__(self, event, fields):
+        """Initialize the object"""
+        self.event = event
+        self.fields = fields
+
+    def __str__(self):
+        """Return the formatted message."""
+        if not self.fields:
+            return self.event
+        return '{0} {1}'.format(self.event, ' '.join(
+            '{0}={1}'.format(key, value) for key, value in sorted(self.fields.items())
+        ))
+
+class KeyValueLogger:
+    """Wrap a standard logger with lazy, key-value logging methods."""
+
+    def __init__(self, name, sample_rate=1.0):
+        """Wrap the standard logger called name."""
+        self.logger = logging.getLogger(name)
+        self.sample_rate = sample_rate
+
+    def debug(self, event, **fields):
+        """Log event at DEBUG, subject to sampling."""
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self._emit(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        """Log event at INFO, subject to sampling."""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self._emit(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        """Log event at WARNING."""
+        if self.logger.isEnabledFor(logging.WARNING):
+            self._emit(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        """Log event at ERROR."""
+        if self.logger.isEnabledFor(logging.ERROR):
+            self._emit(logging.ERROR, event, fields)
+
+    def exception(self, event, **fields):
+        """Log event at ERROR along with the exception being handled."""
+        if self.logger.isEnabledFor(logging.ERROR):
+            self._emit(logging.ERROR, event, fields, sys.exc_info())
+
+    def _emit(self, level, event, fields, exc_info=None):
+        """
+        Build and handle a record attributed to the caller of the public
+        logging method, so that funcName and lineno stay meaningful.
+        """
+        frame = sys._getframe(2) #pylint: disable=protected-access
+        code = frame.f_code
+        record = self.logger.makeRecord(
+            self.logger.name,
+            level,
+            code.co_filename,
+            frame.f_lineno,
+            KeyValueMessage(event, fields),
+            (),
+            exc_info,
+            code.co_name,
+            {'event': event, 'kv': fields},
+        )
+        self.logger.handle(record)
+
+def get_logger(name):
+    """Return a KeyValueLogger for name, using any configured sample rate."""
+    sampling = getattr(settings, 'DRAWWRITE_LOG_SAMPLING', {})
+    return KeyValueLogger(name, sampling.get(name, 1.0))
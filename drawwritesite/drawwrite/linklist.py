@@ -0,0 +1,140 @@
+"""Keep a copy of each chain's links, in order, on the chain's own row.
+
+Chain.links is a JSON list with one entry per link:
+
+    {"type": "write", "position": 0, "added_by": 7, "name": "ann", "text": "..."}
+    {"type": "draw", "position": 1, "added_by": 8, "name": "bob", "media": "link-8-1.png",
+     "width": 540, "height": 500}
+
+Drawings whose size isn't known have no "width" or "height".
+
+new_write_link and new_draw_link append to it in the transaction that adds
+the link, so the previous link, or the whole chain, is one row away. The
+WriteLink and DrawLink rows stay the source of truth, and check_chains
+compares the two.
+"""
+
+# Imports {{{
+import json
+
+from types import SimpleNamespace
+
+from django.core.files.storage import default_storage
+
+from .models import Chain, DrawLink, WriteLink
+from . import kvlog
+# }}}
+
+LOG = kvlog.get_logger(__name__)
+
+# Writing {{{
+def entry_for(link):
+    """Return the list entry for a WriteLink or DrawLink."""
+    entry = {
+        'position': link.link_position,
+        'added_by': link.added_by.pk,
+        'name': link.added_by.name,
+    }
+    if isinstance(link, WriteLink):
+        entry['type'] = 'write'
+        entry['text'] = link.text
+    else:
+        entry['type'] = 'draw'
+        entry['media'] = link.drawing.name
+        if link.width is not None:
+            entry['width'] = link.width
+            entry['height'] = link.height
+    return entry
+
+def append(chain, link):
+    """Add link to the end of chain's list, without saving the chain."""
+    entries = json.loads(chain.links)
+    entries.append(entry_for(link))
+    chain.links = json.dumps(entries, separators=(',', ':'))
+# }}}
+
+# Reading {{{
+def as_link(entry):
+    """
+    Return an object standing in for a list entry, with the attributes of a
+    link that the templates use.
+    """
+    added_by = SimpleNamespace(pk=entry['added_by'], name=entry['name'])
+    if entry['type'] == 'write':
+        return SimpleNamespace(link_position=entry['position'], added_by=added_by,
+                               text=entry['text'], drawing=None)
+    drawing = SimpleNamespace(name=entry['media'], url=default_storage.url(entry['media']))
+    return SimpleNamespace(link_position=entry['position'], added_by=added_by,
+                           text='', drawing=drawing, width=entry.get('width'),
+                           height=entry.get('height'))
+
+def load(chain):
+    """
+    Return the links of chain, in order, from its list, or None if the list
+    doesn't have every link yet.
+    """
+    entries = json.loads(chain.links)
+    if len(entries) != chain.next_link_position:
+        LOG.warning('chain link list is out of date', chain_id=chain.pk,
+                    entries=len(entries), next_link_position=chain.next_link_position)
+        return None
+    return [as_link(entry) for entry in entries]
+
+def previous_link(chain):
+    """
+    Return the last link of chain from its list, None if it has no links,
+    or False if the list doesn't have every link yet.
+    """
+    if chain.next_link_position == 0:
+        return None
+    entries = json.loads(chain.links)
+    if len(entries) != chain.next_link_position:
+        LOG.warning('chain link list is out of date', chain_id=chain.pk,
+                    entries=len(entries), next_link_position=chain.next_link_position)
+        return False
+    return as_link(entries[-1])
+# }}}
+
+# Checking {{{
+def expected_lists(chain_ids):
+    """
+    Return what the lists of the given chains should be according to their
+    link rows, as a dict of chain id to list of entries.
+    """
+    lists = {chain_id: [] for chain_id in chain_ids}
+    for model in (WriteLink, DrawLink):
+        for link in model.objects.filter( #pylint: disable=no-member
+                chain_id__in=chain_ids,
+        ).select_related('added_by'):
+            lists[link.chain_id].append(entry_for(link))
+    for entries in lists.values():
+        entries.sort(key=lambda entry: entry['position'])
+    return lists
+
+def check_chains(batch_size=500, repair=False):
+    """
+    Compare the list of every chain on the current shard with its link rows,
+    batch_size chains at a time, and rewrite the lists that differ if repair
+    is set. Return the ids of the chains whose lists differed.
+    """
+    inconsistent = []
+    last_id = 0
+    while True:
+        chains = list(Chain.objects.filter( #pylint: disable=no-member
+            pk__gt=last_id,
+        ).order_by('pk').values_list('pk', 'links')[:batch_size])
+        if not chains:
+            return inconsistent
+        expected = expected_lists([chain_id for chain_id, _ in chains])
+        for chain_id, links in chains:
+            if json.loads(links) == expected[chain_id]:
+                continue
+            LOG.warning('chain link list differs from its links', chain_id=chain_id)
+            inconsistent.append(chain_id)
+            if repair:
+                # Leave lists alone that changed since they were read.
+                Chain.objects.filter(pk=chain_id, links=links).update( #pylint: disable=no-member
+                    links=json.dumps(expected[chain_id], separators=(',', ':')),
+                )
+        last_id = chains[-1][0]
+# }}}
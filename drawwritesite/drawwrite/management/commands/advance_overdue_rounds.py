@@ -0,0 +1,36 @@
+"""Fill in missing links for rounds that are past their deadline."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from drawwrite import deadlines
+
+class Command(BaseCommand):
+    """Advance overdue rounds."""
+
+    help = ' '.join((
+        'Find the games whose round deadline has passed, fill in a placeholder',
+        'link for each player still on that round, and move the games on.',
+        'Run it with --every to act as the round scheduler.',
+    ))
+
+    def add_arguments(self, parser):
+        """Add the command's arguments."""
+        parser.add_argument('--limit', type=int, default=500,
+                            help='advance at most this many games per shard per tick')
+        parser.add_argument('--every', type=float,
+                            help='keep running, ticking every this many seconds')
+
+    def handle(self, *args, **options):
+        """Tick once, or every --every seconds."""
+        while True:
+            start = time.perf_counter()
+            metrics = deadlines.tick(limit=options['limit'])
+            self.stdout.write('advanced {0} seconds={1:.2f}'.format(
+                ' '.join('{0}={1}'.format(key, value) for key, value in sorted(metrics.items())),
+                time.perf_counter() - start,
+            ))
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
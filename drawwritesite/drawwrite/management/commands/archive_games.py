@@ -0,0 +1,60 @@
+"""Move old finished games out of the hot tables and into the archive."""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from drawwrite import archive
+
+class Command(BaseCommand):
+    """Archive finished games."""
+
+    help = ' '.join((
+        'Compact finished games older than --days into one archived row and',
+        'one packed drawing file each, deleting their players, chains, links',
+        'and drawing files. Archived games are still shown by the results pages.',
+    ))
+
+    def add_arguments(self, parser):
+        """Add the command's arguments."""
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'DRAWWRITE_ARCHIVE_AFTER_DAYS', 30),
+            help='archive games created more than this many days ago '
+                 '(default: DRAWWRITE_ARCHIVE_AFTER_DAYS or 30)',
+        )
+        parser.add_argument('--limit', type=int,
+                            help='archive at most this many games per shard per pass')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='rows to delete per statement')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='list the games that would be archived, and change nothing')
+        parser.add_argument('--every', type=float,
+                            help='keep running, making a pass every this many seconds')
+
+    def handle(self, *args, **options):
+        """Archive games once, or every --every seconds."""
+        while True:
+            self.archive_pass(options)
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
+
+    def archive_pass(self, options):
+        """Archive one batch of games and print what was done."""
+        start = time.perf_counter()
+        game_ids = archive.archive_finished_games(
+            options['days'],
+            limit=options['limit'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        elapsed = time.perf_counter() - start
+        if options['dry_run']:
+            for game_id in game_ids:
+                self.stdout.write('would archive game {0}'.format(game_id))
+        self.stdout.write('{0} games={1} seconds={2:.2f}'.format(
+            'dry run' if options['dry_run'] else 'archived',
+            len(game_ids),
+            elapsed,
+        ))
@@ -0,0 +1,41 @@
+"""Check each chain's link list against its links."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from drawwrite import linklist, sharding
+
+class Command(BaseCommand):
+    """Check chain link lists."""
+
+    help = ' '.join((
+        'Compare the link list stored on every chain with its write and draw',
+        'links, print the chains that differ, and with --repair rebuild their',
+        'lists from the links.',
+    ))
+
+    def add_arguments(self, parser):
+        """Add the command's arguments."""
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='chains to check per batch')
+        parser.add_argument('--repair', action='store_true',
+                            help='rebuild the lists that differ')
+
+    def handle(self, *args, **options):
+        """Check every shard and print the results."""
+        start = time.perf_counter()
+        inconsistent = []
+        for alias in sharding.get_shards():
+            with sharding.use_shard(alias):
+                inconsistent.extend(linklist.check_chains(
+                    batch_size=options['batch_size'],
+                    repair=options['repair'],
+                ))
+        for chain_id in inconsistent:
+            self.stdout.write('chain {0} differs'.format(chain_id))
+        self.stdout.write('{0} inconsistent={1} seconds={2:.2f}'.format(
+            'repaired' if options['repair'] else 'checked',
+            len(inconsistent),
+            time.perf_counter() - start,
+        ))
@@ -0,0 +1,104 @@
+"""Aggregate ProfileRequests samples into collapsed stacks."""
+
+import os
+import pstats
+
+from django.core.management.base import BaseCommand, CommandError
+
+from drawwrite.middleware import get_profile_dir
+
+# Stop descending once a path accounts for less than this many seconds.
+MIN_SECONDS = 1e-6
+
+# Never build stacks deeper than this.
+MAX_DEPTH = 100
+
+def frame_name(func):
+    """Return a flame graph frame name for a pstats function key."""
+    filename, line, name = func
+    if filename == '~':
+        return name.replace(';', ':')
+    return '{0}:{1}({2})'.format(os.path.basename(filename), line, name).replace(';', ':')
+
+def collapse(stats):
+    """
+    Return a dict mapping 'frame;frame;...' stacks to seconds spent in the
+    last frame. pstats only records caller/callee pairs, so the time of a
+    function called from several places is split between those places in
+    proportion to the time each call site accounts for.
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+
+    collapsed = {}
+
+    def walk(func, stack, share):
+        """Attribute share of func's time to stack, then recurse."""
+        _, _, own_time, _, _ = stats[func]
+        if own_time * share >= MIN_SECONDS:
+            key = ';'.join(frame_name(frame) for frame in stack)
+            collapsed[key] = collapsed.get(key, 0.0) + own_time * share
+        if len(stack) >= MAX_DEPTH:
+            return
+        for callee in callees.get(func, ()):
+            if callee in stack:
+                continue
+            callee_cumulative = stats[callee][3]
+            edge_cumulative = stats[callee][4][func][3]
+            if not callee_cumulative or edge_cumulative * share < MIN_SECONDS:
+                continue
+            walk(callee, stack + [callee], share * edge_cumulative / callee_cumulative)
+
+    for func, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk(func, [func], 1.0)
+    return collapsed
+
+class Command(BaseCommand):
+    """Write collapsed-stack text for the saved request profiles."""
+
+    help = ' '.join((
+        'Aggregate the .pstats samples saved by ProfileRequests into',
+        'collapsed-stack text (one "frame;frame;... microseconds" line per',
+        'stack), ready for flamegraph.pl or speedscope.',
+    ))
+
+    def add_arguments(self, parser):
+        """Add the command's arguments."""
+        parser.add_argument('--dir', help='profile directory (default: DRAWWRITE_PROFILE_DIR)')
+        parser.add_argument('--view', help='only aggregate this view, e.g. drawwrite.play')
+        parser.add_argument('--output', help='write here instead of to stdout')
+
+    def handle(self, *args, **options):
+        """Aggregate the samples and write the result."""
+        directory = options['dir'] or get_profile_dir()
+        if not os.path.isdir(directory):
+            raise CommandError('no profiles in {0}'.format(directory))
+
+        paths = []
+        for view_name in sorted(os.listdir(directory)):
+            if options['view'] and view_name != options['view']:
+                continue
+            view_dir = os.path.join(directory, view_name)
+            paths.extend(
+                os.path.join(view_dir, name)
+                for name in sorted(os.listdir(view_dir))
+                if name.endswith('.pstats')
+            )
+        if not paths:
+            raise CommandError('no matching profiles in {0}'.format(directory))
+
+        collapsed = collapse(pstats.Stats(*paths).stats) #pylint: disable=no-member
+        lines = [
+            '{0} {1}'.format(stack, int(round(seconds * 1e6)))
+            for stack, seconds in sorted(collapsed.items())
+            if int(round(seconds * 1e6)) > 0
+        ]
+        if options['output']:
+            with open(options['output'], 'w') as out:
+                out.write('\n'.join(lines) + '\n')
+        else:
+            self.stdout.write('\n'.join(lines))
+        self.stderr.write('aggregated {0} samples'.format(len(paths)))
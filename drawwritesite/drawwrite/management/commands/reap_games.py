@@ -0,0 +1,65 @@
+"""Delete abandoned lobbies and stalled games."""
+
+import time
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from drawwrite import reaper
+
+class Command(BaseCommand):
+    """Reap abandoned lobbies and stalled games."""
+
+    help = ' '.join((
+        'Delete lobbies that nobody has joined for --lobby-minutes and',
+        'started games that nobody has played for --stalled-hours, along',
+        'with their players, chains, links and drawing files, and uploads',
+        'that were not submitted within --upload-minutes.',
+    ))
+
+    def add_arguments(self, parser):
+        """Add the command's arguments."""
+        parser.add_argument('--lobby-minutes', type=float,
+                            help='default: DRAWWRITE_LOBBY_TIMEOUT_MINUTES or 60')
+        parser.add_argument('--stalled-hours', type=float,
+                            help='default: DRAWWRITE_STALLED_GAME_HOURS or 24')
+        parser.add_argument('--upload-minutes', type=float,
+                            help='default: DRAWWRITE_UPLOAD_TIMEOUT_MINUTES or 60')
+        parser.add_argument('--limit', type=int,
+                            help='reap at most this many lobbies and stalled games '
+                                 'per shard per pass')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='rows to delete per statement')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='count what would be deleted, and change nothing')
+        parser.add_argument('--every', type=float,
+                            help='keep running, making a pass every this many seconds')
+
+    def handle(self, *args, **options):
+        """Reap games once, or every --every seconds."""
+        while True:
+            self.reap_pass(options)
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
+
+    def reap_pass(self, options):
+        """Reap one batch of games and print the metrics."""
+        start = time.perf_counter()
+        metrics = reaper.reap(
+            lobby_after=(timedelta(minutes=options['lobby_minutes'])
+                         if options['lobby_minutes'] is not None else None),
+            stalled_after=(timedelta(hours=options['stalled_hours'])
+                           if options['stalled_hours'] is not None else None),
+            upload_after=(timedelta(minutes=options['upload_minutes'])
+                          if options['upload_minutes'] is not None else None),
+            limit=options['limit'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        self.stdout.write('{0} {1} seconds={2:.2f}'.format(
+            'dry run' if options['dry_run'] else 'reaped',
+            ' '.join('{0}={1}'.format(key, value) for key, value in sorted(metrics.items())),
+            time.perf_counter() - start,
+        ))
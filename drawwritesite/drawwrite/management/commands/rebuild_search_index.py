@@ -0,0 +1,33 @@
+"""Fill the search index from every chain."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from drawwrite import search, sharding
+
+class Command(BaseCommand):
+    """Rebuild the search index."""
+
+    help = ' '.join((
+        'Add every chain on every shard, live or archived, to the search',
+        'index, replacing the rows that are there. New write links keep the',
+        'index up to date, so this is only needed to fill a new index.',
+    ))
+
+    def add_arguments(self, parser):
+        """Add the command's arguments."""
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='chains or archived games to index per batch')
+
+    def handle(self, *args, **options):
+        """Rebuild the index on every shard and print the results."""
+        start = time.perf_counter()
+        indexed = 0
+        for alias in sharding.get_shards():
+            with sharding.use_shard(alias):
+                indexed += search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write('rebuilt chains={0} seconds={1:.2f}'.format(
+            indexed,
+            time.perf_counter() - start,
+        ))
@@ -0,0 +1,47 @@
+"""Rebuild game counters from the game event log."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from drawwrite import events, sharding
+
+class Command(BaseCommand):
+    """Repair drifted game counters."""
+
+    help = ' '.join((
+        'Replay the event log of each game that has a complete one, and reset',
+        'any round, player or chain counters that disagree with it.',
+    ))
+
+    def add_arguments(self, parser):
+        """Add the command's arguments."""
+        parser.add_argument('--game', type=int, action='append', dest='games',
+                            help='only check this game, may be given more than once')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='print what would be repaired, and change nothing')
+
+    def handle(self, *args, **options):
+        """Check every game, or the given ones, and print the repairs."""
+        start = time.perf_counter()
+        checked = repaired = 0
+        for alias in sharding.get_shards():
+            with sharding.use_shard(alias):
+                game_ids = options['games'] or list(events.logged_games())
+                for game_id in game_ids:
+                    if options['games'] and sharding.shard_for_id(game_id) != alias:
+                        continue
+                    repairs = events.rebuild_counters(game_id, dry_run=options['dry_run'])
+                    if repairs is None:
+                        continue
+                    checked += 1
+                    if repairs:
+                        repaired += 1
+                    for name, field, old, new in repairs:
+                        self.stdout.write('{0} {1}: {2} -> {3}'.format(name, field, old, new))
+        self.stdout.write('{0} games={1} checked={2} seconds={3:.2f}'.format(
+            'dry run' if options['dry_run'] else 'repaired',
+            repaired,
+            checked,
+            time.perf_counter() - start,
+        ))
@@ -0,0 +1,48 @@
+"""Run the tasks in the database task queue."""
+
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from drawwrite import taskqueue
+
+class Command(BaseCommand):
+    """Run queued tasks."""
+
+    help = ' '.join((
+        'Claim the tasks queued with DRAWWRITE_TASK_MODE set to "queue" and run',
+        'them on a pool of threads, retrying failures with backoff. Keeps',
+        'polling for new tasks unless --once is given.',
+    ))
+
+    def add_arguments(self, parser):
+        """Add the command's arguments."""
+        parser.add_argument('--workers', type=int, default=4,
+                            help='run this many tasks at once')
+        parser.add_argument('--visibility-timeout', type=float, default=300,
+                            help='seconds before a claimed task that has not finished is run again')
+        parser.add_argument('--poll-interval', type=float, default=1,
+                            help='seconds to wait when there are no tasks')
+        parser.add_argument('--once', action='store_true',
+                            help='run the tasks that are due, then stop')
+
+    def handle(self, *args, **options):
+        """Run tasks until there are none left, or forever."""
+        taskqueue.load_task_modules()
+        batch_size = options['workers'] * 2
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                start = time.perf_counter()
+                metrics = taskqueue.work(pool, batch_size, options['visibility_timeout'])
+                if metrics['claimed']:
+                    self.stdout.write('ran tasks {0} seconds={1:.2f}'.format(
+                        ' '.join('{0}={1}'.format(key, value)
+                                 for key, value in sorted(metrics.items())),
+                        time.perf_counter() - start,
+                    ))
+                    continue
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
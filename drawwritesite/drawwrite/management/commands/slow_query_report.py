@@ -0,0 +1,86 @@
+"""Aggregate the slow queries recorded by SlowQueryLog by fingerprint."""
+
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from drawwrite.middleware import get_slow_query_log
+
+# Words in a SQLite or PostgreSQL query plan that mean a table is scanned.
+SCAN_MARKERS = ('SCAN ', 'Seq Scan')
+
+def aggregate(lines):
+    """Return a list of per-fingerprint summaries, slowest in total first."""
+    groups = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        group = groups.setdefault(entry['fingerprint'], {
+            'fingerprint': entry['fingerprint'],
+            'sql': entry['sql'],
+            'count': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'views': {},
+            'plan': None,
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['ms']
+        group['max_ms'] = max(group['max_ms'], entry['ms'])
+        group['views'][entry['view']] = group['views'].get(entry['view'], 0) + 1
+        if entry.get('plan'):
+            group['plan'] = entry['plan']
+    for group in groups.values():
+        group['mean_ms'] = group['total_ms'] / group['count']
+        group['table_scan'] = any(
+            marker in step
+            for step in group['plan'] or ()
+            for marker in SCAN_MARKERS
+        )
+    return sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
+
+class Command(BaseCommand):
+    """Summarize the slow query log."""
+
+    help = ' '.join((
+        'Group the queries recorded by SlowQueryLog by fingerprint and show',
+        'their counts, timings, calling views and query plans.',
+    ))
+
+    def add_arguments(self, parser):
+        """Add the command's arguments."""
+        parser.add_argument('--file', help='slow query file (default: DRAWWRITE_SLOW_QUERY_LOG)')
+        parser.add_argument('--limit', type=int, default=20, help='show this many fingerprints')
+        parser.add_argument('--json', action='store_true', help='print JSON instead of text')
+
+    def handle(self, *args, **options):
+        """Aggregate the slow query file and print the result."""
+        path = options['file'] or get_slow_query_log()
+        if not os.path.exists(path):
+            raise CommandError('no slow queries recorded in {0}'.format(path))
+        with open(path) as log:
+            groups = aggregate(log)[:options['limit']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(groups, indent=2, sort_keys=True))
+            return
+        for group in groups:
+            self.stdout.write((
+                '{0}  count={1} total={2:.1f}ms mean={3:.1f}ms max={4:.1f}ms{5}'
+            ).format(
+                group['fingerprint'],
+                group['count'],
+                group['total_ms'],
+                group['mean_ms'],
+                group['max_ms'],
+                '  TABLE SCAN' if group['table_scan'] else '',
+            ))
+            self.stdout.write('    views: {0}'.format(', '.join(
+                '{0} ({1})'.format(view, count)
+                for view, count in sorted(group['views'].items())
+            )))
+            self.stdout.write('    sql: {0}'.format(group['sql']))
+            for step in group['plan'] or ():
+                self.stdout.write('    plan: {0}'.format(step))
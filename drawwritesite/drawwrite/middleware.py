@@ -1,6 +1,23 @@
 """Custom middleware for DrawWrite"""
 
+import contextlib
+import cProfile
+import hashlib
+import json
 import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+
+from . import admission, routers
 
 LOG = logging.getLogger(__name__)
 
@@ -19,3 +36,433 @@ class LogExceptions:
         """Log the exception."""
         LOG.exception(exception)
         return None
+
+class ReadReplicas:
+    """
+    Middleware that lets the read-only drawwrite views read from a replica,
+    see drawwrite.routers.ReadReplicaRouter.
+
+    The views are the ones in DRAWWRITE_REPLICA_VIEWS (by default
+    routers.REPLICA_VIEWS). For read-your-writes, a response to a request
+    that wrote sets a cookie that pins that browser, and so that player, to
+    the primary for DRAWWRITE_REPLICA_PIN_SECONDS seconds (default 5).
+    """
+
+    cookie_name = 'drawwrite_primary_until'
+
+    def __init__(self, get_response):
+        """Set get_response appropriately and read the settings."""
+        self.get_response = get_response
+        self.views = frozenset(getattr(settings, 'DRAWWRITE_REPLICA_VIEWS', routers.REPLICA_VIEWS))
+        self.pin_seconds = getattr(settings, 'DRAWWRITE_REPLICA_PIN_SECONDS', 5)
+
+    def __call__(self, request):
+        """Route the request's queries, and pin the browser if it wrote."""
+        routers.begin_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.end_request()
+        if wrote and self.pin_seconds > 0:
+            response.set_cookie(
+                self.cookie_name,
+                '{0:.3f}'.format(time.time() + self.pin_seconds),
+                max_age=self.pin_seconds,
+                httponly=True,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs): #pylint: disable=unused-argument
+        """Let read-only views read from a replica unless the browser is pinned."""
+        match = request.resolver_match
+        if match.namespace != 'drawwrite' or match.url_name not in self.views:
+            return None
+        if self.pinned(request):
+            return None
+        routers.read_from_replica()
+        return None
+
+    def pinned(self, request):
+        """Return whether request should still read its own writes."""
+        try:
+            until = float(request.COOKIES.get(self.cookie_name, 0))
+        except ValueError:
+            return False
+        return time.time() < until
+
+def get_profile_dir():
+    """Return the directory that ProfileRequests saves samples in."""
+    return getattr(
+        settings,
+        'DRAWWRITE_PROFILE_DIR',
+        os.path.join(tempfile.gettempdir(), 'drawwrite-profiles'),
+    )
+
+class ProfileRequests:
+    """
+    Middleware that runs a sample of requests under cProfile.
+
+    A request is profiled when a random draw falls under
+    DRAWWRITE_PROFILE_SAMPLE_RATE (default 0), or when a staff user sends
+    the X-DrawWrite-Profile header. Each sample is written to
+    DRAWWRITE_PROFILE_DIR/<view name>/ as a .pstats file, next to a .json
+    file holding the request's timings and captured SQL. Only the newest
+    DRAWWRITE_PROFILE_KEEP samples (default 50) are kept per view.
+
+    Install it after AuthenticationMiddleware so that the staff check can
+    see request.user. Aggregate the samples with the profile_report
+    management command.
+    """
+
+    def __init__(self, get_response):
+        """Set get_response appropriately and read the settings."""
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'DRAWWRITE_PROFILE_SAMPLE_RATE', 0.0)
+        self.directory = get_profile_dir()
+        self.keep = getattr(settings, 'DRAWWRITE_PROFILE_KEEP', 50)
+
+    def __call__(self, request):
+        """Profile the request if it was sampled or asked for."""
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        response = None
+        start = time.perf_counter()
+        # Queries may go to any shard or replica, so capture them all.
+        with contextlib.ExitStack() as stack:
+            queries = [
+                stack.enter_context(CaptureQueriesContext(db)) for db in connections.all()
+            ]
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+                elapsed = time.perf_counter() - start
+                try:
+                    self.save(request, response, profiler, queries, elapsed)
+                except OSError:
+                    LOG.exception('could not save profile')
+        return response
+
+    def should_profile(self, request):
+        """Return whether request should be profiled."""
+        if 'HTTP_X_DRAWWRITE_PROFILE' in request.META:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_staff:
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def save(self, request, response, profiler, queries, elapsed): #pylint: disable=too-many-arguments
+        """
+        Write the profile and its metadata, with the queries captured on
+        each database tagged with its alias, then rotate old samples.
+        """
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name.replace(':', '.') if match else 'unresolved'
+        view_dir = os.path.join(self.directory, view_name)
+        os.makedirs(view_dir, exist_ok=True)
+
+        base = os.path.join(view_dir, '{0:.6f}-{1}'.format(time.time(), os.getpid()))
+        profiler.dump_stats(base + '.pstats')
+        captured = [
+            dict(query, database=capture.connection.alias)
+            for capture in queries
+            for query in capture.captured_queries
+        ]
+        with open(base + '.json', 'w') as out:
+            json.dump({
+                'view': view_name,
+                'path': request.path,
+                'method': request.method,
+                'status': response.status_code if response is not None else None,
+                'total_ms': elapsed * 1000,
+                'sql_ms': sum(float(query['time']) for query in captured) * 1000,
+                'queries': captured,
+            }, out, indent=2)
+
+        samples = sorted(
+            name[:-len('.pstats')]
+            for name in os.listdir(view_dir)
+            if name.endswith('.pstats')
+        )
+        for old in samples[:-self.keep] if self.keep > 0 else samples:
+            for extension in ('.pstats', '.json'):
+                try:
+                    os.remove(os.path.join(view_dir, old + extension))
+                except FileNotFoundError:
+                    pass
+
+def get_slow_query_log():
+    """Return the file that SlowQueryLog appends slow queries to."""
+    return getattr(
+        settings,
+        'DRAWWRITE_SLOW_QUERY_LOG',
+        os.path.join(tempfile.gettempdir(), 'drawwrite-slow-queries.jsonl'),
+    )
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_sql(sql):
+    """
+    Return sql with literals and placeholders replaced by '?', lists of
+    placeholders collapsed and whitespace squeezed, so that queries that
+    differ only in their parameters look the same.
+    """
+    sql = sql.replace('%s', '?')
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+def fingerprint_sql(normalized):
+    """Return a short, stable id for a normalized query."""
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+class _SlowQueryCursor:
+    """Wrap a cursor, reporting how long each execute takes to a hook."""
+
+    def __init__(self, cursor, db, hook):
+        """Initialize the object"""
+        self.cursor = cursor
+        self.db = db
+        self.hook = hook
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.cursor.__exit__(exc_type, exc_value, traceback)
+
+    def execute(self, sql, params=None):
+        """Execute the query and time it."""
+        start = time.perf_counter()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.hook.observe(self.db, sql, params, time.perf_counter() - start)
+
+    def executemany(self, sql, param_list):
+        """Execute the query for every set of parameters and time it."""
+        start = time.perf_counter()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.hook.observe(self.db, sql, None, time.perf_counter() - start)
+
+class SlowQueryLog:
+    """
+    Middleware that records queries made by the drawwrite views that take
+    longer than DRAWWRITE_SLOW_QUERY_MS milliseconds (default 100).
+
+    Each slow query is logged, and appended as a JSON line to
+    DRAWWRITE_SLOW_QUERY_LOG with the view, the normalized SQL, its
+    fingerprint and the query plan. The plan comes from EXPLAIN QUERY PLAN
+    on SQLite and EXPLAIN elsewhere, and is captured for SELECTs the first
+    time this process sees their fingerprint. Aggregate the file with the
+    slow_query_report management command.
+    """
+
+    # Query plans already captured, by fingerprint.
+    plans = {}
+    lock = threading.Lock()
+
+    def __init__(self, get_response):
+        """Set get_response appropriately and read the settings."""
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'DRAWWRITE_SLOW_QUERY_MS', 100) / 1000.0
+        self.path = get_slow_query_log()
+
+    def __call__(self, request):
+        """Time every query made while handling request."""
+        with _timing_queries(_SlowQueryHook(self, request)):
+            return self.get_response(request)
+
+    def explain(self, db, sql, params):
+        """Return the query plan for sql as a list of strings."""
+        prefix = 'EXPLAIN QUERY PLAN ' if db.vendor == 'sqlite' else 'EXPLAIN '
+        with db.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+
+    def record(self, entry):
+        """Log a slow query and append it to the slow query file."""
+        LOG.warning(
+            'slow query: %.1fms in %s [%s] %s',
+            entry['ms'], entry['view'], entry['fingerprint'], entry['sql'],
+        )
+        with self.lock:
+            with open(self.path, 'a') as out:
+                out.write(json.dumps(entry, sort_keys=True) + '\n')
+
+@contextlib.contextmanager
+def _timing_queries(hook):
+    """Report the time of every query made on this thread's connections to hook."""
+    # What each connection had before, so nested timers put back the outer
+    # timer's patch instead of removing it.
+    patched = []
+    for db in connections.all():
+        saved = {
+            name: db.__dict__.get(name, _UNSET)
+            for name in ('make_cursor', 'make_debug_cursor')
+        }
+        make_cursor = db.make_cursor
+        make_debug_cursor = db.make_debug_cursor
+        db.make_cursor = (
+            lambda cursor, db=db, make=make_cursor: _SlowQueryCursor(make(cursor), db, hook)
+        )
+        db.make_debug_cursor = (
+            lambda cursor, db=db, make=make_debug_cursor: _SlowQueryCursor(make(cursor), db, hook)
+        )
+        patched.append((db, saved))
+    try:
+        yield
+    finally:
+        for db, saved in patched:
+            for name, value in saved.items():
+                if value is _UNSET:
+                    db.__dict__.pop(name, None)
+                else:
+                    setattr(db, name, value)
+
+# Marks a connection attribute that _timing_queries found unset.
+_UNSET = object()
+
+class _SlowQueryHook:
+    """Receive query timings for one request."""
+
+    def __init__(self, log, request):
+        """Initialize the object"""
+        self.log = log
+        self.request = request
+        self.explaining = False
+
+    def observe(self, db, sql, params, elapsed):
+        """Record the query if it was slow and came from a drawwrite view."""
+        if elapsed < self.log.threshold or self.explaining:
+            return
+        match = getattr(self.request, 'resolver_match', None)
+        if match is None or match.app_name != 'drawwrite':
+            return
+
+        normalized = normalize_sql(sql)
+        fingerprint = fingerprint_sql(normalized)
+        plan = None
+        if fingerprint not in SlowQueryLog.plans and normalized.upper().startswith('SELECT'):
+            self.explaining = True
+            try:
+                plan = self.log.explain(db, sql, params)
+            except Exception: #pylint: disable=broad-except
+                LOG.exception('could not explain slow query')
+            finally:
+                self.explaining = False
+            SlowQueryLog.plans[fingerprint] = plan
+
+        try:
+            self.log.record({
+                'time': time.time(),
+                'view': match.view_name,
+                'database': db.alias,
+                'ms': elapsed * 1000,
+                'fingerprint': fingerprint,
+                'sql': normalized,
+                'plan': plan,
+            })
+        except OSError:
+            LOG.exception('could not record slow query')
+
+class AdmissionControl:
+    """
+    Middleware that answers requests to drawwrite views over their limits
+    in drawwrite.urls.ADMISSION (or DRAWWRITE_ADMISSION) with a 429, and
+    requests to sheddable views with a 503 while the database is slow,
+    see drawwrite.admission. Both come with a Retry-After header, and are
+    sent before the view, or anything else that queries, runs.
+
+    Load shedding is off unless DRAWWRITE_SHED_DB_MS is set, in which case
+    every query is timed. Shed clients are told to retry after
+    DRAWWRITE_SHED_RETRY_SECONDS (default 5). Install it before
+    SessionMiddleware and AuthenticationMiddleware, which is cheapest.
+    """
+
+    def __init__(self, get_response):
+        """Set get_response appropriately and read the settings."""
+        from . import urls
+        self.get_response = get_response
+        self.limits = getattr(settings, 'DRAWWRITE_ADMISSION', urls.ADMISSION)
+        self.limiter = admission.RateLimiter(
+            getattr(settings, 'DRAWWRITE_RATE_LIMIT_MAX_KEYS', 100000))
+        self.shedder = admission.get_shedder()
+        self.shed_retry_seconds = getattr(settings, 'DRAWWRITE_SHED_RETRY_SECONDS', 5)
+
+    def __call__(self, request):
+        """Handle the request, timing its queries if shedding is on."""
+        if self.shedder is None:
+            return self.get_response(request)
+        timer = _QueryTimer()
+        with _timing_queries(timer):
+            response = self.get_response(request)
+        self.shedder.record(timer.seconds, timer.queries)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs): #pylint: disable=unused-argument
+        """Turn the request away if it is over its limit or being shed."""
+        match = request.resolver_match
+        if match.namespace != 'drawwrite':
+            return None
+        limit = self.limits.get(match.url_name)
+        if limit is None:
+            return None
+
+        if limit.sheddable and self.shedder is not None and self.shedder.overloaded():
+            LOG.debug('shedding request to %s', match.url_name)
+            return self.turn_away(503, self.shed_retry_seconds)
+
+        client = request.META.get('REMOTE_ADDR', '')
+        if limit.key == 'player':
+            # API views name the player with a token instead of an id.
+            key = view_kwargs.get('player_id', view_kwargs.get('token', client))
+        elif limit.key == 'game':
+            key = view_kwargs.get('game_id', client)
+        else:
+            key = client
+        wait = self.limiter.acquire((match.url_name, limit.key, key), limit)
+        if wait:
+            LOG.debug('rate limited %s for %s %s', match.url_name, limit.key, key)
+            return self.turn_away(429, wait)
+        return None
+
+    @staticmethod
+    def turn_away(status, retry_after):
+        """Return a small response asking the client to come back later."""
+        reason = 'Too many requests' if status == 429 else 'The server is busy'
+        response = HttpResponse(
+            '{0}, please try again in {1} seconds.\n'.format(reason, retry_after),
+            status=status,
+            content_type='text/plain',
+        )
+        response['Retry-After'] = str(retry_after)
+        return response
+
+class _QueryTimer:
+    """Add up the number and time of queries for one request."""
+
+    def __init__(self):
+        """Initialize the object"""
+        self.seconds = 0.0
+        self.queries = 0
+
+    def observe(self, db, sql, params, elapsed): #pylint: disable=unused-argument
+        """Count a query."""
+        self.seconds += elapsed
+        self.queries += 1
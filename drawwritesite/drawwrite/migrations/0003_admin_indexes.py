@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 14:17
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drawwrite', '0002_auto_20170807_2010'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='game',
+            name='name',
+            field=models.CharField(db_index=True, max_length=50, verbose_name='Name'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='started',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='Started?'),
+        ),
+        migrations.AlterField(
+            model_name='player',
+            name='name',
+            field=models.CharField(db_index=True, max_length=50, verbose_name='Name'),
+        ),
+    ]
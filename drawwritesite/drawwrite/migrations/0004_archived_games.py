@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 14:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drawwrite', '0003_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedGame',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.IntegerField(unique=True, verbose_name='Original Game ID')),
+                ('name', models.CharField(max_length=50, verbose_name='Name')),
+                ('time_created', models.DateTimeField(verbose_name='Time Created')),
+                ('time_archived', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Time Archived')),
+                ('document', models.TextField(verbose_name='Document')),
+                ('media', models.FileField(blank=True, upload_to='', verbose_name='Packed Drawings')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPlayer',
+            fields=[
+                ('original_id', models.IntegerField(primary_key=True, serialize=False, verbose_name='Original Player ID')),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='drawwrite.ArchivedGame')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 14:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def set_last_activity(apps, schema_editor):
+    """Treat existing games as last active when they were created."""
+    Game = apps.get_model('drawwrite', 'Game')
+    Game.objects.update(last_activity=F('time_created'))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drawwrite', '0004_archived_games'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='last_activity',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Last Activity'),
+        ),
+        migrations.RunPython(set_last_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 14:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drawwrite', '0006_shard_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='pipelined',
+            field=models.BooleanField(default=False, verbose_name='Players move on without waiting for the round to finish'),
+        ),
+    ]
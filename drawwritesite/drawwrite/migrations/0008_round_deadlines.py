@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 14:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drawwrite', '0007_game_pipelined'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='round_deadline',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Current round ends at'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='round_seconds',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Seconds per round'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 14:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drawwrite', '0008_round_deadlines'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Name')),
+                ('arguments', models.TextField(verbose_name='Arguments')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('failed', 'Failed')], default='queued', max_length=10, verbose_name='Status')),
+                ('attempts', models.SmallIntegerField(default=0, verbose_name='Attempts')),
+                ('max_attempts', models.SmallIntegerField(default=3, verbose_name='Max Attempts')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Available At')),
+                ('time_created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Time Created')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last Error')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='task',
+            index_together=set([('status', 'available_at')]),
+        ),
+    ]
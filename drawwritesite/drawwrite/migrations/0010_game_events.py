@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 14:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drawwrite', '0009_tasks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('created', 'Game created'), ('joined', 'Player joined'), ('started', 'Game started'), ('link', 'Link added'), ('round', 'Round advanced')], max_length=10, verbose_name='Kind')),
+                ('data', models.TextField(default='{}', verbose_name='Data')),
+                ('time_created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Time Created')),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='drawwrite.Game')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='gameevent',
+            index_together=set([('game', 'id')]),
+        ),
+    ]
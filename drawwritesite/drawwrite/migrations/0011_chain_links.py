@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 14:39
+from __future__ import unicode_literals
+
+import json
+
+from django.db import migrations, models
+
+
+def fill_links(apps, schema_editor):
+    """Copy the links of existing chains into their new link lists."""
+    Chain = apps.get_model('drawwrite', 'Chain')
+    WriteLink = apps.get_model('drawwrite', 'WriteLink')
+    DrawLink = apps.get_model('drawwrite', 'DrawLink')
+    for chain in Chain.objects.filter(next_link_position__gt=0).iterator():
+        entries = []
+        for link in WriteLink.objects.filter(chain=chain).select_related('added_by'):
+            entries.append({
+                'type': 'write',
+                'position': link.link_position,
+                'added_by': link.added_by.pk,
+                'name': link.added_by.name,
+                'text': link.text,
+            })
+        for link in DrawLink.objects.filter(chain=chain).select_related('added_by'):
+            entries.append({
+                'type': 'draw',
+                'position': link.link_position,
+                'added_by': link.added_by.pk,
+                'name': link.added_by.name,
+                'media': link.drawing.name,
+            })
+        entries.sort(key=lambda entry: entry['position'])
+        Chain.objects.filter(pk=chain.pk).update(links=json.dumps(entries, separators=(',', ':')))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drawwrite', '0010_game_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chain',
+            name='links',
+            field=models.TextField(default='[]', verbose_name='Links'),
+        ),
+        migrations.RunPython(fill_links, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 14:56
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drawwrite', '0011_chain_links'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, verbose_name='Key')),
+                ('status', models.PositiveSmallIntegerField(verbose_name='Status')),
+                ('response', models.TextField(verbose_name='Response')),
+                ('time_created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Time Created')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='drawwrite.Player')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.PositiveIntegerField(verbose_name='Size')),
+                ('received', models.PositiveIntegerField(default=0, verbose_name='Bytes Received')),
+                ('time_created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Time Created')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='drawwrite.Player')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UploadChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.PositiveIntegerField(verbose_name='Offset')),
+                ('data', models.BinaryField(verbose_name='Data')),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='drawwrite.Upload')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='uploadchunk',
+            unique_together=set([('upload', 'offset')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='idempotencykey',
+            unique_together=set([('player', 'key')]),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 15:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drawwrite', '0012_resumable_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drawlink',
+            name='height',
+            field=models.PositiveIntegerField(null=True, verbose_name='Height'),
+        ),
+        migrations.AddField(
+            model_name='drawlink',
+            name='width',
+            field=models.PositiveIntegerField(null=True, verbose_name='Width'),
+        ),
+    ]
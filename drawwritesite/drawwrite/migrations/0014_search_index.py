@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# The search index has no model: SQLite keeps it in an FTS5 table, and
+# PostgreSQL in a table with a GIN indexed tsvector, see drawwrite.search.
+CREATE = {
+    'sqlite': [
+        'CREATE VIRTUAL TABLE drawwrite_search USING fts5('
+        'text, game_id UNINDEXED, game_name UNINDEXED, '
+        'player_id UNINDEXED, player_name UNINDEXED)',
+    ],
+    'postgresql': [
+        'CREATE TABLE drawwrite_search ('
+        'chain_id integer PRIMARY KEY, game_id integer NOT NULL, '
+        'game_name varchar(50) NOT NULL, player_id integer NOT NULL, '
+        'player_name varchar(50) NOT NULL, text text NOT NULL, '
+        'document tsvector NOT NULL)',
+        'CREATE INDEX drawwrite_search_document ON drawwrite_search USING gin (document)',
+    ],
+}
+
+
+def create_index(apps, schema_editor):
+    """Create the search table, if the database has a kind of index."""
+    for statement in CREATE.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    """Drop the search table, if it was created."""
+    if schema_editor.connection.vendor in CREATE:
+        schema_editor.execute('DROP TABLE drawwrite_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drawwrite', '0013_drawing_size'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
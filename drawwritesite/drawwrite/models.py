@@ -8,15 +8,27 @@ class Game(models.Model):
     Games have a number of players, a unique name, and a
     created time.
     """
-    name = models.CharField('Name', max_length=50)
+    name = models.CharField('Name', max_length=50, db_index=True)
     num_players = models.SmallIntegerField('Number of Players', default=0)
-    started = models.BooleanField('Started?', default=False)
+    started = models.BooleanField('Started?', default=False, db_index=True)
     time_created = models.DateTimeField('Time Created', default=timezone.now)
+    last_activity = models.DateTimeField('Last Activity', default=timezone.now, db_index=True)
     round_num = models.SmallIntegerField('Current Round', default=0)
     num_finished_current_round = models.SmallIntegerField(
         'Number of players who have finished the current round',
         default=0
     )
+    pipelined = models.BooleanField(
+        'Players move on without waiting for the round to finish',
+        default=False,
+    )
+    round_seconds = models.PositiveIntegerField('Seconds per round', null=True, blank=True)
+    round_deadline = models.DateTimeField(
+        'Current round ends at',
+        null=True,
+        blank=True,
+        db_index=True,
+    )
 
     def __str__(self):
         return self.name
@@ -26,7 +38,7 @@ class Player(models.Model):
     Holds information about a user, such as their name, a reference
     to their game, and their position in the cycle.
     """
-    name = models.CharField('Name', max_length=50)
+    name = models.CharField('Name', max_length=50, db_index=True)
     game = models.ForeignKey(Game)
     position = models.SmallIntegerField('Position')
     was_creator = models.BooleanField('Created game')
@@ -44,6 +56,10 @@ class Chain(models.Model):
     next_link_position = models.SmallIntegerField('Next Link Position', default=0)
     player = models.OneToOneField(Player)
 
+    # Every link of the chain in order, as JSON, so that showing the chain
+    # or its last link reads just this row, see drawwrite.linklist.
+    links = models.TextField('Links', default='[]')
+
     def __str__(self):
         return '{0}\'s chain'.format(self.player)
 
@@ -52,6 +68,10 @@ class DrawLink(models.Model):
     A DrawLink holds data for a single 'draw' step of a DrawWrite game.
     """
     drawing = models.FileField('File')
+    # Read from the PNG header when the link is added, so that pages can
+    # size the drawing before loading it. Null for drawings added before.
+    width = models.PositiveIntegerField('Width', null=True)
+    height = models.PositiveIntegerField('Height', null=True)
     link_position = models.SmallIntegerField('Link Position')
     chain = models.ForeignKey(Chain)
     added_by = models.ForeignKey(Player)
@@ -64,3 +84,131 @@ class WriteLink(models.Model):
     link_position = models.SmallIntegerField('Link Position')
     chain = models.ForeignKey(Chain)
     added_by = models.ForeignKey(Player)
+
+class GameEvent(models.Model):
+    """
+    A GameEvent records one change to a game, in the order the changes
+    were made. Events are only ever added, see drawwrite.events.
+    """
+    CREATED = 'created'
+    JOINED = 'joined'
+    STARTED = 'started'
+    LINK_ADDED = 'link'
+    ROUND_ADVANCED = 'round'
+    KIND_CHOICES = (
+        (CREATED, 'Game created'),
+        (JOINED, 'Player joined'),
+        (STARTED, 'Game started'),
+        (LINK_ADDED, 'Link added'),
+        (ROUND_ADVANCED, 'Round advanced'),
+    )
+
+    game = models.ForeignKey(Game)
+    kind = models.CharField('Kind', max_length=10, choices=KIND_CHOICES)
+    data = models.TextField('Data', default='{}')
+    time_created = models.DateTimeField('Time Created', default=timezone.now)
+
+    class Meta:
+        index_together = [('game', 'id')]
+
+    def __str__(self):
+        return '{0} {1}'.format(self.kind, self.game_id) #pylint: disable=no-member
+
+class ArchivedGame(models.Model):
+    """
+    An ArchivedGame is a finished game compacted into one JSON document,
+    with all of its drawings packed into a single file.
+    """
+    original_id = models.IntegerField('Original Game ID', unique=True)
+    name = models.CharField('Name', max_length=50)
+    time_created = models.DateTimeField('Time Created')
+    time_archived = models.DateTimeField('Time Archived', default=timezone.now)
+    document = models.TextField('Document')
+    media = models.FileField('Packed Drawings', blank=True)
+
+    def __str__(self):
+        return self.name
+
+class ArchivedPlayer(models.Model):
+    """
+    Maps the id of a player from an archived game to that game's archive,
+    so that player id URLs keep working.
+    """
+    original_id = models.IntegerField('Original Player ID', primary_key=True)
+    archive = models.ForeignKey(ArchivedGame)
+
+class ShardSequence(models.Model):
+    """
+    The last id number handed out on one shard for one sharded model, see
+    drawwrite.sharding.allocate_id.
+    """
+    name = models.CharField('Name', max_length=20, primary_key=True)
+    last_value = models.BigIntegerField('Last Value', default=0)
+
+    def __str__(self):
+        return self.name
+
+class Task(models.Model):
+    """
+    A Task is a call to a registered function that the task worker runs
+    after the transaction that queued it commits, see drawwrite.taskqueue.
+    """
+    QUEUED = 'queued'
+    FAILED = 'failed'
+    STATUS_CHOICES = ((QUEUED, 'Queued'), (FAILED, 'Failed'))
+
+    name = models.CharField('Name', max_length=100)
+    arguments = models.TextField('Arguments')
+    status = models.CharField('Status', max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.SmallIntegerField('Attempts', default=0)
+    max_attempts = models.SmallIntegerField('Max Attempts', default=3)
+    available_at = models.DateTimeField('Available At', default=timezone.now)
+    time_created = models.DateTimeField('Time Created', default=timezone.now)
+    last_error = models.TextField('Last Error', blank=True)
+
+    class Meta:
+        index_together = [('status', 'available_at')]
+
+    def __str__(self):
+        return self.name
+
+class Upload(models.Model):
+    """
+    An Upload is a drawing that a player of the API is sending in chunks,
+    so that an interrupted upload can carry on where it stopped, see
+    drawwrite.uploads.
+    """
+    player = models.ForeignKey(Player)
+    size = models.PositiveIntegerField('Size')
+    received = models.PositiveIntegerField('Bytes Received', default=0)
+    time_created = models.DateTimeField('Time Created', default=timezone.now)
+
+    def __str__(self):
+        return '{0}/{1} bytes from {2}'.format(
+            self.received, self.size, self.player_id) #pylint: disable=no-member
+
+class UploadChunk(models.Model):
+    """One chunk of an Upload, starting offset bytes in."""
+    upload = models.ForeignKey(Upload)
+    offset = models.PositiveIntegerField('Offset')
+    data = models.BinaryField('Data')
+
+    class Meta:
+        unique_together = [('upload', 'offset')]
+
+class IdempotencyKey(models.Model):
+    """
+    The response to a player's API request made with an Idempotency-Key
+    header, returned again for retries with the same key.
+    """
+    player = models.ForeignKey(Player)
+    key = models.CharField('Key', max_length=64)
+    status = models.PositiveSmallIntegerField('Status')
+    response = models.TextField('Response')
+    time_created = models.DateTimeField('Time Created', default=timezone.now)
+
+    class Meta:
+        unique_together = [('player', 'key')]
+
+    def __str__(self):
+        return self.key
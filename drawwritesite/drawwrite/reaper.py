@@ -0,0 +1,185 @@
+"""Delete lobbies that never started and games that players walked away from."""
+
+# Imports {{{
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .archive import delete_files, delete_in_batches
+from .models import (
+    Chain, DrawLink, Game, GameEvent, IdempotencyKey, Player, Upload, UploadChunk, WriteLink,
+)
+from . import kvlog, search, sharding
+# }}}
+
+LOG = kvlog.get_logger(__name__)
+
+# Timeouts {{{
+def lobby_timeout():
+    """
+    Return how long a lobby may go without anyone joining before it is
+    abandoned, from DRAWWRITE_LOBBY_TIMEOUT_MINUTES.
+    """
+    return timedelta(minutes=getattr(settings, 'DRAWWRITE_LOBBY_TIMEOUT_MINUTES', 60))
+
+def stalled_timeout():
+    """
+    Return how long a started game may go without anyone finishing a round
+    before it is stalled, from DRAWWRITE_STALLED_GAME_HOURS.
+    """
+    return timedelta(hours=getattr(settings, 'DRAWWRITE_STALLED_GAME_HOURS', 24))
+
+def upload_timeout():
+    """
+    Return how long a resumable upload may go unsubmitted before it is
+    abandoned, from DRAWWRITE_UPLOAD_TIMEOUT_MINUTES.
+    """
+    return timedelta(minutes=getattr(settings, 'DRAWWRITE_UPLOAD_TIMEOUT_MINUTES', 60))
+# }}}
+
+# Finding games {{{
+def abandoned_lobbies(timeout):
+    """Return a queryset of unstarted games idle for longer than timeout."""
+    return Game.objects.filter( #pylint: disable=no-member
+        started=False,
+        last_activity__lt=timezone.now() - timeout,
+    )
+
+def stalled_games(timeout):
+    """Return a queryset of unfinished games idle for longer than timeout."""
+    return Game.objects.filter( #pylint: disable=no-member
+        started=True,
+        round_num__lt=F('num_players'),
+        last_activity__lt=timezone.now() - timeout,
+    )
+
+def abandoned_uploads(timeout):
+    """Return a queryset of uploads started longer than timeout ago."""
+    return Upload.objects.filter( #pylint: disable=no-member
+        time_created__lt=timezone.now() - timeout,
+    )
+# }}}
+
+# reap_game {{{
+def reap_game(candidates, game_id, batch_size, metrics):
+    """
+    Delete the game game_id along with its players, chains and links, if it
+    is still in the candidates queryset once locked, and count what was
+    deleted in metrics. Return whether the game was deleted.
+    """
+    with transaction.atomic(using=sharding.current_shard()):
+        # A join may have touched the game since it was picked, so check it
+        # again while holding its row lock. new_player takes the same lock.
+        game = candidates.select_for_update().filter(pk=game_id).first()
+        if game is None:
+            metrics['skipped'] += 1
+            return False
+
+        file_names = list(DrawLink.objects.filter( #pylint: disable=no-member
+            chain__player__game=game,
+        ).values_list('drawing', flat=True).distinct())
+
+        # Delete from the leaves up, so that no cascades are needed.
+        metrics['draw_links'] += delete_in_batches(
+            DrawLink.objects.filter(chain__player__game=game), batch_size) #pylint: disable=no-member
+        metrics['write_links'] += delete_in_batches(
+            WriteLink.objects.filter(chain__player__game=game), batch_size) #pylint: disable=no-member
+        search.unindex_chains(Chain.objects.filter( #pylint: disable=no-member
+            player__game=game,
+        ).values_list('pk', flat=True))
+        metrics['chains'] += delete_in_batches(
+            Chain.objects.filter(player__game=game), batch_size) #pylint: disable=no-member
+        delete_in_batches(
+            UploadChunk.objects.filter(upload__player__game=game), batch_size) #pylint: disable=no-member
+        delete_in_batches(Upload.objects.filter(player__game=game), batch_size) #pylint: disable=no-member
+        delete_in_batches(
+            IdempotencyKey.objects.filter(player__game=game), batch_size) #pylint: disable=no-member
+        metrics['players'] += delete_in_batches(
+            Player.objects.filter(game=game), batch_size) #pylint: disable=no-member
+        metrics['events'] += delete_in_batches(
+            GameEvent.objects.filter(game=game), batch_size) #pylint: disable=no-member
+        Game.objects.filter(pk=game.pk).delete() #pylint: disable=no-member
+        metrics['games'] += 1
+        metrics['files'] += len(file_names)
+        delete_files.enqueue(file_names=file_names)
+    return True
+# }}}
+
+# reap {{{
+def reap(lobby_after=None, stalled_after=None, limit=None, batch_size=500, dry_run=False,
+         upload_after=None):
+    """
+    Delete up to limit abandoned lobbies and up to limit stalled games from
+    each shard, each game in its own short transaction, and every upload
+    older than upload_after. Return a dict of metrics: the number of games,
+    players, chains, links, uploads and files deleted (or, in a dry run,
+    found), and the number of games skipped because they became active
+    again.
+    """
+    lobby_after = lobby_after or lobby_timeout()
+    stalled_after = stalled_after or stalled_timeout()
+    upload_after = upload_after or upload_timeout()
+    metrics = {
+        'lobbies': 0,
+        'stalled': 0,
+        'games': 0,
+        'players': 0,
+        'chains': 0,
+        'write_links': 0,
+        'draw_links': 0,
+        'events': 0,
+        'uploads': 0,
+        'files': 0,
+        'skipped': 0,
+    }
+    for alias in sharding.get_shards():
+        with sharding.use_shard(alias):
+            reap_shard(lobby_after, stalled_after, limit, batch_size, dry_run, metrics)
+            reap_uploads(upload_after, batch_size, dry_run, metrics)
+
+    LOG.info('reaped games', dry_run=dry_run, **metrics)
+    return metrics
+
+def reap_shard(lobby_after, stalled_after, limit, batch_size, dry_run, metrics): #pylint: disable=too-many-arguments
+    """Reap the current shard, counting what was done in metrics."""
+    for kind, candidates in (('lobbies', abandoned_lobbies(lobby_after)),
+                             ('stalled', stalled_games(stalled_after))):
+        game_ids = candidates.order_by('last_activity').values_list('pk', flat=True)
+        if limit is not None:
+            game_ids = game_ids[:limit]
+        game_ids = list(game_ids)
+        metrics[kind] += len(game_ids)
+        if dry_run:
+            metrics['games'] += len(game_ids)
+            metrics['players'] += Player.objects.filter( #pylint: disable=no-member
+                game__in=game_ids).count()
+            metrics['chains'] += Chain.objects.filter( #pylint: disable=no-member
+                player__game__in=game_ids).count()
+            metrics['write_links'] += WriteLink.objects.filter( #pylint: disable=no-member
+                chain__player__game__in=game_ids).count()
+            metrics['draw_links'] += DrawLink.objects.filter( #pylint: disable=no-member
+                chain__player__game__in=game_ids).count()
+            metrics['files'] += DrawLink.objects.filter( #pylint: disable=no-member
+                chain__player__game__in=game_ids).values('drawing').distinct().count()
+            continue
+        for game_id in game_ids:
+            reap_game(candidates, game_id, batch_size, metrics)
+
+def reap_uploads(upload_after, batch_size, dry_run, metrics):
+    """
+    Delete the uploads on the current shard older than upload_after, with
+    their chunks, counting them in metrics.
+    """
+    upload_ids = list(abandoned_uploads(upload_after).values_list('pk', flat=True))
+    metrics['uploads'] += len(upload_ids)
+    if dry_run or not upload_ids:
+        return
+    for start in range(0, len(upload_ids), batch_size):
+        batch = upload_ids[start:start + batch_size]
+        with transaction.atomic(using=sharding.current_shard()):
+            UploadChunk.objects.filter(upload__in=batch).delete() #pylint: disable=no-member
+            Upload.objects.filter(pk__in=batch).delete() #pylint: disable=no-member
+# }}}
@@ -0,0 +1,82 @@
+"""Database routers for DrawWrite."""
+
+import random
+import threading
+
+from django.conf import settings
+
+# What the request being handled on this thread is allowed to read from,
+# and whether it has written. Set up by the ReadReplicas middleware.
+_state = threading.local()
+
+# The URL names, in the drawwrite namespace, of the views that only read.
+REPLICA_VIEWS = (
+    'showGame',
+    'showChain',
+    'showChainLinks',
+    'showResults',
+    'resultsDocument',
+    'getAvailableGames',
+    'searchChains',
+    'checkGameStart',
+    'checkRoundDone',
+    'checkGameDone',
+)
+
+def get_primary():
+    """Return the alias of the database that takes writes."""
+    return getattr(settings, 'DRAWWRITE_PRIMARY_DATABASE', 'default')
+
+def get_replicas():
+    """Return the aliases of the read replicas, from DRAWWRITE_READ_REPLICAS."""
+    return tuple(getattr(settings, 'DRAWWRITE_READ_REPLICAS', ()))
+
+def begin_request():
+    """Start routing a new request: read from the primary until told otherwise."""
+    _state.replica = None
+    _state.wrote = False
+
+def read_from_replica():
+    """Send this request's drawwrite reads to one of the replicas."""
+    replicas = get_replicas()
+    _state.replica = random.choice(replicas) if replicas else None
+
+def end_request():
+    """Stop routing the current request, and return whether it wrote."""
+    wrote = getattr(_state, 'wrote', False)
+    _state.replica = None
+    _state.wrote = False
+    return wrote
+
+class ReadReplicaRouter:
+    """
+    Send the reads of read-only drawwrite views to a replica, and everything
+    else to the primary.
+
+    The router only picks a replica when the ReadReplicas middleware has
+    said that the current request may use one, so reads outside of requests
+    (management commands, the shell) always see the primary.
+    """
+
+    def db_for_read(self, model, **hints): #pylint: disable=unused-argument
+        """Return the replica chosen for this request, if any."""
+        replica = getattr(_state, 'replica', None)
+        if replica is not None and model._meta.app_label == 'drawwrite': #pylint: disable=protected-access
+            return replica
+        return get_primary()
+
+    def db_for_write(self, model, **hints): #pylint: disable=unused-argument
+        """Return the primary, and remember that this request wrote."""
+        _state.wrote = True
+        return get_primary()
+
+    def allow_relation(self, obj1, obj2, **hints): #pylint: disable=unused-argument
+        """Allow relations between objects from the primary and its replicas."""
+        databases = (get_primary(),) + get_replicas()
+        if obj1._state.db in databases and obj2._state.db in databases: #pylint: disable=protected-access
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints): #pylint: disable=unused-argument
+        """Leave migrations to the default behaviour."""
+        return None
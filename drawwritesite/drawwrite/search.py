@@ -0,0 +1,278 @@
+"""Find chains by the words written in them.
+
+The index has one row per chain, holding the game and owner's names and
+ids and the text of the chain's write links, joined with newlines. It has
+no model, since each database keeps it its own way: SQLite in an FTS5
+table whose rowid is the chain id, PostgreSQL in a table with a GIN indexed
+'simple' tsvector, see migration 0014. Other databases have no index, and
+searching them finds nothing.
+
+new_write_link updates a chain's row in the transaction that adds the
+link, the reaper deletes the rows of the games it deletes, and archiving
+leaves the rows alone, since archived chains keep their URLs. The
+rebuild_search_index command fills the index from scratch.
+
+Searches run on every shard, and only show chains of finished games.
+"""
+
+# Imports {{{
+import json
+import re
+
+from django.conf import settings
+from django.db import connections, router
+
+from .models import ArchivedGame, Chain, Player
+from . import kvlog, sharding
+# }}}
+
+LOG = kvlog.get_logger(__name__)
+
+# Snippets mark the words that matched with these, see search().
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+# Settings {{{
+def page_size():
+    """Return the number of results on each page, from DRAWWRITE_SEARCH_PAGE_SIZE."""
+    return getattr(settings, 'DRAWWRITE_SEARCH_PAGE_SIZE', 20)
+
+def max_pages():
+    """
+    Return how many pages of results a search can go through, from
+    DRAWWRITE_SEARCH_MAX_PAGES. Each page reads every page before it, so
+    later pages get slower.
+    """
+    return getattr(settings, 'DRAWWRITE_SEARCH_MAX_PAGES', 10)
+
+def max_candidates():
+    """
+    Return how many of the newest chains that match a search are ranked on
+    each shard, from DRAWWRITE_SEARCH_CANDIDATES. Ranking reads every chain
+    it ranks, so this keeps common words as fast in a big index as in a
+    small one, at the cost of older chains only turning up for rarer words.
+    """
+    return getattr(settings, 'DRAWWRITE_SEARCH_CANDIDATES', 10000)
+
+def max_terms():
+    """Return how many words of a query are searched for, from DRAWWRITE_SEARCH_MAX_TERMS."""
+    return getattr(settings, 'DRAWWRITE_SEARCH_MAX_TERMS', 8)
+# }}}
+
+# Indexes {{{
+class SqliteIndex:
+    """The search index in an FTS5 table."""
+
+    @staticmethod
+    def save(cursor, row):
+        """Add or replace the row of a chain."""
+        cursor.execute(
+            'INSERT OR REPLACE INTO "drawwrite_search" '
+            '(rowid, game_id, game_name, player_id, player_name, text) '
+            'VALUES (%s, %s, %s, %s, %s, %s)',
+            row,
+        )
+
+    @staticmethod
+    def delete(cursor, chain_ids):
+        """Delete the rows of the given chains."""
+        cursor.execute(
+            'DELETE FROM "drawwrite_search" WHERE rowid IN ({0})'.format(
+                ', '.join(['%s'] * len(chain_ids))),
+            chain_ids,
+        )
+
+    @staticmethod
+    def search(cursor, words, candidates, limit):
+        """
+        Return the best limit rows of chains of finished games that have all
+        of words, out of the newest candidates chains that have them, best
+        first, as (rank, chain id, game id, game name, player id, player
+        name, snippet) tuples. Lower ranks are better.
+        """
+        match = ' '.join('"{0}"'.format(word) for word in words)
+        cursor.execute(
+            'SELECT s.rank, s.rowid, s.game_id, s.game_name, s.player_id, s.player_name, '
+            "snippet(s.drawwrite_search, 0, %s, %s, '...', 16) "
+            'FROM "drawwrite_search" s '
+            'LEFT JOIN "drawwrite_game" g ON g.id = s.game_id '
+            'WHERE s.drawwrite_search MATCH %s '
+            # FTS5 reads only the rows past a rowid bound, so ranking
+            # stops at the oldest candidate.
+            'AND s.rowid >= (SELECT min(rowid) FROM (SELECT rowid FROM "drawwrite_search" '
+            'WHERE drawwrite_search MATCH %s ORDER BY rowid DESC LIMIT %s)) '
+            'AND (g.id IS NULL OR g.round_num >= g.num_players) '
+            'ORDER BY s.rank LIMIT %s',
+            [MATCH_START, MATCH_END, match, match, candidates, limit],
+        )
+        return cursor.fetchall()
+
+class PostgresIndex:
+    """The search index in a table with a GIN indexed tsvector."""
+
+    @staticmethod
+    def save(cursor, row):
+        """Add or replace the row of a chain."""
+        cursor.execute(
+            'INSERT INTO "drawwrite_search" '
+            '(chain_id, game_id, game_name, player_id, player_name, text, document) '
+            "VALUES (%s, %s, %s, %s, %s, %s, to_tsvector('simple', %s)) "
+            'ON CONFLICT (chain_id) DO UPDATE '
+            'SET text = EXCLUDED.text, document = EXCLUDED.document',
+            list(row) + [row[-1]],
+        )
+
+    @staticmethod
+    def delete(cursor, chain_ids):
+        """Delete the rows of the given chains."""
+        cursor.execute('DELETE FROM "drawwrite_search" WHERE chain_id = ANY(%s)', [list(chain_ids)])
+
+    @staticmethod
+    def search(cursor, words, candidates, limit):
+        """See SqliteIndex.search."""
+        cursor.execute(
+            'SELECT -ts_rank(s.document, q), s.chain_id, s.game_id, s.game_name, '
+            's.player_id, s.player_name, ts_headline(%s, s.text, q, %s) '
+            'FROM (SELECT * FROM "drawwrite_search" '
+            'WHERE document @@ plainto_tsquery(%s, %s) ORDER BY chain_id DESC LIMIT %s) s '
+            'CROSS JOIN plainto_tsquery(%s, %s) q '
+            'LEFT JOIN "drawwrite_game" g ON g.id = s.game_id '
+            'WHERE g.id IS NULL OR g.round_num >= g.num_players '
+            'ORDER BY 1 LIMIT %s',
+            ['simple', 'StartSel={0}, StopSel={1}, MaxWords=16, MinWords=8'.format(
+                MATCH_START, MATCH_END), 'simple', ' '.join(words), candidates,
+             'simple', ' '.join(words), limit],
+        )
+        return cursor.fetchall()
+
+INDEXES = {
+    'sqlite': SqliteIndex,
+    'postgresql': PostgresIndex,
+}
+# }}}
+
+# Keeping the index {{{
+def chain_text(entries):
+    """Return the text to index for a chain's link list entries."""
+    return '\n'.join(entry['text'] for entry in entries if entry['type'] == 'write')
+
+def index_chain(chain):
+    """
+    Add or replace chain's row in the index on the current shard, from its
+    link list. Call it in the transaction that changes the list.
+    """
+    connection = connections[router.db_for_write(Chain, instance=chain)]
+    index = INDEXES.get(connection.vendor)
+    if index is None:
+        return
+    player_name, game_id, game_name = Player.objects.filter( #pylint: disable=no-member
+        pk=chain.player_id,
+    ).values_list('name', 'game_id', 'game__name').get()
+    with connection.cursor() as cursor:
+        index.save(cursor, (chain.pk, game_id, game_name, chain.player_id, player_name,
+                            chain_text(json.loads(chain.links))))
+
+def unindex_chains(chain_ids):
+    """Delete the rows of the given chains from the index on the current shard."""
+    connection = connections[router.db_for_write(Chain)]
+    index = INDEXES.get(connection.vendor)
+    chain_ids = list(chain_ids)
+    if index is None or not chain_ids:
+        return
+    with connection.cursor() as cursor:
+        index.delete(cursor, chain_ids)
+
+def rebuild(batch_size=500):
+    """
+    Index every chain on the current shard, live or archived, batch_size
+    chains or archived games at a time. Return the number of chains indexed.
+    """
+    connection = connections[router.db_for_write(Chain)]
+    index = INDEXES.get(connection.vendor)
+    if index is None:
+        LOG.warning('database has no search index', vendor=connection.vendor)
+        return 0
+    indexed = 0
+
+    last_id = 0
+    while True:
+        chains = list(Chain.objects.filter( #pylint: disable=no-member
+            pk__gt=last_id,
+        ).order_by('pk').values_list(
+            'pk', 'player__game_id', 'player__game__name', 'player_id', 'player__name', 'links',
+        )[:batch_size])
+        if not chains:
+            break
+        with connection.cursor() as cursor:
+            for row in chains:
+                index.save(cursor, row[:-1] + (chain_text(json.loads(row[-1])),))
+        indexed += len(chains)
+        last_id = chains[-1][0]
+
+    last_id = 0
+    while True:
+        archives = list(ArchivedGame.objects.filter( #pylint: disable=no-member
+            pk__gt=last_id,
+        ).order_by('pk').values_list('pk', 'document')[:batch_size])
+        if not archives:
+            break
+        with connection.cursor() as cursor:
+            for _, document in archives:
+                document = json.loads(document)
+                game = document['game']
+                for player in document['players']:
+                    if player['chain'] is None:
+                        continue
+                    index.save(cursor, (player['chain']['id'], game['id'], game['name'],
+                                        player['id'], player['name'],
+                                        chain_text(player['chain']['links'])))
+                    indexed += 1
+        last_id = archives[-1][0]
+
+    LOG.info('rebuilt search index', shard=sharding.current_shard(), chains=indexed)
+    return indexed
+# }}}
+
+# Searching {{{
+def terms(query):
+    """Return the words of query to search for, lowercased."""
+    return re.findall(r'\w+', query.lower())[:max_terms()]
+
+def search(query, page=1):
+    """
+    Return the given page of the chains of finished games, on every shard,
+    that have every word of query in their write links, best first out of
+    the newest max_candidates() such chains on each shard, and whether
+    there is a later page. Each result is a dict with the chain, game and
+    player ids, the game and player names, and a snippet of text with each
+    matching word between MATCH_START and MATCH_END.
+    """
+    words = terms(query)
+    if not words:
+        return [], False
+    limit = page * page_size() + 1
+    rows = []
+    for alias in sharding.get_shards():
+        with sharding.use_shard(alias):
+            connection = connections[router.db_for_read(Chain)]
+            index = INDEXES.get(connection.vendor)
+            if index is None:
+                continue
+            with connection.cursor() as cursor:
+                rows.extend(index.search(cursor, words, max_candidates(), limit))
+    rows.sort(key=lambda row: (row[0], row[1]))
+    start = (page - 1) * page_size()
+    results = [
+        {
+            'chain_id': chain_id,
+            'game_id': game_id,
+            'game': game_name,
+            'player_id': player_id,
+            'player': player_name,
+            'snippet': snippet,
+        }
+        for _, chain_id, game_id, game_name, player_id, player_name, snippet
+        in rows[start:start + page_size()]
+    ]
+    return results, len(rows) > start + page_size()
+# }}}
@@ -1,63 +1,88 @@
 """Provide database transaction services."""
 
 # Imports {{{
-import logging
+from datetime import timedelta
 
-from django.db import transaction
 from django.db import IntegrityError
+from django.utils import timezone
 
-from .models import Chain, DrawLink, Game, Player, WriteLink
-from .bracefmt import BraceFormatter as __
+from .models import Chain, DrawLink, Game, GameEvent, Player, WriteLink
+from . import events, kvlog, linklist, reaper, search, sharding
 # }}}
 
-LOG = logging.getLogger(__name__)
+LOG = kvlog.get_logger(__name__)
+
+# The start of every PNG file.
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
 
 # new_game {{{
-@transaction.atomic
-def new_game(name):
-    """Return a new game with name set to the passed name."""
+@sharding.atomic
+def new_game(name, pipelined=False, round_seconds=None):
+    """
+    Return a new game with name set to the passed name. In pipelined games
+    players don't wait for each other between rounds. Games with
+    round_seconds have that long to finish each round before missing links
+    are filled in, see drawwrite.deadlines.
+    """
 
-    LOG.debug(__('creating new game: {0}', name))
+    LOG.debug('creating new game', name=name)
     games_with_same_name = Game.objects.filter( #pylint: disable=no-member
         name=name,
     ).filter(
         started=False,
     )
     if games_with_same_name:
-        LOG.info(__('attempted to create duplicate game: {0}', name))
+        LOG.info('attempted to create duplicate game', name=name)
         return None
     try:
-        ret = Game(name=name)
+        ret = Game(
+            pk=sharding.allocate_id('game'),
+            name=name,
+            pipelined=pipelined,
+            round_seconds=round_seconds,
+        )
         ret.save()
+        events.record(
+            ret.pk,
+            GameEvent.CREATED,
+            name=name,
+            pipelined=pipelined,
+            round_seconds=round_seconds,
+        )
     except Exception as exception:
-        LOG.error(__('exception while creating game: {0}', exception))
+        LOG.error('exception while creating game', exception=exception)
         raise
-    LOG.debug(__('saved new game: {0}', name))
+    LOG.debug('saved new game', name=name)
     return ret
 # }}}
 
 # start_game {{{
-@transaction.atomic
+@sharding.atomic
 def start_game(game):
     """Set the game's 'started' attribute to True."""
 
     # TODO catch errors, log, and raise?
-    LOG.debug(__('starting game: {0}', game.pk))
+    LOG.debug('starting game', game_id=game.pk)
     game.started = True
+    game.last_activity = timezone.now()
+    set_round_deadline(game)
     game.save()
-    LOG.debug(__('saved game: {0}', game.pk))
+    events.record(game.pk, GameEvent.STARTED)
+    LOG.debug('saved game', game_id=game.pk)
     return
 # }}}
 
 # player_finished {{{
-@transaction.atomic
-def player_finished(player):
-    """Record that the given player has finished the current round."""
+@sharding.atomic
+def player_finished(player, round_num=None):
+    """
+    Record that the given player has finished the current round. round_num
+    is the round the player added a link for, by default the one read
+    with the player, and pipelined games refuse to move the player on from
+    any other.
+    """
 
-    LOG.debug(__(
-        'increasing the number of finished players for game {0}',
-        player.game.pk,
-    ))
+    LOG.debug('increasing the number of finished players', game_id=player.game.pk)
 
     # Make sure the game has started.
     if not player.game.started:
@@ -65,6 +90,13 @@ def player_finished(player):
             'The game must have started for a player to complete a round',
         )
 
+    if player.game.pipelined:
+        pipelined_player_finished(
+            player,
+            player.current_round if round_num is None else round_num,
+        )
+        return
+
     # Make sure the number of players who have finished isn't greater then the
     # number of players in the game.
     if player.game.num_finished_current_round >= player.game.num_players:
@@ -81,21 +113,63 @@ def player_finished(player):
 
     # Add one to the number of players who have finished the current round.
     player.game.num_finished_current_round += 1
+    player.game.last_activity = timezone.now()
     player.game.save()
 
     # Check if the round is complete.
     if player.game.num_finished_current_round == player.game.num_players:
         next_round(player.game)
 
-    LOG.debug(__('increased num_finished_current_round for game {0}', player.game.pk))
+    LOG.debug('increased num_finished_current_round', game_id=player.game.pk)
+# }}}
+
+# pipelined_player_finished {{{
+def pipelined_player_finished(player, expected_round):
+    """
+    Record that the given player of a pipelined game has added their link
+    for expected_round, which must still be their current round. Players of
+    pipelined games move through the rounds at their own pace, and the
+    game's round is the lowest round that every player has finished, so it
+    only moves on when the last player still on it finishes.
+    """
+
+    # Lock the game and read its latest counts, as players finish
+    # concurrently without a barrier between rounds. Then lock and re-read
+    # the player, whose round may have moved on since the caller read it.
+    game = Game.objects.select_for_update().get(pk=player.game.pk) #pylint: disable=no-member
+    locked = Player.objects.select_for_update().get(pk=player.pk) #pylint: disable=no-member
+    player.game = locked.game = game
+
+    if locked.current_round >= game.num_players:
+        raise IntegrityError('The player has already finished every round')
+
+    # Make sure that a concurrent submission hasn't already finished the
+    # round this link was added for.
+    if locked.current_round != expected_round:
+        raise IntegrityError('A players round is not the one their link was added for')
+
+    was_last_round = locked.current_round == game.round_num
+    locked.current_round += 1
+    locked.save(update_fields=['current_round'])
+    player.current_round = locked.current_round
+
+    if was_last_round:
+        game.num_finished_current_round += 1
+    game.last_activity = timezone.now()
+    game.save()
+
+    if game.num_finished_current_round == game.num_players:
+        next_round(game)
+
+    LOG.debug('player moved on', game_id=game.pk, player_id=player.pk, round=player.current_round)
 # }}}
 
 # next_round {{{
-@transaction.atomic
+@sharding.atomic
 def next_round(game):
     """Take a game to it's next round."""
 
-    LOG.debug(__('increasing round for game {0}', game.pk))
+    LOG.debug('increasing round', game_id=game.pk)
 
     # Make sure the game has started.
     if not game.started:
@@ -109,25 +183,58 @@ def next_round(game):
     # Increase the round, set num_players_finished_current_round to 0.
     game.round_num += 1
     game.num_finished_current_round = 0
+
+    # Players of pipelined games may already be past the new round.
+    if game.pipelined:
+        game.num_finished_current_round = Player.objects.filter( #pylint: disable=no-member
+            game=game,
+            current_round__gt=game.round_num,
+        ).count()
+    set_round_deadline(game)
     game.save()
+    events.record(game.pk, GameEvent.ROUND_ADVANCED, round=game.round_num)
+
+    LOG.debug('round increased', game_id=game.pk)
+# }}}
 
-    LOG.debug(__('round increased for game {0}', game.pk))
+# set_round_deadline {{{
+def set_round_deadline(game):
+    """
+    Set when the game's current round has to be finished by, if the game
+    has a round time limit, without saving the game.
+    """
+    if game.round_seconds is None or game.round_num >= game.num_players:
+        game.round_deadline = None
+    else:
+        game.round_deadline = timezone.now() + timedelta(seconds=game.round_seconds)
 # }}}
 
 # new_player {{{
-@transaction.atomic
+@sharding.atomic
 def new_player(game, name, was_creator):
     """
     Return a new player for the passed game and increase the game's number
     of players.
     """
 
-    LOG.debug(__('creating new player with name {0}', name))
+    LOG.debug('creating new player', name=name)
+
+    # Lock the game and read its latest state, so that the reaper can't
+    # delete it from under the new player, and concurrent joins don't take
+    # the same position.
+    locked = Game.objects.select_for_update().filter(pk=game.pk).first() #pylint: disable=no-member
+    if locked is None:
+        LOG.error('could not add player because the game is gone', name=name, game_id=game.pk)
+        raise GameNotFound('game {0} no longer exists'.format(game.pk))
+    game.started = game.started or locked.started
+    game.num_players = locked.num_players
+
     if game.started:
-        LOG.error(__(
-            'could not add player to game {0} because that game has already started',
-            name,
-        ))
+        LOG.error(
+            'could not add player because the game has already started',
+            name=name,
+            game_id=game.pk,
+        )
         raise GameAlreadyStarted(
             'It is not possible to add a player to a game that has already started',
         )
@@ -138,9 +245,11 @@ def new_player(game, name, was_creator):
         name=name,
     )
     if players_same_game_same_name:
-        LOG.error(__('player {0} already exists in game {1}', name, game.name))
-        raise NameTaken(__('player {0} already exists in game {1}', name, game.name))
+        LOG.error('player already exists in game', name=name, game=game.name)
+        raise NameTaken('player {0} already exists in game {1}'.format(name, game.name))
+
     ret = Player(
+        pk=sharding.allocate_id('player'),
         game=game,
         position=game.num_players,
         name=name,
@@ -149,25 +258,34 @@ def new_player(game, name, was_creator):
     ret.save()
     LOG.debug('saved player')
     game.num_players += 1
+    game.last_activity = timezone.now()
     game.save()
+    events.record(
+        game.pk,
+        GameEvent.JOINED,
+        player_id=ret.pk,
+        name=name,
+        position=ret.position,
+    )
     LOG.debug('increased game num_players by 1')
     return ret
 # }}}
 
 # new_chain {{{
-@transaction.atomic
+@sharding.atomic
 def new_chain(player):
     """Create a new chain for the given user."""
 
-    LOG.debug('creating new player')
+    LOG.debug('creating new chain', player_id=player.pk)
     ret = Chain(player=player)
     ret.save()
-    LOG.debug('saved new player')
+    LOG.debug('saved new chain', player_id=player.pk)
+
     return ret
 # }}}
 
 # new_draw_link {{{
-@transaction.atomic
+@sharding.atomic
 def new_draw_link(chain, file_obj, added_by):
     """
     Return a new draw link for the passed chain, or None if the next link
@@ -178,8 +296,11 @@ def new_draw_link(chain, file_obj, added_by):
     if chain.next_link_position % 2 == 0:
         LOG.error('attempted to create draw link at an invalid position')
         return None
+    width, height = png_size(file_obj)
     ret = DrawLink(
         drawing=file_obj,
+        width=width,
+        height=height,
         link_position=chain.next_link_position,
         chain=chain,
         added_by=added_by,
@@ -187,13 +308,31 @@ def new_draw_link(chain, file_obj, added_by):
     ret.save()
     LOG.debug('saved new draw link')
     chain.next_link_position += 1
+    linklist.append(chain, ret)
     chain.save()
     LOG.debug('increased chain link position')
+    record_link_added(ret)
     return ret
 # }}}
 
+# png_size {{{
+def png_size(file_obj):
+    """
+    Return the (width, height) from the header of a PNG file, or (None,
+    None) if file_obj isn't a file holding a PNG.
+    """
+    if not hasattr(file_obj, 'read'):
+        return None, None
+    file_obj.seek(0)
+    header = file_obj.read(24)
+    file_obj.seek(0)
+    if len(header) < 24 or not header.startswith(PNG_SIGNATURE) or header[12:16] != b'IHDR':
+        return None, None
+    return int.from_bytes(header[16:20], 'big'), int.from_bytes(header[20:24], 'big')
+# }}}
+
 # new_write_link {{{
-@transaction.atomic
+@sharding.atomic
 def new_write_link(chain, text, added_by):
     """
     Return a new write link for the passed chain, or None if the next link
@@ -212,11 +351,50 @@ def new_write_link(chain, text, added_by):
     ret.save()
     LOG.debug('saved new write link')
     chain.next_link_position += 1
+    linklist.append(chain, ret)
     chain.save()
     LOG.debug('increased chain link position')
+    search.index_chain(chain)
+    record_link_added(ret)
     return ret
 # }}}
 
+# record_link_added {{{
+def record_link_added(link):
+    """
+    Record that link was added to its chain. Links don't otherwise write to
+    their game's row, so this takes its lock by bumping last_activity.
+    """
+    game_id = link.added_by.game_id
+    Game.objects.filter(pk=game_id).update(last_activity=timezone.now()) #pylint: disable=no-member
+    events.record(
+        game_id,
+        GameEvent.LINK_ADDED,
+        link_id=link.pk,
+        chain_id=link.chain_id,
+        added_by=link.added_by_id,
+        position=link.link_position,
+    )
+# }}}
+
+# available_games {{{
+def available_games():
+    """
+    Return the names of the games that may be joined, oldest first. Every
+    shard is asked, and lobbies that have been idle for longer than the
+    reaper allows are left out.
+    """
+    cutoff = timezone.now() - reaper.lobby_timeout()
+    games = []
+    for alias in sharding.get_shards():
+        with sharding.use_shard(alias):
+            games.extend(Game.objects.filter( #pylint: disable=no-member
+                started=False,
+                last_activity__gte=cutoff,
+            ).values_list('time_created', 'name'))
+    return [name for _, name in sorted(games)]
+# }}}
+
 # GameAlreadyStarted {{{
 class GameAlreadyStarted(IntegrityError): #pylint: disable=too-few-public-methods
     """
@@ -262,6 +440,18 @@ class WaitForPlayers(IntegrityError): #pylint: disable=too-few-public-methods
         self.message = message
 #}}}
 
+# GameNotFound {{{
+class GameNotFound(IntegrityError): #pylint: disable=too-few-public-methods
+    """
+    Raised when a game is deleted, for instance by the reaper, while a player
+    is trying to join it.
+    """
+
+    def __init__(self, message):
+        super(GameNotFound, self).__init__(message)
+        self.message = message
+# }}}
+
 # NameTaken {{{
 class NameTaken(IntegrityError): #pylint: disable=too-few-public-methods
     """
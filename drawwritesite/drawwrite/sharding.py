@@ -0,0 +1,147 @@
+"""Partition games across several databases by game id.
+
+Sharding is turned on by listing database aliases in DRAWWRITE_SHARDS and
+adding ShardRouter to DATABASE_ROUTERS. A game and all of its players,
+chains and links live on one shard. New games go to the shard that their
+name hashes to, so that joining by name finds them directly, and games and
+players get ids whose remainder modulo MAX_SHARDS is the index of their
+shard, so that id URLs find their shard without a lookup.
+
+Queries are routed to the shard that the current thread is working on,
+which views pick with shard_by or use_shard. Everything that isn't a
+drawwrite model, like sessions and users, stays on 'default'.
+"""
+
+import functools
+import threading
+import zlib
+
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+# Ids are spread over this many slots, so this is the most shards there can
+# ever be. Changing it changes the shard of every existing id.
+MAX_SHARDS = 64
+
+_state = threading.local()
+
+# Configuration {{{
+def get_shards():
+    """Return the database aliases of the shards, in shard index order."""
+    return tuple(getattr(settings, 'DRAWWRITE_SHARDS', None) or ('default',))
+
+def is_sharded():
+    """Return whether DRAWWRITE_SHARDS is configured."""
+    return bool(getattr(settings, 'DRAWWRITE_SHARDS', None))
+# }}}
+
+# Picking shards {{{
+def shard_for_name(name):
+    """
+    Return the shard that a game called name is created on. Adding shards
+    moves where names hash to, so it strands unstarted lobbies; add them
+    when the site is quiet.
+    """
+    shards = get_shards()
+    return shards[zlib.crc32(name.encode('utf-8')) % len(shards)]
+
+def shard_for_id(object_id):
+    """
+    Return the shard of a game or player id. Ids from shards that aren't
+    configured map to the first shard, where they won't be found.
+    """
+    shards = get_shards()
+    index = int(object_id) % MAX_SHARDS
+    return shards[index] if index < len(shards) else shards[0]
+
+def current_shard():
+    """Return the shard that this thread is working on."""
+    return getattr(_state, 'shard', None) or get_shards()[0]
+
+def set_shard(alias):
+    """Make the rest of this shard_by or use_shard block work on alias."""
+    _state.shard = alias
+
+@contextmanager
+def use_shard(alias):
+    """Work on the shard alias for the length of the block."""
+    previous = getattr(_state, 'shard', None)
+    _state.shard = alias
+    try:
+        yield alias
+    finally:
+        _state.shard = previous
+
+def shard_by(kwarg=None):
+    """
+    Decorate a view so that it works on the shard of its kwarg URL argument,
+    a game or player id. Without kwarg the view picks its own shard with
+    set_shard, which is forgotten when the view returns.
+    """
+    def decorator(view):
+        """Wrap view."""
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            """Call view on the right shard."""
+            alias = shard_for_id(kwargs[kwarg]) if kwarg is not None else current_shard()
+            with use_shard(alias):
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def atomic(func):
+    """Like transaction.atomic, but on the shard that func is called on."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        """Call func in a transaction on the current shard."""
+        with transaction.atomic(using=current_shard()):
+            return func(*args, **kwargs)
+    return wrapper
+# }}}
+
+# allocate_id {{{
+def allocate_id(name):
+    """
+    Return a new id for the sharded model called name on the current shard,
+    or None to let the database pick one when sharding is off. Must be
+    called inside a transaction on the current shard.
+    """
+    if not is_sharded():
+        return None
+    from .models import ShardSequence
+    alias = current_shard()
+    sequence, _ = ShardSequence.objects.using(alias).select_for_update().get_or_create(name=name) #pylint: disable=no-member
+    sequence.last_value += 1
+    sequence.save(using=alias, update_fields=['last_value'])
+    return sequence.last_value * MAX_SHARDS + get_shards().index(alias)
+# }}}
+
+# ShardRouter {{{
+class ShardRouter:
+    """Route drawwrite models to the current shard, and the rest to 'default'."""
+
+    def db_for_read(self, model, **hints):
+        """Return the shard of the instance in hints, or the current shard."""
+        if model._meta.app_label != 'drawwrite': #pylint: disable=protected-access
+            return 'default'
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db: #pylint: disable=protected-access
+            return instance._state.db #pylint: disable=protected-access
+        return current_shard()
+
+    def db_for_write(self, model, **hints):
+        """Writes go where reads do."""
+        return self.db_for_read(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints): #pylint: disable=unused-argument
+        """Only allow relations within one database."""
+        return obj1._state.db == obj2._state.db #pylint: disable=protected-access
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints): #pylint: disable=unused-argument
+        """Put drawwrite's tables on every shard, and the rest on 'default'."""
+        if app_label == 'drawwrite':
+            return db in get_shards()
+        return db == 'default'
+# }}}
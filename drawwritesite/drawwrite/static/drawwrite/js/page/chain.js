@@ -0,0 +1,71 @@
+var drawwriteChain = (function () {
+
+    // Seems like a good idea.
+    "use strict";
+
+    // Variables!
+    var observer, loading;
+
+    // Append the next page of links to the chain, and point the 'More' link
+    // at the page after it, or remove it if that was the last page.
+    function loadMore() {
+        var more = $('.moreLinks');
+        if(loading || more.length === 0) {
+            return;
+        }
+        loading = true;
+        $.get(more.data('fragment-url'), function(data) {
+            $('.chainLinks').append(data.html);
+            if(data.next) {
+                more.data('fragment-url', data.next);
+                watch();
+            } else {
+                $('.moreLinksHolder').remove();
+            }
+        }).always(function() {
+            loading = false;
+        });
+    }
+
+    // Load the next page when the 'More' link scrolls into view. Watching
+    // it afresh reports it at once if it is still in view.
+    function watch() {
+        var holder = $('.moreLinksHolder').get(0);
+        if(!observer || !holder) {
+            return;
+        }
+        observer.unobserve(holder);
+        observer.observe(holder);
+    }
+
+    // Attach event listeners.
+    function attachEventListeners() {
+        $('.moreLinks').on('click', function(e) {
+            e.preventDefault();
+            loadMore();
+        });
+        if('IntersectionObserver' in window) {
+            observer = new IntersectionObserver(function(entries) {
+                for(var i = 0; i < entries.length; i++) {
+                    if(entries[i].isIntersecting) {
+                        loadMore();
+                    }
+                }
+            }, {rootMargin: '200px'});
+            watch();
+        }
+    }
+
+    // Called on document ready.
+    function init() {
+        attachEventListeners();
+    }
+
+    // Return the init function.
+    return {
+        init: init,
+    };
+}());
+
+// Attach the event listeners.
+$(document).ready(drawwriteChain.init);
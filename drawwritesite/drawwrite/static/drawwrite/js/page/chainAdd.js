@@ -1,13 +1,13 @@
-// Test whether the canvas wrapper exists on this page. If not, there's no
+// Test whether the canvas wrapper is shown on this page. If not, there's no
 // need to do anything.
 var canvasExists = (function () {
 
     // Seems like a good idea.
     "use strict";
 
-    // Return whether the canvas exists or not.
+    // Return whether the canvas is shown or not.
     function test() {
-        if($('#drawwriteCanvasWrapper').length > 0) {
+        if($('#drawwriteCanvasWrapper').is(':visible')) {
             return true;
         } else {
             return false;
@@ -315,6 +315,7 @@ var initCanvas = (function () {
     // Create the canvas element, and make it the only child of the #drawwriteCanvasHolder div.
     function makeCanvas() {
         var canvasHolder = $('#drawwriteCanvasHolder');
+        canvasHolder.empty();
         canvas = document.createElement('canvas');
         canvas.id = 'drawwriteCanvas';
         canvas.width = canvasHolder.width();
@@ -376,10 +377,13 @@ var initMisc = (function () {
     "use strict";
 
     // Variables!
-    var canvasTop, canvasLeft;
+    var canvasTop, canvasLeft, attached;
 
-    // Function to turn a canvas into a data-url.
+    // Function to turn a canvas into a data-url, if the task is a drawing.
     function makeDataUrl(e) {
+        if($('#imgDataHolder').prop('disabled')) {
+            return;
+        }
         var canvas = document.getElementById('drawwriteCanvas');
         var data = canvas.toDataURL('image/png');
         $('#imgDataHolder').attr('value', data);
@@ -409,10 +413,14 @@ var initMisc = (function () {
         canvasLeft = $('.canvas-menu').offset().left;
     }
 
-    // Attach event listeners.
+    // Attach event listeners, once, as the page may show several drawings.
     function attachEventListeners() {
+        if(attached) {
+            return;
+        }
         $('#postForm').submit(makeDataUrl);
         $(window).scroll(keepDrawMenuVisible);
+        attached = true;
     }
 
     // Initialize variables, attach event handlers.
@@ -421,6 +429,139 @@ var initMisc = (function () {
         attachEventListeners();
     }
 
+    // Return the init function.
+    return {
+        init: init,
+        makeDataUrl: makeDataUrl,
+    };
+}());
+
+// Submit the link with an XHR, and show what to do next from the response
+// instead of following a redirect to the next page.
+var initSubmit = (function () {
+
+    // Seems like a good idea.
+    "use strict";
+
+    // Variables!
+    var form;
+
+    // Show the waiting area in place of the task, and poll until the wait
+    // is over. The response that says so carries the next move.
+    function wait(move) {
+        var timer, over;
+        $('.prevLinkHolder, #postForm').addClass('hidden');
+        $('.stillPlayingWrapper').empty();
+        $('.waitingArea').removeClass('hidden');
+
+        function poll() {
+            $.get(move.poll_url, function(data) {
+                if(over) {
+                    return;
+                }
+                if(data.finished === true) {
+                    over = true;
+                    window.clearInterval(timer);
+                    handleMove(data.next || move);
+                    return;
+                }
+                $('.stillPlayingWrapper').empty();
+                for(var i = 0; i < (data.still_playing || []).length; i++) {
+                    var nameHolder = document.createElement('div');
+                    nameHolder.innerText = data.still_playing[i];
+                    $(nameHolder).addClass('indent');
+                    $('.stillPlayingWrapper').append(nameHolder);
+                }
+            });
+        }
+        timer = window.setInterval(poll, 2500);
+        poll();
+    }
+
+    // Show the previous link of the next task, and the input for adding
+    // after it.
+    function showTask(move) {
+        var holder, content, drawing;
+        holder = $('.prevLinkHolder');
+        content = $('<div class="indented"></div>');
+        drawing = move.prev_link_type === 'write';
+        holder.empty();
+        holder.append($('<h3 class="text-center">Add</h3>'));
+        if(drawing) {
+            holder.append($('<h4>Previous player\'s writing:</h4>'));
+            content.append($('<p></p>').text(move.prev_link.text));
+        } else {
+            holder.append($('<h4>Previous player\'s drawing:</h4>'));
+            content.append($('<img class="boxed scaleImage">').attr('src', move.prev_link.drawing));
+        }
+        holder.append(content);
+
+        $('.drawInput').toggleClass('hidden', !drawing);
+        $('#imgDataHolder').prop('disabled', !drawing).attr('value', '');
+        $('.writeInput').toggleClass('hidden', drawing);
+        $('#id_description').prop('disabled', drawing).val('');
+        form.find('input[type=submit]').prop('disabled', false);
+
+        $('.waitingArea').addClass('hidden');
+        $('.prevLinkHolder, #postForm').removeClass('hidden');
+        if(drawing) {
+            initCanvas.init();
+            initMisc.init();
+        }
+        window.scrollTo(0, 0);
+    }
+
+    // Show a task once the drawing it adds after, if any, has loaded in the
+    // background, so that the switch happens with the whole task at hand.
+    function preloadTask(move) {
+        var image;
+        if(move.prev_link_type !== 'draw') {
+            showTask(move);
+            return;
+        }
+        image = new Image();
+        image.onload = image.onerror = function() {
+            showTask(move);
+        };
+        image.src = move.prev_link.drawing;
+    }
+
+    // Act on the player's next move.
+    function handleMove(move) {
+        if(move.state === 'roundWaiting' || move.state === 'gameWaiting') {
+            wait(move);
+        } else if(move.state === 'add' && move.prev_link) {
+            preloadTask(move);
+        } else {
+            location.assign(move.url);
+        }
+    }
+
+    // Post the form. If that fails, fall back to a normal submit, which is
+    // safe to repeat.
+    function submit(e) {
+        e.preventDefault();
+        // A drawing shown in place is set up after this handler, so its
+        // data-url isn't made yet.
+        initMisc.makeDataUrl();
+        form.find('input[type=submit]').prop('disabled', true);
+        $.ajax({
+            url: form.attr('action'),
+            method: 'POST',
+            data: form.serialize(),
+            dataType: 'json',
+        }).done(handleMove).fail(function() {
+            form.off('submit', submit);
+            form.get(0).submit();
+        });
+    }
+
+    // Attach event listeners.
+    function init() {
+        form = $('#postForm');
+        form.on('submit', submit);
+    }
+
     // Return the init function.
     return {
         init: init,
@@ -433,4 +574,5 @@ $(document).ready(function () {
         initCanvas.init();
         initMisc.init();
     }
+    initSubmit.init();
 });
@@ -1,12 +1,34 @@
 var drawwriteRoundWaiting = (function () {
 
+    // Whether the round is over and the page is moving on.
+    var movingOn = false;
+
+    // Move on to the next move, once the drawing it adds after, if any, is
+    // in the browser's cache.
+    function moveOn(move) {
+        var image;
+        movingOn = true;
+        if(!move || move.state !== 'add' || move.prev_link_type !== 'draw') {
+            location.reload();
+            return;
+        }
+        image = new Image();
+        image.onload = image.onerror = function() {
+            location.assign(move.url);
+        };
+        image.src = move.prev_link.drawing;
+    }
+
     // Send an AJAX request to see if every user has finished the
-    // round. If so, reload the page to move to the next round. If not,
-    // add all the players who haven't finished the round to the list.
+    // round. If so, move to the next round. If not, add all the players
+    // who haven't finished the round to the list.
     function checkRoundComplete() {
         $.get(drawwriteAjaxUrl, function(data) {
+            if(movingOn) {
+                return;
+            }
             if(data.finished === true) {
-                location.reload();
+                moveOn(data.next);
             } else {
                 $('.stillPlayingWrapper').empty();
                 for(var i = 0; i < data.still_playing.length; i++) {
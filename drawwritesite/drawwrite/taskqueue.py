@@ -0,0 +1,172 @@
+"""A small task queue that keeps its tasks in the database.
+
+Functions become tasks with the task decorator, and are queued with
+``func.enqueue(**kwargs)`` inside the transaction whose commit should
+trigger them. Arguments must be JSON serializable, and tasks must be safe
+to run more than once, since a task whose worker dies runs again once its
+visibility timeout passes.
+
+DRAWWRITE_TASK_MODE picks how tasks run:
+
+    'sync' (the default) runs each task in-process as soon as the
+    transaction that queued it commits, which needs no worker.
+
+    'queue' saves each task as a Task row in the same transaction, for the
+    run_tasks management command to run with retries.
+"""
+
+# Imports {{{
+import functools
+import importlib
+import json
+import traceback
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+from . import kvlog, sharding
+# }}}
+
+LOG = kvlog.get_logger(__name__)
+
+# The modules that define tasks, which the worker imports so that their
+# tasks are registered. DRAWWRITE_TASK_MODULES adds more.
+TASK_MODULES = ('drawwrite.archive',)
+
+# Registered tasks, by name, as (function, max attempts) pairs.
+REGISTRY = {}
+
+# Registering and queueing {{{
+def task(max_attempts=3):
+    """
+    Register the decorated function as a task that is tried up to
+    max_attempts times, and give it an enqueue method.
+    """
+    def decorator(func):
+        """Register func."""
+        name = '{0}.{1}'.format(func.__module__, func.__name__)
+        REGISTRY[name] = (func, max_attempts)
+        func.enqueue = functools.partial(enqueue, name)
+        return func
+    return decorator
+
+def get_mode():
+    """Return DRAWWRITE_TASK_MODE, 'sync' or 'queue'."""
+    return getattr(settings, 'DRAWWRITE_TASK_MODE', 'sync')
+
+def enqueue(name, **kwargs):
+    """
+    Queue the task called name to run with kwargs once the current
+    transaction on the current shard commits.
+    """
+    func, max_attempts = REGISTRY[name]
+    arguments = json.dumps(kwargs, sort_keys=True)
+    alias = sharding.current_shard()
+    if get_mode() == 'sync':
+        transaction.on_commit(lambda: run_inline(name, func, kwargs), using=alias)
+        return
+    Task.objects.using(alias).create( #pylint: disable=no-member
+        name=name,
+        arguments=arguments,
+        max_attempts=max_attempts,
+    )
+    LOG.debug('queued task', name=name)
+
+def run_inline(name, func, kwargs):
+    """Run a task in sync mode, logging instead of raising failures."""
+    try:
+        func(**kwargs)
+    except Exception: #pylint: disable=broad-except
+        LOG.exception('task failed', name=name)
+# }}}
+
+# Running queued tasks {{{
+def load_task_modules():
+    """Import every module that defines tasks."""
+    for module in TASK_MODULES + tuple(getattr(settings, 'DRAWWRITE_TASK_MODULES', ())):
+        importlib.import_module(module)
+
+def claim(limit, visibility_timeout, now=None):
+    """
+    Claim up to limit tasks on the current shard that are due, hiding each
+    from other workers for visibility_timeout seconds, and return them.
+    Claims are conditional updates, so two workers never claim one task.
+    """
+    now = now or timezone.now()
+    due = Task.objects.filter( #pylint: disable=no-member
+        status=Task.QUEUED,
+        available_at__lte=now,
+    ).order_by('available_at').values_list('pk', 'available_at')[:limit]
+    claimed = []
+    for task_id, available_at in list(due):
+        updated = Task.objects.filter( #pylint: disable=no-member
+            pk=task_id,
+            status=Task.QUEUED,
+            available_at=available_at,
+        ).update(
+            available_at=now + timedelta(seconds=visibility_timeout),
+            attempts=F('attempts') + 1,
+        )
+        if updated:
+            claimed.append(task_id)
+    return list(Task.objects.filter(pk__in=claimed).order_by('pk')) #pylint: disable=no-member
+
+def run_task(queued):
+    """
+    Run a claimed task on the current shard. Delete it when it succeeds,
+    and otherwise retry it with exponential backoff until it has been
+    tried max_attempts times. Return whether it succeeded.
+    """
+    registered = REGISTRY.get(queued.name)
+    try:
+        if registered is None:
+            raise LookupError('no task called {0}'.format(queued.name))
+        registered[0](**json.loads(queued.arguments))
+    except Exception: #pylint: disable=broad-except
+        error = traceback.format_exc()
+        if queued.attempts >= queued.max_attempts:
+            LOG.error('task failed for good', name=queued.name, task_id=queued.pk)
+            Task.objects.filter(pk=queued.pk).update( #pylint: disable=no-member
+                status=Task.FAILED,
+                last_error=error,
+            )
+        else:
+            LOG.warning('task failed, will retry', name=queued.name, task_id=queued.pk)
+            Task.objects.filter(pk=queued.pk).update( #pylint: disable=no-member
+                available_at=timezone.now() + timedelta(seconds=2 ** queued.attempts),
+                last_error=error,
+            )
+        return False
+    Task.objects.filter(pk=queued.pk).delete() #pylint: disable=no-member
+    LOG.debug('task done', name=queued.name, task_id=queued.pk)
+    return True
+
+def run_in_thread(alias, queued):
+    """Run a claimed task from a worker thread, on the shard it came from."""
+    try:
+        with sharding.use_shard(alias):
+            return run_task(queued)
+    finally:
+        close_old_connections()
+
+def work(pool, batch_size, visibility_timeout):
+    """
+    Claim up to batch_size tasks from each shard and run them on pool's
+    threads. Return a dict of metrics.
+    """
+    metrics = {'claimed': 0, 'done': 0, 'failed': 0}
+    futures = []
+    for alias in sharding.get_shards():
+        with sharding.use_shard(alias):
+            claimed = claim(batch_size, visibility_timeout)
+        metrics['claimed'] += len(claimed)
+        futures.extend(pool.submit(run_in_thread, alias, queued) for queued in claimed)
+    for future in futures:
+        metrics['done' if future.result() else 'failed'] += 1
+    return metrics
+# }}}
@@ -2,22 +2,123 @@
 """The tests for DrawWrite."""
 
 # Imports {{{
+import asyncio
 import datetime
+import functools
+import io
+import json
 import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
 from unittest import mock
 
+from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.files.storage import Storage
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.http import HttpResponse
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
 from django.utils import timezone
 
-from .models import Chain, DrawLink, Game, Player, WriteLink
-from .forms import IndexForm
-from . import services
+from .models import (
+    ArchivedGame,
+    ArchivedPlayer,
+    Chain,
+    DrawLink,
+    Game,
+    GameEvent,
+    IdempotencyKey,
+    Player,
+    ShardSequence,
+    Task,
+    Upload,
+    UploadChunk,
+    WriteLink,
+)
+from .forms import CreateGameForm
+from . import (
+    admission, api, archive, asgi, deadlines, events, kvlog, linklist, middleware, reaper,
+    services, sharding, taskqueue, uploads, urls, warmup,
+)
+from .management.commands import slow_query_report
 # }}}
 
 logging.disable(logging.CRITICAL)
 
+# Game builders {{{
+def add_next_link(player_id):
+    """
+    Add the next link that the given player owes, the same way the views do,
+    and mark the player as finished with the round.
+    """
+    player = Player.objects.select_related('game').get(pk=player_id) #pylint: disable=no-member
+    game = player.game
+    chain = Chain.objects.get( #pylint: disable=no-member
+        player__game=game,
+        player__position=(player.position + player.current_round) % game.num_players,
+    )
+    if chain.next_link_position % 2 == 0:
+        services.new_write_link(chain, 'text from {0}'.format(player.name), player)
+    else:
+        services.new_draw_link(chain, 'link-{0}.png'.format(player.pk), player)
+    services.player_finished(player)
+
+def build_game(name, num_players, rounds=0, extra_finishers=0, start=True, pipelined=False):
+    """
+    Return a game with num_players players that has played the given number
+    of whole rounds, plus one more link from each of the first
+    extra_finishers players.
+    """
+    game = services.new_game(name, pipelined=pipelined)
+    players = [
+        services.new_player(game, 'player{0}'.format(i), i == 0)
+        for i in range(num_players)
+    ]
+    if not start:
+        return game
+    services.start_game(game)
+    for player in players:
+        services.new_chain(player)
+    for _ in range(rounds):
+        for player in players:
+            add_next_link(player.pk)
+    for player in players[:extra_finishers]:
+        add_next_link(player.pk)
+    game.refresh_from_db()
+    return game
+
+def player_ids(game):
+    """Return the ids of the game's players, in position order."""
+    return list(Player.objects.filter( #pylint: disable=no-member
+        game=game,
+    ).order_by('position').values_list('pk', flat=True))
+# }}}
+
+# TempMediaMixin {{{
+class TempMediaMixin:
+    """Keep the drawings that tests store in a throwaway directory."""
+
+    def setUp(self):
+        """Point MEDIA_ROOT at a new directory that is deleted after the test."""
+        super(TempMediaMixin, self).setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, True)
+        media_override = self.settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+# }}}
+
 # GameTests {{{
 class GameTests(TestCase):
     """Tests for manipulation of Games."""
@@ -137,7 +238,8 @@ class GameTests(TestCase):
         game = services.new_game(name='test')
         name = 'test player'
         services.new_player(game, name, True)
-        self.assertIs(services.new_player(game, name, True), None)
+        with self.assertRaises(services.NameTaken):
+            services.new_player(game, name, True)
 # }}}
 
 # ChainTests {{{
@@ -154,7 +256,11 @@ class ChainTests(TestCase):
         """
         Get a mocked storage system.
         """
-        return mock.MagicMock(spec=Storage, name='StorageMock')
+        storage = mock.MagicMock(spec=Storage, name='StorageMock')
+        # Like real storages, save under the name asked for.
+        storage.generate_filename.side_effect = lambda filename: filename
+        storage.save.side_effect = lambda name, content, max_length=None: name
+        return storage
 
     def test_chain_creation_is_successful(self):
         """
@@ -371,7 +477,7 @@ class IndexFormTests(TestCase):
         should be valid.
         """
         for test_case in self.valid_data:
-            form = IndexForm(data={
+            form = CreateGameForm(data={
                 'gamename': test_case,
                 'username': test_case,
             })
@@ -386,7 +492,7 @@ class IndexFormTests(TestCase):
         and spaces shouldn't be valid.
         """
         for test_case in self.invalid_data:
-            form = IndexForm(data={
+            form = CreateGameForm(data={
                 'gamename': test_case,
                 'username': test_case,
             })
@@ -395,3 +501,2634 @@ class IndexFormTests(TestCase):
             except AssertionError:
                 raise Exception('input: {0}'.format(test_case))
 # }}}
+
+# KeyValueLoggerTests {{{
+class KeyValueLoggerTests(SimpleTestCase):
+    """Tests for the structured, lazy logger."""
+
+    def setUp(self):
+        """
+        Re-enable logging and capture the records of a fresh logger.
+        """
+        logging.disable(logging.NOTSET)
+        self.records = []
+        self.log = kvlog.KeyValueLogger('drawwrite.tests.kvlog')
+        self.log.logger.setLevel(logging.DEBUG)
+        self.log.logger.propagate = False
+        handler = logging.Handler()
+        handler.emit = self.records.append
+        self.log.logger.addHandler(handler)
+        self.addCleanup(self.log.logger.removeHandler, handler)
+
+    def tearDown(self):
+        """
+        Disable logging again, like the rest of the tests expect.
+        """
+        logging.disable(logging.CRITICAL)
+
+    def test_disabled_level_does_not_format_fields(self):
+        """
+        Logging below the logger's level should never turn fields into strings.
+        """
+        self.log.logger.setLevel(logging.INFO)
+        field = mock.MagicMock()
+        with mock.patch.object(field, '__str__') as field_str:
+            self.log.debug('event', field=field)
+        self.assertEqual(self.records, [])
+        field_str.assert_not_called()
+
+    def test_record_has_event_and_fields(self):
+        """
+        Emitted records should carry the event, the fields, and a key=value
+        message.
+        """
+        self.log.info('got chain', player_id=3, game_id=7)
+        record = self.records[0]
+        self.assertEqual(record.event, 'got chain')
+        self.assertEqual(record.kv, {'player_id': 3, 'game_id': 7})
+        self.assertEqual(record.getMessage(), 'got chain game_id=7 player_id=3')
+
+    def test_record_is_attributed_to_caller(self):
+        """
+        Records should report the function that called the logger.
+        """
+        self.log.debug('event')
+        self.assertEqual(self.records[0].funcName, 'test_record_is_attributed_to_caller')
+
+    def test_sampling_drops_debug_but_not_errors(self):
+        """
+        A zero sample rate should drop DEBUG and INFO, but keep ERROR.
+        """
+        self.log.sample_rate = 0.0
+        self.log.debug('dropped')
+        self.log.info('dropped')
+        self.log.error('kept')
+        self.assertEqual([record.event for record in self.records], ['kept'])
+
+    def test_get_logger_reads_sample_rate_from_settings(self):
+        """
+        get_logger should use the rate configured for that logger's name.
+        """
+        with self.settings(DRAWWRITE_LOG_SAMPLING={'drawwrite.sampled': 0.25}):
+            self.assertEqual(kvlog.get_logger('drawwrite.sampled').sample_rate, 0.25)
+            self.assertEqual(kvlog.get_logger('drawwrite.other').sample_rate, 1.0)
+# }}}
+
+# QueryBudgetTests {{{
+# The most queries each view may run, and every table it may touch, across
+# all of the game phases built in QueryBudgetTests. Budgets must not depend
+# on the number of players, so that an N+1 fails the large game phase.
+QUERY_BUDGETS = {
+    'index': (4, {'drawwrite_game'}),
+    'joinGame': (10, {'drawwrite_game', 'drawwrite_player', 'drawwrite_gameevent',
+                      'django_session'}),
+    'createGame': (12, {'drawwrite_game', 'drawwrite_player', 'drawwrite_gameevent',
+                        'django_session'}),
+    'play': (4, {'drawwrite_game', 'drawwrite_player', 'drawwrite_chain'}),
+    'checkGameStart': (3, {'drawwrite_game', 'drawwrite_player'}),
+    'startGame': (6, {'drawwrite_game', 'drawwrite_player', 'drawwrite_gameevent'}),
+    'createLink': (20, {'drawwrite_game', 'drawwrite_player', 'drawwrite_chain',
+                        'drawwrite_writelink', 'drawwrite_drawlink', 'drawwrite_gameevent',
+                        'drawwrite_search'}),
+    'checkRoundDone': (4, {'drawwrite_game', 'drawwrite_player', 'drawwrite_chain'}),
+    'checkGameDone': (2, {'drawwrite_game', 'drawwrite_player'}),
+    'showGame': (2, {'drawwrite_game', 'drawwrite_player'}),
+    'showChain': (2, {'drawwrite_game', 'drawwrite_player', 'drawwrite_chain'}),
+    'showChainLinks': (2, {'drawwrite_game', 'drawwrite_player', 'drawwrite_chain'}),
+    'showResults': (2, {'drawwrite_game', 'drawwrite_player', 'drawwrite_chain'}),
+    'resultsDocument': (2, {'drawwrite_game', 'drawwrite_player', 'drawwrite_chain'}),
+    'getAvailableGames': (1, {'drawwrite_game'}),
+    'searchChains': (1, {'drawwrite_search', 'drawwrite_game'}),
+    'showArchivedDrawing': (1, {'drawwrite_archivedgame'}),
+    'gameEvents': (2, {'drawwrite_game', 'drawwrite_gameevent'}),
+    'warmUp': (2, {'drawwrite_game'}),
+    'apiCreateGame': (12, {'drawwrite_game', 'drawwrite_player', 'drawwrite_gameevent'}),
+    'apiJoinGame': (9, {'drawwrite_game', 'drawwrite_player', 'drawwrite_gameevent'}),
+    'apiLobby': (2, {'drawwrite_game', 'drawwrite_player'}),
+    'apiStartGame': (10, {'drawwrite_game', 'drawwrite_player', 'drawwrite_chain',
+                          'drawwrite_gameevent'}),
+    'apiTask': (3, {'drawwrite_game', 'drawwrite_player', 'drawwrite_chain',
+                    'drawwrite_writelink', 'drawwrite_drawlink'}),
+    'apiCreateLink': (18, {'drawwrite_game', 'drawwrite_player', 'drawwrite_chain',
+                           'drawwrite_writelink', 'drawwrite_drawlink', 'drawwrite_gameevent',
+                           'drawwrite_search'}),
+    'apiStartUpload': (4, {'drawwrite_game', 'drawwrite_player', 'drawwrite_chain',
+                           'drawwrite_writelink', 'drawwrite_drawlink', 'drawwrite_upload'}),
+    'apiUpload': (6, {'drawwrite_game', 'drawwrite_player', 'drawwrite_upload',
+                      'drawwrite_uploadchunk'}),
+    'apiResults': (2, {'drawwrite_game', 'drawwrite_player', 'drawwrite_chain',
+                       'drawwrite_archivedgame'}),
+}
+
+# Table names are quoted, which keeps words in quoted values from matching.
+TABLE_PATTERN = re.compile(r'(?:FROM|JOIN|UPDATE|INTO)\s+["`](\w+)["`]', re.IGNORECASE)
+
+class QueryBudgetTests(TempMediaMixin, TestCase):
+    """Make sure no view's query count grows past its budget in any phase."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Build one game in each phase, and remember which players to make
+        requests as. 'active' players owe a link this round, 'done' players
+        have already submitted theirs.
+        """
+        lobby = build_game('lobby', 3, start=False)
+        mid_round = build_game('mid_round', 4, rounds=1, extra_finishers=2)
+        waiting = build_game('waiting', 4, rounds=3, extra_finishers=3)
+        finished = build_game('finished', 4, rounds=4)
+        large = build_game('large', 32, rounds=31, extra_finishers=16)
+
+        def position(game, pos):
+            """Return the pk of the player at pos in game."""
+            return Player.objects.get(game=game, position=pos).pk #pylint: disable=no-member
+
+        # The first player is two rounds ahead and waiting on a chain, the
+        # last is still on the game's round.
+        pipelined = build_game('pipelined', 4, rounds=1, extra_finishers=2, pipelined=True)
+        add_next_link(position(pipelined, 0))
+
+        cls.phases = {
+            'lobby': (lobby.pk, {'creator': position(lobby, 0),
+                                 'joined': position(lobby, 2)}),
+            'mid_round': (mid_round.pk, {'done': position(mid_round, 0),
+                                         'active': position(mid_round, 3)}),
+            'waiting': (waiting.pk, {'done': position(waiting, 0),
+                                     'active': position(waiting, 3)}),
+            'finished': (finished.pk, {'done': position(finished, 0)}),
+            'large': (large.pk, {'done': position(large, 0),
+                                 'active': position(large, 31)}),
+            'pipelined': (pipelined.pk, {'done': position(pipelined, 0),
+                                         'active': position(pipelined, 3)}),
+        }
+
+    def assertWithinBudget(self, url_name, phase, make_request):
+        """
+        Call make_request inside a savepoint that is rolled back, and check
+        the queries it ran against url_name's budget.
+        """
+        max_queries, allowed_tables = QUERY_BUDGETS[url_name]
+        savepoint = transaction.savepoint()
+        try:
+            with CaptureQueriesContext(connection) as captured:
+                response = make_request()
+        finally:
+            transaction.savepoint_rollback(savepoint)
+        self.assertLess(response.status_code, 500)
+        sql = [query['sql'] for query in captured.captured_queries]
+        tables = set()
+        for statement in sql:
+            tables.update(TABLE_PATTERN.findall(statement))
+        details = '{0} in phase {1} ran {2} queries touching {3}:\n{4}'.format(
+            url_name,
+            phase,
+            len(sql),
+            sorted(tables),
+            '\n'.join('{0}. {1}'.format(i, statement) for i, statement in enumerate(sql, 1)),
+        )
+        self.assertLessEqual(len(sql), max_queries, details)
+        self.assertLessEqual(tables, allowed_tables, details)
+
+    def each_phase(self, url_name, make_request, roles=None):
+        """
+        Check url_name's budget for every phase, and for every player role
+        in roles that the phase has.
+        """
+        for phase, (game_id, players) in self.phases.items():
+            for role, player_id in players.items():
+                if roles is not None and role not in roles:
+                    continue
+                with self.subTest(phase=phase, role=role):
+                    self.assertWithinBudget(
+                        url_name,
+                        phase,
+                        functools.partial(make_request, game_id, player_id),
+                    )
+
+    def test_every_url_has_a_budget(self):
+        """
+        Every URL in drawwrite.urls should have a query budget.
+        """
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(names, set(QUERY_BUDGETS))
+
+    def test_index(self):
+        """The index should stay within its budget."""
+        self.each_phase('index', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:index')))
+
+    def test_join_game(self):
+        """Joining a game should stay within its budget."""
+        self.each_phase('joinGame', lambda game_id, player_id: self.client.post(
+            reverse('drawwrite:joinGame'),
+            {'username': 'newcomer', 'gamename': Game.objects.get(pk=game_id).name},
+        ))
+
+    def test_create_game(self):
+        """Creating a game should stay within its budget."""
+        self.each_phase('createGame', lambda game_id, player_id: self.client.post(
+            reverse('drawwrite:createGame'),
+            {'username': 'newcomer', 'gamename': 'brand-new-game'},
+        ))
+
+    def test_play(self):
+        """The play page should stay within its budget."""
+        self.each_phase('play', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:play', args=[player_id])))
+
+    def test_check_game_start(self):
+        """Polling for the game start should stay within its budget."""
+        self.each_phase('checkGameStart', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:checkGameStart', args=[player_id])))
+
+    def test_start_game(self):
+        """Starting a game should stay within its budget."""
+        self.each_phase('startGame', lambda game_id, player_id: self.client.post(
+            reverse('drawwrite:startGame', args=[player_id])), roles={'creator'})
+
+    def test_create_link(self):
+        """Submitting a link should stay within its budget."""
+        self.each_phase('createLink', lambda game_id, player_id: self.client.post(
+            reverse('drawwrite:createLink', args=[player_id]),
+            {'description': 'words', 'drawing': 'data:image/png;base64,iVBORw0KGgo='},
+        ), roles={'active'})
+
+    def test_create_link_json(self):
+        """Submitting a link with an XHR should stay within the same budget."""
+        self.each_phase('createLink', lambda game_id, player_id: self.client.post(
+            reverse('drawwrite:createLink', args=[player_id]),
+            {'description': 'words', 'drawing': 'data:image/png;base64,iVBORw0KGgo='},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        ), roles={'active'})
+
+    def test_check_round_done(self):
+        """Polling for the end of a round should stay within its budget."""
+        self.each_phase('checkRoundDone', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:checkRoundDone', args=[player_id])))
+
+    def test_check_game_done(self):
+        """Polling for the end of a game should stay within its budget."""
+        self.each_phase('checkGameDone', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:checkGameDone', args=[game_id])))
+
+    def test_show_game(self):
+        """Showing a game should stay within its budget."""
+        self.each_phase('showGame', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:showGame', args=[game_id])))
+
+    def test_show_chain(self):
+        """Showing a chain should stay within its budget."""
+        self.each_phase('showChain', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:showChain', args=[player_id])), roles={'done', 'active'})
+
+    def test_show_chain_links(self):
+        """Loading more of a chain should stay within its budget."""
+        self.each_phase('showChainLinks', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:showChainLinks', args=[player_id])), roles={'done', 'active'})
+
+    def test_show_results(self):
+        """Showing every chain of a game should stay within its budget."""
+        self.each_phase('showResults', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:showResults', args=[game_id])))
+
+    def test_results_document(self):
+        """Getting every chain of a game as JSON should stay within its budget."""
+        self.each_phase('resultsDocument', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:resultsDocument', args=[game_id])))
+
+    def test_get_available_games(self):
+        """Listing available games should stay within its budget."""
+        self.each_phase('getAvailableGames', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:getAvailableGames')))
+
+    def test_search_chains(self):
+        """Searching chains should stay within its budget."""
+        self.each_phase('searchChains', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:searchChains'), {'q': 'words'}))
+
+    def test_game_events(self):
+        """Reading a game's whole event log should stay within its budget."""
+        self.each_phase('gameEvents', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:gameEvents', args=[game_id])))
+
+    def test_warm_up(self):
+        """Warming up should stay within its budget."""
+        with self.settings(DRAWWRITE_WARM_UP_TOKEN='secret'):
+            self.each_phase('warmUp', lambda game_id, player_id: self.client.get(
+                reverse('drawwrite:warmUp'), HTTP_X_WARM_UP_TOKEN='secret'))
+
+    def test_api_create_game(self):
+        """Creating a game through the API should stay within its budget."""
+        self.each_phase('apiCreateGame', lambda game_id, player_id: self.client.post(
+            reverse('drawwrite:apiCreateGame'),
+            json.dumps({'game': 'brand-new-game', 'player': 'newcomer'}),
+            content_type='application/json',
+        ))
+
+    def test_api_join_game(self):
+        """Joining a game through the API should stay within its budget."""
+        self.each_phase('apiJoinGame', lambda game_id, player_id: self.client.post(
+            reverse('drawwrite:apiJoinGame'),
+            json.dumps({'game': Game.objects.get(pk=game_id).name, 'player': 'newcomer'}),
+            content_type='application/json',
+        ))
+
+    def test_api_lobby(self):
+        """Polling the lobby through the API should stay within its budget."""
+        self.each_phase('apiLobby', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:apiLobby', args=[api.get_signer().sign(str(player_id))])))
+
+    def test_api_start_game(self):
+        """Starting a game through the API should stay within its budget."""
+        self.each_phase('apiStartGame', lambda game_id, player_id: self.client.post(
+            reverse('drawwrite:apiStartGame', args=[api.get_signer().sign(str(player_id))]),
+        ), roles={'creator'})
+
+    def test_api_task(self):
+        """Fetching the current task should stay within its budget."""
+        self.each_phase('apiTask', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:apiTask', args=[api.get_signer().sign(str(player_id))])))
+
+    def test_api_create_link(self):
+        """Submitting a link through the API should stay within its budget."""
+        def make_request(game_id, player_id): #pylint: disable=unused-argument
+            """Submit whichever type of link the player owes."""
+            token = api.get_signer().sign(str(player_id))
+            return self.client.post(
+                reverse('drawwrite:apiCreateLink', args=[token]),
+                {'text': 'words', 'drawing': SimpleUploadedFile('d.png', services.PNG_SIGNATURE)},
+            )
+        self.each_phase('apiCreateLink', make_request, roles={'active'})
+
+    def test_api_start_upload(self):
+        """Starting an upload should stay within its budget."""
+        self.each_phase('apiStartUpload', lambda game_id, player_id: self.client.post(
+            reverse('drawwrite:apiStartUpload', args=[api.get_signer().sign(str(player_id))]),
+            json.dumps({'size': 100}),
+            content_type='application/json',
+        ))
+
+    def test_api_upload(self):
+        """Sending a chunk of an upload should stay within its budget."""
+        for phase, (game_id, players) in self.phases.items(): #pylint: disable=unused-variable
+            for role, player_id in players.items():
+                upload = uploads.start(Player.objects.get(pk=player_id), 100) #pylint: disable=no-member
+                url = reverse('drawwrite:apiUpload', args=[
+                    api.get_signer().sign(str(player_id)), upload.pk,
+                ])
+                with self.subTest(phase=phase, role=role):
+                    self.assertWithinBudget('apiUpload', phase, functools.partial(
+                        self.client.put, url + '?offset=0', b'chunk',
+                        content_type='application/octet-stream'))
+
+    def test_api_results(self):
+        """Reading a page of results should stay within its budget."""
+        self.each_phase('apiResults', lambda game_id, player_id: self.client.get(
+            reverse('drawwrite:apiResults', args=[game_id])))
+# }}}
+
+# ProfileRequestsTests {{{
+class ProfileRequestsTests(TestCase):
+    """Tests for the request profiling middleware and its report."""
+
+    def setUp(self):
+        """
+        Save profiles in a throwaway directory.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.factory = RequestFactory()
+
+    def get_response(self, request): #pylint: disable=unused-argument
+        """
+        A stand-in view that runs one query.
+        """
+        return HttpResponse(str(Game.objects.count())) #pylint: disable=no-member
+
+    def make_request(self, **extra):
+        """
+        Return a request for the show game page, as if it had been resolved.
+        """
+        path = reverse('drawwrite:showGame', args=[1])
+        request = self.factory.get(path, **extra)
+        request.resolver_match = resolve(path)
+        return request
+
+    def samples(self):
+        """
+        Return the names of the saved files for the show game view.
+        """
+        view_dir = os.path.join(self.directory, 'drawwrite.showGame')
+        if not os.path.isdir(view_dir):
+            return []
+        return sorted(os.listdir(view_dir))
+
+    def test_sampled_request_saves_profile_and_sql(self):
+        """
+        A sampled request should save a .pstats file and a .json file with
+        the captured SQL.
+        """
+        with self.settings(DRAWWRITE_PROFILE_DIR=self.directory,
+                           DRAWWRITE_PROFILE_SAMPLE_RATE=1.0):
+            middleware.ProfileRequests(self.get_response)(self.make_request())
+        names = self.samples()
+        self.assertEqual([name.rsplit('.', 1)[1] for name in names], ['json', 'pstats'])
+        with open(os.path.join(self.directory, 'drawwrite.showGame', names[0])) as sample:
+            data = json.load(sample)
+        self.assertEqual(data['status'], 200)
+        self.assertEqual(len(data['queries']), 1)
+        self.assertIn('drawwrite_game', data['queries'][0]['sql'])
+        self.assertEqual(data['queries'][0]['database'], 'default')
+
+    def test_old_samples_are_rotated(self):
+        """
+        Only the newest DRAWWRITE_PROFILE_KEEP samples should be kept.
+        """
+        with self.settings(DRAWWRITE_PROFILE_DIR=self.directory,
+                           DRAWWRITE_PROFILE_SAMPLE_RATE=1.0,
+                           DRAWWRITE_PROFILE_KEEP=2):
+            profile = middleware.ProfileRequests(self.get_response)
+            for _ in range(4):
+                profile(self.make_request())
+        self.assertEqual(len(self.samples()), 4)
+
+    def test_header_only_profiles_staff(self):
+        """
+        The profiling header should only be honored for staff users.
+        """
+        with self.settings(DRAWWRITE_PROFILE_DIR=self.directory):
+            profile = middleware.ProfileRequests(self.get_response)
+            request = self.make_request(HTTP_X_DRAWWRITE_PROFILE='1')
+            request.user = mock.Mock(is_staff=False)
+            profile(request)
+            self.assertEqual(self.samples(), [])
+            request = self.make_request(HTTP_X_DRAWWRITE_PROFILE='1')
+            request.user = mock.Mock(is_staff=True)
+            profile(request)
+            self.assertEqual(len(self.samples()), 2)
+
+    def test_report_writes_collapsed_stacks(self):
+        """
+        profile_report should write 'stack microseconds' lines that include
+        the profiled view.
+        """
+        with self.settings(DRAWWRITE_PROFILE_DIR=self.directory,
+                           DRAWWRITE_PROFILE_SAMPLE_RATE=1.0):
+            middleware.ProfileRequests(self.get_response)(self.make_request())
+            out = io.StringIO()
+            call_command('profile_report', stdout=out, stderr=io.StringIO())
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, micros = line.rsplit(' ', 1)
+            self.assertTrue(stack)
+            self.assertGreater(int(micros), 0)
+        self.assertTrue(any('(get_response)' in line for line in lines))
+# }}}
+
+# SlowQueryLogTests {{{
+class SlowQueryLogTests(TestCase):
+    """Tests for the slow query middleware and its report."""
+
+    def setUp(self):
+        """
+        Record every query as slow, into a throwaway file.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.path = os.path.join(directory, 'slow.jsonl')
+        override = self.settings(DRAWWRITE_SLOW_QUERY_MS=0, DRAWWRITE_SLOW_QUERY_LOG=self.path)
+        override.enable()
+        self.addCleanup(override.disable)
+        middleware_override = self.modify_settings(MIDDLEWARE={
+            'append': 'drawwrite.middleware.SlowQueryLog',
+        })
+        middleware_override.enable()
+        self.addCleanup(middleware_override.disable)
+        middleware.SlowQueryLog.plans.clear()
+
+    def entries(self):
+        """
+        Return the recorded slow queries.
+        """
+        with open(self.path) as log:
+            return [json.loads(line) for line in log]
+
+    def test_normalize_sql_hides_parameters(self):
+        """
+        Queries that differ only in parameters should normalize the same.
+        """
+        first = middleware.normalize_sql(
+            "SELECT * FROM t WHERE id IN (%s, %s) AND name = 'bob' AND n > 3")
+        second = middleware.normalize_sql(
+            "SELECT *  FROM t\nWHERE id IN (%s) AND name = 'alice' AND n > 10")
+        self.assertEqual(first, second)
+        self.assertEqual(first, 'SELECT * FROM t WHERE id IN (...) AND name = ? AND n > ?')
+
+    def test_drawwrite_view_queries_are_recorded_with_plan(self):
+        """
+        Queries from a drawwrite view should be recorded with the view name
+        and, for SELECTs, a query plan.
+        """
+        game = build_game('slow', 2, start=False)
+        self.client.get(reverse('drawwrite:showGame', args=[game.pk]))
+        entries = self.entries()
+        self.assertTrue(entries)
+        self.assertEqual({entry['view'] for entry in entries}, {'drawwrite:showGame'})
+        self.assertTrue(all(entry['plan'] for entry in entries))
+
+    def test_report_groups_by_fingerprint(self):
+        """
+        The report should group repeated queries under one fingerprint.
+        """
+        build_game('slow', 2, start=False)
+        for _ in range(3):
+            self.client.get(reverse('drawwrite:getAvailableGames'))
+        out = io.StringIO()
+        call_command('slow_query_report', '--json', stdout=out)
+        groups = json.loads(out.getvalue())
+        self.assertTrue(groups)
+        self.assertTrue(all(group['count'] == 3 for group in groups))
+
+    def test_report_flags_table_scans(self):
+        """
+        Plans that scan a table should be flagged, index searches should not.
+        """
+        lines = [
+            json.dumps({'fingerprint': 'a', 'sql': 'SELECT a', 'ms': 5, 'view': 'v',
+                        'plan': ['2 0 0 SCAN TABLE drawwrite_game']}),
+            json.dumps({'fingerprint': 'b', 'sql': 'SELECT b', 'ms': 1, 'view': 'v',
+                        'plan': ['2 0 0 SEARCH TABLE drawwrite_game USING INDEX x (name=?)']}),
+        ]
+        groups = slow_query_report.aggregate(lines)
+        self.assertEqual([(group['fingerprint'], group['table_scan']) for group in groups],
+                         [('a', True), ('b', False)])
+# }}}
+
+# AdminQueryTests {{{
+class AdminQueryTests(TestCase):
+    """Make sure the admin pages don't run more queries as tables grow."""
+
+    changelists = ['game', 'player', 'chain', 'writelink', 'drawlink']
+
+    def setUp(self):
+        """
+        Log in as a superuser and create a finished game.
+        """
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        self.game = build_game('first', 3, rounds=3)
+
+    def count_queries(self, url):
+        """
+        Return the number of queries made to get url.
+        """
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured)
+
+    def test_changelists_are_constant(self):
+        """
+        Every changelist should run the same number of queries no matter
+        how many rows it shows.
+        """
+        urls_to_check = [
+            reverse('admin:drawwrite_{0}_changelist'.format(name))
+            for name in self.changelists
+        ]
+        for url in urls_to_check:
+            self.client.get(url)
+        before = [self.count_queries(url) for url in urls_to_check]
+        build_game('second', 6, rounds=6)
+        after = [self.count_queries(url) for url in urls_to_check]
+        self.assertEqual(dict(zip(self.changelists, before)), dict(zip(self.changelists, after)))
+
+    def test_search_and_filters_work(self):
+        """
+        Searching by game name and filtering by finished should find the game.
+        """
+        build_game('other', 2)
+        url = reverse('admin:drawwrite_game_changelist')
+        response = self.client.get(url, {'q': 'first', 'finished': 'yes'})
+        self.assertEqual([game.pk for game in response.context['cl'].result_list], [self.game.pk])
+        response = self.client.get(url, {'finished': 'no'})
+        self.assertEqual([game.name for game in response.context['cl'].result_list], ['other'])
+
+    def test_change_pages_are_constant(self):
+        """
+        The game and chain change pages should run the same number of queries
+        no matter how many players or links they have.
+        """
+        def change_urls(game):
+            """Return the change pages of game and one of its chains."""
+            chain = Chain.objects.filter(player__game=game).first() #pylint: disable=no-member
+            return [
+                reverse('admin:drawwrite_game_change', args=[game.pk]),
+                reverse('admin:drawwrite_chain_change', args=[chain.pk]),
+            ]
+        for url in change_urls(self.game):
+            self.client.get(url)
+        before = [self.count_queries(url) for url in change_urls(self.game)]
+        after = [self.count_queries(url) for url in change_urls(build_game('big', 30, rounds=30))]
+        self.assertEqual(before, after)
+
+    def test_large_tables_are_estimated(self):
+        """
+        Unfiltered changelists of huge tables should not be counted exactly.
+        """
+        with mock.patch('drawwrite.admin.estimate_row_count', return_value=10 ** 9):
+            response = self.client.get(reverse('admin:drawwrite_chain_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 10 ** 9)
+# }}}
+
+# ArchiveTests {{{
+class ArchiveTests(TempMediaMixin, TransactionTestCase):
+    """
+    Tests for archiving finished games. Drawing files are only deleted once
+    the archiving transaction commits, so these tests really commit.
+    """
+
+    def setUp(self):
+        """Build a finished game with a real file behind every drawing."""
+        super(ArchiveTests, self).setUp()
+        self.game = self.build_old_game('finished', rounds=3)
+        self.drawing_names = set()
+        for link in DrawLink.objects.filter(chain__player__game=self.game): #pylint: disable=no-member
+            if link.drawing.name not in self.drawing_names:
+                default_storage.save(link.drawing.name, ContentFile(
+                    'png from {0}'.format(link.drawing.name).encode('ascii')))
+                self.drawing_names.add(link.drawing.name)
+
+    def build_old_game(self, name, rounds, days_old=60):
+        """Return a three player game that is days_old days old."""
+        game = build_game(name, 3, rounds=rounds)
+        Game.objects.filter(pk=game.pk).update( #pylint: disable=no-member
+            time_created=timezone.now() - datetime.timedelta(days=days_old))
+        return game
+
+    def chain_page(self, player_id):
+        """
+        Return the chain page of player_id with the drawing URLs, which
+        change when a game is archived, blanked out.
+        """
+        response = self.client.get(reverse('drawwrite:showChain', args=[player_id]))
+        self.assertEqual(response.status_code, 200)
+        return re.sub(r'(<img [^>]*src=)"[^"]*"', r'\1""', response.content.decode('utf-8'))
+
+    def test_archiving_removes_rows_and_files(self):
+        """
+        Archiving a game should delete all of its rows and drawing files,
+        and leave one archived game with a packed file.
+        """
+        self.assertEqual(archive.archive_finished_games(30), [self.game.pk])
+        self.assertFalse(Game.objects.filter(pk=self.game.pk).exists()) #pylint: disable=no-member
+        self.assertFalse(Player.objects.exists()) #pylint: disable=no-member
+        self.assertFalse(Chain.objects.exists()) #pylint: disable=no-member
+        self.assertFalse(WriteLink.objects.exists()) #pylint: disable=no-member
+        self.assertFalse(DrawLink.objects.exists()) #pylint: disable=no-member
+        for name in self.drawing_names:
+            self.assertFalse(default_storage.exists(name))
+
+        archived = ArchivedGame.objects.get(original_id=self.game.pk) #pylint: disable=no-member
+        self.assertTrue(default_storage.exists(archived.media.name))
+        self.assertEqual(ArchivedPlayer.objects.filter(archive=archived).count(), 3) #pylint: disable=no-member
+
+    def test_results_pages_survive_archiving(self):
+        """
+        The game and chain pages should show the same players and links
+        before and after the game is archived.
+        """
+        game_url = reverse('drawwrite:showGame', args=[self.game.pk])
+        ids = player_ids(self.game)
+        game_before = self.client.get(game_url).content
+        chains_before = [self.chain_page(player_id) for player_id in ids]
+
+        archive.archive_finished_games(30)
+
+        self.assertEqual(self.client.get(game_url).content, game_before)
+        self.assertEqual([self.chain_page(player_id) for player_id in ids], chains_before)
+
+    def test_archived_drawings_are_served(self):
+        """
+        The drawings on an archived chain page should be served out of the
+        packed file, with their original contents.
+        """
+        link = DrawLink.objects.select_related('chain').first() #pylint: disable=no-member
+        player_id = link.chain.player_id
+        drawing_name = link.drawing.name
+        archive.archive_finished_games(30)
+
+        response = self.client.get(reverse('drawwrite:showChain', args=[player_id]))
+        urls_on_page = re.findall(r'<img [^>]*src="([^"]*)"', response.content.decode('utf-8'))
+        self.assertTrue(urls_on_page)
+        with self.assertNumQueries(QUERY_BUDGETS['showArchivedDrawing'][0]):
+            drawing = self.client.get(urls_on_page[0])
+        self.assertEqual(drawing.status_code, 200)
+        self.assertEqual(drawing['Content-Type'], 'image/png')
+        self.assertIn('immutable', drawing['Cache-Control'])
+        self.assertEqual(b''.join(drawing), 'png from {0}'.format(drawing_name).encode('ascii'))
+
+        missing = reverse('drawwrite:showArchivedDrawing', args=[self.game.pk, '99-99.png'])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_dry_run_changes_nothing(self):
+        """A dry run should list the game but leave it alone."""
+        self.assertEqual(archive.archive_finished_games(30, dry_run=True), [self.game.pk])
+        self.assertTrue(Game.objects.filter(pk=self.game.pk).exists()) #pylint: disable=no-member
+        self.assertFalse(ArchivedGame.objects.exists()) #pylint: disable=no-member
+        for name in self.drawing_names:
+            self.assertTrue(default_storage.exists(name))
+
+    def test_recent_and_unfinished_games_are_kept(self):
+        """
+        Games that are still being played, or that finished recently,
+        should not be archived.
+        """
+        unfinished = self.build_old_game('unfinished', rounds=1)
+        recent = self.build_old_game('recent', rounds=3, days_old=1)
+        self.assertEqual(archive.archive_finished_games(30), [self.game.pk])
+        self.assertTrue(Game.objects.filter(pk=unfinished.pk).exists()) #pylint: disable=no-member
+        self.assertTrue(Game.objects.filter(pk=recent.pk).exists()) #pylint: disable=no-member
+
+    def test_command_limits_and_reports(self):
+        """The command should archive at most --limit games and say so."""
+        second = self.build_old_game('second', rounds=3)
+        out = io.StringIO()
+        call_command('archive_games', '--days', '30', '--limit', '1', stdout=out)
+        self.assertIn('archived games=1', out.getvalue())
+        self.assertFalse(Game.objects.filter(pk=self.game.pk).exists()) #pylint: disable=no-member
+        self.assertTrue(Game.objects.filter(pk=second.pk).exists()) #pylint: disable=no-member
+
+    def test_results_survive_archiving(self):
+        """The whole-game results should read the same from the archive."""
+        url = reverse('drawwrite:resultsDocument', args=[self.game.pk])
+
+        def without_drawings(document):
+            """Return document with the drawing URLs blanked out."""
+            for chain in document['chains']:
+                for link in chain['links']:
+                    if 'drawing' in link:
+                        link['drawing'] = ''
+            return document
+
+        before = without_drawings(self.client.get(url).json())
+        archive.archive_game(self.game)
+        after = without_drawings(self.client.get(url).json())
+        self.assertEqual(before, after)
+        self.assertEqual(len(after['chains']), 3)
+# }}}
+
+# ReaperTests {{{
+class ReaperTests(TempMediaMixin, TransactionTestCase):
+    """
+    Tests for reaping abandoned lobbies and stalled games. Drawing files are
+    only deleted once the reaping transaction commits, so these tests
+    really commit.
+    """
+
+    def idle(self, game, **delta):
+        """Make game look like nobody has touched it for delta."""
+        Game.objects.filter(pk=game.pk).update( #pylint: disable=no-member
+            last_activity=timezone.now() - datetime.timedelta(**delta))
+
+    def exists(self, game):
+        """Return whether game is still in the database."""
+        return Game.objects.filter(pk=game.pk).exists() #pylint: disable=no-member
+
+    def test_idle_lobbies_are_not_offered(self):
+        """Lobbies that are about to be reaped should not be listed to join."""
+        abandoned = build_game('abandoned', 2, start=False)
+        build_game('fresh', 2, start=False)
+        self.idle(abandoned, hours=2)
+        self.assertEqual(services.available_games(), ['fresh'])
+
+    def test_only_idle_lobbies_and_stalled_games_are_reaped(self):
+        """
+        Idle lobbies and idle unfinished games should be deleted, while
+        active ones and finished ones are kept.
+        """
+        abandoned = build_game('abandoned', 2, start=False)
+        fresh = build_game('fresh', 2, start=False)
+        stalled = build_game('stalled', 3, rounds=1)
+        playing = build_game('playing', 3, rounds=1)
+        finished = build_game('finished', 3, rounds=3)
+        self.idle(abandoned, hours=2)
+        self.idle(stalled, days=2)
+        self.idle(finished, days=2)
+
+        metrics = reaper.reap()
+        self.assertEqual((metrics['lobbies'], metrics['stalled']), (1, 1))
+        self.assertEqual(metrics['games'], 2)
+        self.assertEqual(metrics['players'], 5)
+        self.assertEqual(metrics['chains'], 3)
+        self.assertEqual(metrics['write_links'], 3)
+        self.assertFalse(self.exists(abandoned))
+        self.assertFalse(self.exists(stalled))
+        self.assertTrue(self.exists(fresh))
+        self.assertTrue(self.exists(playing))
+        self.assertTrue(self.exists(finished))
+        self.assertFalse(Player.objects.filter( #pylint: disable=no-member
+            game_id__in=[abandoned.pk, stalled.pk]).exists())
+
+    def test_drawing_files_are_deleted(self):
+        """Reaping a stalled game should delete its drawing files."""
+        stalled = build_game('stalled', 3, rounds=2)
+        names = set(DrawLink.objects.values_list('drawing', flat=True)) #pylint: disable=no-member
+        for name in names:
+            default_storage.save(name, ContentFile(b'png'))
+        self.idle(stalled, days=2)
+
+        metrics = reaper.reap()
+        self.assertEqual(metrics['draw_links'], 3)
+        self.assertEqual(metrics['files'], len(names))
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_dry_run_changes_nothing(self):
+        """A dry run should count what it would delete, and delete nothing."""
+        abandoned = build_game('abandoned', 2, start=False)
+        self.idle(abandoned, hours=2)
+        metrics = reaper.reap(dry_run=True)
+        self.assertEqual((metrics['games'], metrics['players']), (1, 2))
+        self.assertTrue(self.exists(abandoned))
+
+    def test_limit(self):
+        """At most limit games of each kind should be reaped per pass."""
+        for i in range(3):
+            self.idle(build_game('abandoned{0}'.format(i), 1, start=False), hours=2)
+        self.assertEqual(reaper.reap(limit=2)['games'], 2)
+        self.assertEqual(Game.objects.count(), 1) #pylint: disable=no-member
+
+    def test_lobby_joined_after_selection_is_skipped(self):
+        """
+        A lobby that someone joins after the reaper picked it should be
+        skipped once the reaper locks it.
+        """
+        lobby = build_game('lobby', 1, start=False)
+        self.idle(lobby, hours=2)
+        candidates = reaper.abandoned_lobbies(reaper.lobby_timeout())
+        services.new_player(lobby, 'latecomer', False)
+
+        metrics = {'games': 0, 'skipped': 0}
+        self.assertFalse(reaper.reap_game(candidates, lobby.pk, 500, metrics))
+        self.assertEqual(metrics['skipped'], 1)
+        self.assertTrue(self.exists(lobby))
+
+    def test_joining_a_reaped_lobby(self):
+        """
+        Joining a lobby that was reaped should raise GameNotFound, and the
+        view should send the player back to the index.
+        """
+        lobby = build_game('lobby', 1, start=False)
+        self.idle(lobby, hours=2)
+        reaper.reap()
+        with self.assertRaises(services.GameNotFound):
+            services.new_player(lobby, 'latecomer', False)
+
+        build_game('lobby', 1, start=False)
+        with mock.patch.object(services, 'new_player', side_effect=services.GameNotFound('gone')):
+            response = self.client.post(reverse('drawwrite:joinGame'),
+                                        {'username': 'latecomer', 'gamename': 'lobby'})
+        self.assertRedirects(response, reverse('drawwrite:index'), fetch_redirect_response=False)
+        self.assertEqual(self.client.session['error_title'], 'Non-existent game')
+
+    def test_abandoned_lobbies_are_not_available(self):
+        """Idle lobbies should not be offered to players."""
+        self.idle(build_game('abandoned', 1, start=False), hours=2)
+        build_game('fresh', 1, start=False)
+        response = self.client.get(reverse('drawwrite:getAvailableGames'))
+        self.assertEqual(response.json()['options'], ['fresh'])
+
+    def test_command_prints_metrics(self):
+        """The command should print its metrics."""
+        self.idle(build_game('abandoned', 1, start=False), hours=2)
+        out = io.StringIO()
+        call_command('reap_games', '--lobby-minutes', '30', stdout=out)
+        self.assertIn('reaped', out.getvalue())
+        self.assertIn('games=1', out.getvalue())
+# }}}
+
+# ReadReplicaTests {{{
+class ReadReplicaTests(TestCase):
+    """
+    Tests for routing read-only views to a replica. The replica is a second
+    SQLite file that nothing replicates to, so every read shows which
+    database it came from.
+    """
+
+    replica = 'drawwrite_test_replica'
+
+    @classmethod
+    def setUpClass(cls):
+        """Add and migrate the replica database."""
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.databases[cls.replica] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.replica_dir, 'replica.sqlite3'),
+        }
+        call_command('migrate', database=cls.replica, verbosity=0)
+        super(ReadReplicaTests, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the replica database."""
+        super(ReadReplicaTests, cls).tearDownClass()
+        connections[cls.replica].close()
+        del connections.databases[cls.replica]
+        delattr(connections._connections, cls.replica) #pylint: disable=protected-access
+        shutil.rmtree(cls.replica_dir, True)
+
+    def setUp(self):
+        """
+        Route through the replica, and put a game with the same id but a
+        different name on each database.
+        """
+        override = self.settings(
+            DATABASE_ROUTERS=['drawwrite.routers.ReadReplicaRouter'],
+            DRAWWRITE_READ_REPLICAS=[self.replica],
+            DRAWWRITE_REPLICA_PIN_SECONDS=5,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        middleware_override = self.modify_settings(MIDDLEWARE={
+            'append': 'drawwrite.middleware.ReadReplicas',
+        })
+        middleware_override.enable()
+        self.addCleanup(middleware_override.disable)
+
+        self.game = services.new_game('on-primary')
+        Game.objects.using(self.replica).create( #pylint: disable=no-member
+            pk=self.game.pk, name='on-replica', started=False)
+        self.addCleanup(Game.objects.using(self.replica).all().delete) #pylint: disable=no-member
+
+    def available_games(self):
+        """Return the game names that getAvailableGames lists."""
+        return self.client.get(reverse('drawwrite:getAvailableGames')).json()['options']
+
+    def test_read_only_views_use_the_replica(self):
+        """Read-only views should read from the replica."""
+        self.assertEqual(self.available_games(), ['on-replica'])
+        response = self.client.get(reverse('drawwrite:showGame', args=[self.game.pk]))
+        self.assertEqual(response.context['game_name'], 'on-replica')
+
+    def test_other_reads_use_the_primary(self):
+        """Reads outside of read-only views should see the primary."""
+        self.assertEqual(Game.objects.get(pk=self.game.pk).name, 'on-primary') #pylint: disable=no-member
+        self.client.get(reverse('drawwrite:getAvailableGames'))
+        self.assertEqual(Game.objects.get(pk=self.game.pk).name, 'on-primary') #pylint: disable=no-member
+
+    def test_writes_pin_to_the_primary(self):
+        """
+        After a request that writes, the same browser should read from the
+        primary until the pin expires.
+        """
+        self.client.post(reverse('drawwrite:joinGame'),
+                         {'username': 'joiner', 'gamename': 'on-primary'})
+        self.assertIn(middleware.ReadReplicas.cookie_name, self.client.cookies)
+        self.assertEqual(Player.objects.using(self.replica).count(), 0) #pylint: disable=no-member
+        self.assertEqual(self.available_games(), ['on-primary'])
+
+        later = time.time() + 6
+        with mock.patch.object(middleware.time, 'time', return_value=later):
+            self.assertEqual(self.available_games(), ['on-replica'])
+
+    def test_pin_is_per_browser(self):
+        """A write by one player should not pin other players."""
+        self.client.post(reverse('drawwrite:joinGame'),
+                         {'username': 'joiner', 'gamename': 'on-primary'})
+        other = self.client_class()
+        self.assertEqual(
+            other.get(reverse('drawwrite:getAvailableGames')).json()['options'],
+            ['on-replica'],
+        )
+
+    def test_no_replicas_means_primary(self):
+        """Without any replicas configured, everything reads the primary."""
+        with self.settings(DRAWWRITE_READ_REPLICAS=[]):
+            self.assertEqual(self.available_games(), ['on-primary'])
+
+    def test_profiles_capture_replica_queries(self):
+        """Profiled queries should include those on the replica, tagged with it."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = reverse('drawwrite:showGame', args=[self.game.pk])
+        request = RequestFactory().get(path)
+        request.resolver_match = resolve(path)
+        with self.settings(DRAWWRITE_PROFILE_DIR=directory, DRAWWRITE_PROFILE_SAMPLE_RATE=1.0):
+            middleware.ProfileRequests(lambda request: HttpResponse(
+                str(Game.objects.using(self.replica).count())))(request) #pylint: disable=no-member
+        view_dir = os.path.join(directory, 'drawwrite.showGame')
+        name = [name for name in os.listdir(view_dir) if name.endswith('.json')][0]
+        with open(os.path.join(view_dir, name)) as sample:
+            queries = json.load(sample)['queries']
+        self.assertEqual([query['database'] for query in queries], [self.replica])
+# }}}
+
+# ShardingTests {{{
+class ShardingTests(TransactionTestCase):
+    """
+    Tests for partitioning games across shards, using two extra SQLite
+    files next to the default database.
+    """
+
+    multi_db = True
+    extra_shards = ('drawwrite_test_shard1', 'drawwrite_test_shard2')
+
+    @classmethod
+    def setUpClass(cls):
+        """Add and migrate the extra shards."""
+        cls.shard_dir = tempfile.mkdtemp()
+        for alias in cls.extra_shards:
+            connections.databases[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(cls.shard_dir, alias + '.sqlite3'),
+            }
+            call_command('migrate', database=alias, verbosity=0)
+        super(ShardingTests, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the extra shards."""
+        super(ShardingTests, cls).tearDownClass()
+        for alias in cls.extra_shards:
+            connections[alias].close()
+            del connections.databases[alias]
+            delattr(connections._connections, alias) #pylint: disable=protected-access
+        shutil.rmtree(cls.shard_dir, True)
+
+    def setUp(self):
+        """Shard across the default database and the extra shards."""
+        self.shards = ('default',) + self.extra_shards
+        override = self.settings(
+            DATABASE_ROUTERS=['drawwrite.sharding.ShardRouter'],
+            DRAWWRITE_SHARDS=list(self.shards),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def name_on(self, alias, prefix='game'):
+        """Return a game name that hashes to the shard alias."""
+        for i in range(1000):
+            name = '{0}-{1}'.format(prefix, i)
+            if sharding.shard_for_name(name) == alias:
+                return name
+        raise AssertionError('no name hashes to {0}'.format(alias))
+
+    def create(self, client, username, gamename):
+        """Create a game through the views, and return the player id."""
+        response = client.post(reverse('drawwrite:createGame'),
+                               {'username': username, 'gamename': gamename})
+        return resolve(response.url).kwargs['player_id']
+
+    def join(self, client, username, gamename):
+        """Join a game through the views, and return the player id."""
+        response = client.post(reverse('drawwrite:joinGame'),
+                               {'username': username, 'gamename': gamename})
+        return resolve(response.url).kwargs['player_id']
+
+    def test_games_are_created_on_their_shard(self):
+        """
+        Every game should live only on the shard its name hashes to, with
+        an id that maps back to that shard.
+        """
+        for alias in self.shards:
+            name = self.name_on(alias)
+            player_id = self.create(self.client, 'creator', name)
+            game = Game.objects.using(alias).get(name=name) #pylint: disable=no-member
+            self.assertEqual(sharding.shard_for_id(game.pk), alias)
+            self.assertEqual(sharding.shard_for_id(player_id), alias)
+            for other in self.shards:
+                if other != alias:
+                    self.assertFalse(Game.objects.using(other).filter( #pylint: disable=no-member
+                        name=name).exists())
+
+    def test_whole_game_stays_on_one_shard(self):
+        """
+        Playing a game on a shard should keep all of its rows there, and
+        every view should find them from the ids in its URL.
+        """
+        alias = self.extra_shards[1]
+        name = self.name_on(alias)
+        other_client = self.client_class()
+        creator = self.create(self.client, 'creator', name)
+        joiner = self.join(other_client, 'joiner', name)
+        self.client.post(reverse('drawwrite:startGame', args=[creator]))
+        for client, player_id in ((self.client, creator), (other_client, joiner)):
+            client.get(reverse('drawwrite:play', args=[player_id]))
+            client.post(reverse('drawwrite:createLink', args=[player_id]),
+                        {'description': 'words from {0}'.format(player_id)})
+
+        self.assertEqual(Player.objects.using(alias).count(), 2) #pylint: disable=no-member
+        self.assertEqual(Chain.objects.using(alias).count(), 2) #pylint: disable=no-member
+        self.assertEqual(WriteLink.objects.using(alias).count(), 2) #pylint: disable=no-member
+        for other in self.shards:
+            if other != alias:
+                self.assertEqual(Player.objects.using(other).count(), 0) #pylint: disable=no-member
+
+        response = self.client.get(reverse('drawwrite:checkRoundDone', args=[creator]))
+        self.assertEqual(response.json()['finished'], True)
+        game_id = Game.objects.using(alias).get(name=name).pk #pylint: disable=no-member
+        response = self.client.get(reverse('drawwrite:showGame', args=[game_id]))
+        self.assertEqual(response.context['game_name'], name)
+        response = self.client.get(reverse('drawwrite:showChain', args=[creator]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'words from {0}'.format(creator))
+
+    def test_available_games_fan_out(self):
+        """The lobby list should merge the lobbies of every shard."""
+        names = [self.name_on(alias) for alias in self.shards]
+        for name in names:
+            self.create(self.client, 'creator', name)
+        response = self.client.get(reverse('drawwrite:getAvailableGames'))
+        self.assertEqual(sorted(response.json()['options']), sorted(names))
+
+    def test_ids_are_allocated_per_shard(self):
+        """Ids should come from each shard's own sequence."""
+        alias = self.extra_shards[0]
+        for i in range(3):
+            self.create(self.client, 'creator', self.name_on(alias, 'lobby{0}'.format(i)))
+        ids = sorted(Game.objects.using(alias).values_list('pk', flat=True)) #pylint: disable=no-member
+        index = self.shards.index(alias)
+        self.assertEqual(ids, [n * sharding.MAX_SHARDS + index for n in (1, 2, 3)])
+        self.assertEqual(ShardSequence.objects.using(alias).get(name='game').last_value, 3) #pylint: disable=no-member
+
+    def test_maintenance_visits_every_shard(self):
+        """The reaper should reap idle lobbies on every shard."""
+        for alias in self.shards:
+            self.create(self.client, 'creator', self.name_on(alias))
+            Game.objects.using(alias).update( #pylint: disable=no-member
+                last_activity=timezone.now() - datetime.timedelta(hours=2))
+        self.assertEqual(reaper.reap()['games'], len(self.shards))
+        for alias in self.shards:
+            self.assertEqual(Game.objects.using(alias).count(), 0) #pylint: disable=no-member
+
+    def test_unsharded_ids_come_from_the_database(self):
+        """Without DRAWWRITE_SHARDS, ids are left to the database."""
+        with self.settings(DRAWWRITE_SHARDS=None):
+            self.assertIsNone(sharding.allocate_id('game'))
+            self.assertEqual(sharding.get_shards(), ('default',))
+# }}}
+
+# PipelinedGameTests {{{
+class PipelinedGameTests(TempMediaMixin, TestCase):
+    """Tests for games where chains move on without waiting for the round."""
+
+    def submit(self, player_id):
+        """
+        Submit player_id's next link through the views if play offers one,
+        and return whether it did.
+        """
+        response = self.client.get(reverse('drawwrite:play', args=[player_id]))
+        if response.status_code != 200 or response.templates[0].name != 'drawwrite/chainAdd.html':
+            return False
+        if response.context['prev_link_type'] == 'write':
+            data = {'drawing': 'data:image/png;base64,iVBORw0KGgo='}
+        else:
+            data = {'description': 'from {0}'.format(player_id)}
+        self.client.post(reverse('drawwrite:createLink', args=[player_id]), data)
+        return True
+
+    def test_create_game_form_sets_mode(self):
+        """The create form's checkbox should make a pipelined game."""
+        self.client.post(reverse('drawwrite:createGame'),
+                         {'username': 'a', 'gamename': 'piped', 'pipelined': 'on'})
+        self.client.post(reverse('drawwrite:createGame'),
+                         {'username': 'a', 'gamename': 'normal'})
+        self.assertTrue(Game.objects.get(name='piped').pipelined) #pylint: disable=no-member
+        self.assertFalse(Game.objects.get(name='normal').pipelined) #pylint: disable=no-member
+
+    def test_fast_player_moves_on_before_the_round_ends(self):
+        """
+        A player should get the next chain as soon as it is ready, even
+        though other players haven't finished the round.
+        """
+        game = build_game('piped', 3, pipelined=True)
+        first, second, _ = player_ids(game)
+        add_next_link(second)
+        add_next_link(first)
+        game.refresh_from_db()
+        self.assertEqual(game.round_num, 0)
+
+        response = self.client.get(reverse('drawwrite:play', args=[first]))
+        self.assertTemplateUsed(response, 'drawwrite/chainAdd.html')
+        self.assertEqual(response.context['prev_link'].added_by.pk, second)
+
+    def test_player_waits_for_the_chain(self):
+        """
+        A player whose next chain isn't ready should wait, and be told who
+        they are waiting for, until it is.
+        """
+        game = build_game('piped', 3, pipelined=True)
+        first, second, third = player_ids(game)
+        add_next_link(first)
+        add_next_link(second)
+        add_next_link(first)
+
+        response = self.client.get(reverse('drawwrite:play', args=[first]))
+        self.assertTemplateUsed(response, 'drawwrite/roundWaiting.html')
+        check_url = reverse('drawwrite:checkRoundDone', args=[first])
+        self.assertEqual(self.client.get(check_url).json(), {
+            'finished': False,
+            'still_playing': ['player1'],
+        })
+
+        add_next_link(third)
+        add_next_link(second)
+        data = self.client.get(check_url).json()
+        self.assertEqual(data['finished'], True)
+        self.assertEqual(data['next']['state'], 'add')
+
+    def test_double_submit_is_ignored(self):
+        """Submitting the same link twice should only add it once."""
+        game = build_game('piped', 2, pipelined=True)
+        first = player_ids(game)[0]
+        url = reverse('drawwrite:createLink', args=[first])
+        self.client.post(url, {'description': 'once'})
+        response = self.client.post(url, {'description': 'twice'})
+        self.assertRedirects(response, reverse('drawwrite:play', args=[first]),
+                             fetch_redirect_response=False)
+        self.assertEqual(WriteLink.objects.filter(added_by_id=first).count(), 1) #pylint: disable=no-member
+
+    def test_stale_finish_is_refused(self):
+        """
+        A submission that read the player before a concurrent one moved
+        them on should not move them on again.
+        """
+        game = build_game('piped', 2, pipelined=True)
+        stale = Player.objects.get(game=game, position=0) #pylint: disable=no-member
+        add_next_link(stale.pk)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                services.player_finished(stale, 0)
+        stale.refresh_from_db()
+        self.assertEqual(stale.current_round, 1)
+
+    def test_rotation_holds_in_any_order(self):
+        """
+        However unevenly players go, every chain should get one link from
+        every player, in the same rotation as a normal game.
+        """
+        num_players = 5
+        game = build_game('piped', num_players, pipelined=True)
+        ids = player_ids(game)
+        order = [0, 0, 1, 4, 4, 4, 2, 3, 1, 0]
+        steps = 0
+        while Game.objects.get(pk=game.pk).round_num < num_players: #pylint: disable=no-member
+            progressed = False
+            for position in order + list(range(num_players)):
+                progressed = self.submit(ids[position]) or progressed
+            self.assertTrue(progressed, 'no player could move on')
+            steps += 1
+            self.assertLess(steps, 50)
+
+        for owner_position, owner_id in enumerate(ids):
+            chain = Chain.objects.get(player_id=owner_id) #pylint: disable=no-member
+            self.assertEqual(chain.next_link_position, num_players)
+            links = list(WriteLink.objects.filter(chain=chain)) + list( #pylint: disable=no-member
+                DrawLink.objects.filter(chain=chain)) #pylint: disable=no-member
+            for link in links:
+                self.assertEqual(
+                    link.added_by_id,
+                    ids[(owner_position - link.link_position) % num_players],
+                )
+        response = self.client.get(reverse('drawwrite:play', args=[ids[0]]))
+        self.assertRedirects(response, reverse('drawwrite:showGame', args=[game.pk]),
+                             fetch_redirect_response=False)
+# }}}
+
+# RoundDeadlineTests {{{
+class RoundDeadlineTests(TempMediaMixin, TestCase):
+    """Tests for filling in the links of players who run out of time."""
+
+    def overdue(self, game, seconds=60):
+        """Give game a round time limit and make its current round overdue."""
+        Game.objects.filter(pk=game.pk).update( #pylint: disable=no-member
+            round_seconds=seconds,
+            round_deadline=timezone.now() - datetime.timedelta(seconds=1),
+        )
+
+    def test_create_game_sets_time_limit(self):
+        """
+        The create form's minutes per round should give the game a time
+        limit, and starting the game should start the clock.
+        """
+        response = self.client.post(reverse('drawwrite:createGame'), {
+            'username': 'a', 'gamename': 'timed', 'round_minutes': '2'})
+        game = Game.objects.get(name='timed') #pylint: disable=no-member
+        self.assertEqual(game.round_seconds, 120)
+        self.assertIsNone(game.round_deadline)
+
+        self.client.post(reverse('drawwrite:startGame', args=[
+            resolve(response.url).kwargs['player_id']]))
+        game.refresh_from_db()
+        remaining = (game.round_deadline - timezone.now()).total_seconds()
+        self.assertTrue(110 < remaining <= 120, remaining)
+
+    def test_games_without_limit_have_no_deadline(self):
+        """Games created without a time limit should never be overdue."""
+        game = build_game('untimed', 3, rounds=1)
+        self.assertIsNone(game.round_deadline)
+        tomorrow = timezone.now() + datetime.timedelta(days=1)
+        self.assertEqual(deadlines.tick(now=tomorrow)['games'], 0)
+
+    def test_stragglers_are_filled_in(self):
+        """
+        Every player still on an overdue round should get a placeholder
+        link, and the game should move on with a new deadline.
+        """
+        game = build_game('timed', 3, rounds=1, extra_finishers=1)
+        self.overdue(game)
+        self.assertEqual(deadlines.tick(), {'games': 1, 'links': 2, 'skipped': 0})
+
+        game.refresh_from_db()
+        self.assertEqual(game.round_num, 2)
+        self.assertEqual(game.num_finished_current_round, 0)
+        self.assertGreater(game.round_deadline, timezone.now())
+        placeholders = DrawLink.objects.filter( #pylint: disable=no-member
+            drawing__startswith='placeholder-')
+        self.assertEqual(placeholders.count(), 2)
+        for link in placeholders:
+            self.assertEqual(link.drawing.read(), deadlines.PLACEHOLDER_DRAWING)
+
+    def test_first_round_placeholders_are_text(self):
+        """Stragglers in the first round should get placeholder text."""
+        game = build_game('timed', 2)
+        self.overdue(game)
+        deadlines.tick()
+        self.assertEqual(
+            list(WriteLink.objects.values_list('text', flat=True)), #pylint: disable=no-member
+            [deadlines.PLACEHOLDER_TEXT] * 2,
+        )
+
+    def test_last_round_finishes_game(self):
+        """Filling in the last round should finish the game and stop the clock."""
+        game = build_game('timed', 2, rounds=1)
+        self.overdue(game)
+        deadlines.tick()
+        game.refresh_from_db()
+        self.assertEqual(game.round_num, 2)
+        self.assertIsNone(game.round_deadline)
+
+    def test_pipelined_stragglers_are_filled_in(self):
+        """
+        In pipelined games only the players still on the game's round
+        should be filled in.
+        """
+        game = build_game('timed', 3, rounds=1, extra_finishers=2, pipelined=True)
+        self.overdue(game)
+        self.assertEqual(deadlines.tick()['links'], 1)
+        game.refresh_from_db()
+        self.assertEqual(game.round_num, 2)
+
+    def test_overdue_games_is_one_query(self):
+        """Finding overdue games should take one query however many there are."""
+        for i in range(20):
+            self.overdue(build_game('timed{0}'.format(i), 2))
+        with self.assertNumQueries(1):
+            game_ids = deadlines.overdue_games(timezone.now(), 500)
+        self.assertEqual(len(game_ids), 20)
+
+    def test_round_finished_in_the_meantime_is_skipped(self):
+        """A game that stopped being overdue after it was picked is skipped."""
+        game = build_game('timed', 2)
+        self.overdue(game)
+        now = timezone.now()
+        Game.objects.filter(pk=game.pk).update( #pylint: disable=no-member
+            round_deadline=now + datetime.timedelta(seconds=60))
+        self.assertIsNone(deadlines.advance_game(game.pk, now))
+        self.assertFalse(WriteLink.objects.exists()) #pylint: disable=no-member
+
+    def test_late_submission_is_not_added(self):
+        """
+        A player submitting the link that was filled in for them should not
+        add it to the chain that they work on next.
+        """
+        game = build_game('timed', 3)
+        player_id = Player.objects.get(game=game, position=0).pk #pylint: disable=no-member
+        self.overdue(game)
+        deadlines.tick()
+        response = self.client.post(reverse('drawwrite:createLink', args=[player_id]),
+                                    {'description': 'too late'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WriteLink.objects.filter(text='too late').exists()) #pylint: disable=no-member
+
+    def test_command_prints_metrics(self):
+        """The command should print what it did."""
+        self.overdue(build_game('timed', 2))
+        out = io.StringIO()
+        call_command('advance_overdue_rounds', stdout=out)
+        self.assertIn('games=1 links=2', out.getvalue())
+# }}}
+
+# TaskQueueTests {{{
+# Calls made to the tasks below, which the tests clear.
+TASK_CALLS = []
+
+@taskqueue.task()
+def record_call(value):
+    """A task that records its argument."""
+    TASK_CALLS.append(value)
+
+@taskqueue.task(max_attempts=2)
+def always_fail(value):
+    """A task that always fails."""
+    raise ValueError(value)
+
+class TaskQueueTests(TransactionTestCase):
+    """Tests for the database task queue and its worker."""
+
+    def setUp(self):
+        """Forget earlier calls."""
+        del TASK_CALLS[:]
+
+    def test_sync_mode_runs_on_commit(self):
+        """In sync mode a task runs in-process once its transaction commits."""
+        with transaction.atomic():
+            record_call.enqueue(value=1)
+            self.assertEqual(TASK_CALLS, [])
+        self.assertEqual(TASK_CALLS, [1])
+        self.assertFalse(Task.objects.exists()) #pylint: disable=no-member
+
+    def test_sync_mode_skips_rolled_back_tasks(self):
+        """A task queued by a transaction that rolls back never runs."""
+        try:
+            with transaction.atomic():
+                record_call.enqueue(value=1)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(TASK_CALLS, [])
+
+    def test_queue_mode_stores_task_for_worker(self):
+        """In queue mode a task is stored, and the worker runs then deletes it."""
+        with self.settings(DRAWWRITE_TASK_MODE='queue'):
+            with transaction.atomic():
+                record_call.enqueue(value=2)
+        self.assertEqual(TASK_CALLS, [])
+        queued = Task.objects.get() #pylint: disable=no-member
+        self.assertEqual(queued.name, 'drawwrite.tests.record_call')
+        self.assertEqual(json.loads(queued.arguments), {'value': 2})
+
+        out = io.StringIO()
+        call_command('run_tasks', '--once', '--workers', '2', stdout=out)
+        self.assertEqual(TASK_CALLS, [2])
+        self.assertFalse(Task.objects.exists()) #pylint: disable=no-member
+        self.assertIn('claimed=1 done=1 failed=0', out.getvalue())
+
+    def test_failures_back_off_then_give_up(self):
+        """A failing task is retried later, then marked failed for good."""
+        with self.settings(DRAWWRITE_TASK_MODE='queue'):
+            always_fail.enqueue(value='boom')
+
+        claimed = taskqueue.claim(10, 60)
+        self.assertEqual(len(claimed), 1)
+        self.assertFalse(taskqueue.run_task(claimed[0]))
+        queued = Task.objects.get() #pylint: disable=no-member
+        self.assertEqual((queued.status, queued.attempts), (Task.QUEUED, 1))
+        self.assertGreater(queued.available_at, timezone.now())
+        self.assertIn('ValueError: boom', queued.last_error)
+        self.assertEqual(taskqueue.claim(10, 60), [])
+
+        later = timezone.now() + datetime.timedelta(seconds=5)
+        claimed = taskqueue.claim(10, 60, now=later)
+        self.assertFalse(taskqueue.run_task(claimed[0]))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 2))
+        self.assertEqual(taskqueue.claim(10, 60, now=later + datetime.timedelta(days=1)), [])
+
+    def test_claimed_task_is_hidden_until_timeout(self):
+        """
+        A claimed task is hidden from other workers until its visibility
+        timeout passes, and can then be claimed again.
+        """
+        with self.settings(DRAWWRITE_TASK_MODE='queue'):
+            record_call.enqueue(value=3)
+        self.assertEqual(len(taskqueue.claim(10, 60)), 1)
+        self.assertEqual(taskqueue.claim(10, 60), [])
+        later = timezone.now() + datetime.timedelta(seconds=61)
+        reclaimed = taskqueue.claim(10, 60, now=later)
+        self.assertEqual([queued.attempts for queued in reclaimed], [2])
+
+    def test_unknown_task_fails(self):
+        """A stored task whose name is not registered does not crash the worker."""
+        Task.objects.create(name='drawwrite.tests.missing', arguments='{}', max_attempts=1) #pylint: disable=no-member
+        self.assertFalse(taskqueue.run_task(taskqueue.claim(10, 60)[0]))
+        self.assertEqual(Task.objects.get().status, Task.FAILED) #pylint: disable=no-member
+# }}}
+
+# EventLogTests {{{
+class EventLogTests(TestCase):
+    """Tests for the game event log, its feed and counter rebuilding."""
+
+    def feed(self, game_id, after=None):
+        """Return the parsed feed of game_id after the cursor after."""
+        data = {} if after is None else {'after': after}
+        response = self.client.get(reverse('drawwrite:gameEvents', args=[game_id]), data)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_services_record_events_in_order(self):
+        """Every change to a game should be logged in the order it was made."""
+        game = build_game('logged', 3, rounds=1)
+        kinds = list(GameEvent.objects.filter(game=game).order_by( #pylint: disable=no-member
+            'pk').values_list('kind', flat=True))
+        self.assertEqual(
+            kinds,
+            ['created'] + ['joined'] * 3 + ['started'] + ['link'] * 3 + ['round'],
+        )
+
+    def test_feed_returns_only_new_events(self):
+        """The feed should only return what changed since the client's cursor."""
+        game = build_game('logged', 2, start=False)
+        first = self.feed(game.pk)
+        self.assertEqual([event['kind'] for event in first['events']],
+                         ['created', 'joined', 'joined'])
+        self.assertEqual(first['events'][1]['data']['name'], 'player0')
+        self.assertFalse(first['more'])
+
+        self.assertEqual(self.feed(game.pk, first['cursor']),
+                         {'events': [], 'cursor': first['cursor'], 'more': False})
+
+        services.start_game(game)
+        second = self.feed(game.pk, first['cursor'])
+        self.assertEqual([event['kind'] for event in second['events']], ['started'])
+        self.assertGreater(second['cursor'], first['cursor'])
+
+    def test_feed_is_paged(self):
+        """Long logs should be returned a page at a time."""
+        game = build_game('logged', 3, start=False)
+        with mock.patch.object(events, 'PAGE_SIZE', 2):
+            first = self.feed(game.pk)
+            self.assertTrue(first['more'])
+            self.assertEqual(len(first['events']), 2)
+            second = self.feed(game.pk, first['cursor'])
+        self.assertFalse(second['more'])
+        self.assertEqual([event['kind'] for event in second['events']], ['joined', 'joined'])
+
+    def test_feed_errors(self):
+        """Unknown games are not found, and bad cursors are rejected."""
+        game = build_game('logged', 1, start=False)
+        url = reverse('drawwrite:gameEvents', args=[game.pk])
+        self.assertEqual(self.client.get(url, {'after': 'x'}).status_code, 400)
+        missing = reverse('drawwrite:gameEvents', args=[game.pk + 1000])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_rebuild_counters_repairs_drift(self):
+        """Counters that disagree with the log should be reset to match it."""
+        game = build_game('logged', 3, rounds=1, extra_finishers=1)
+        player = Player.objects.get(game=game, position=0) #pylint: disable=no-member
+        Game.objects.filter(pk=game.pk).update( #pylint: disable=no-member
+            num_finished_current_round=0, round_num=2)
+        Player.objects.filter(pk=player.pk).update(current_round=1) #pylint: disable=no-member
+        Chain.objects.filter(player=player).update(next_link_position=5) #pylint: disable=no-member
+
+        self.assertEqual(len(events.rebuild_counters(game.pk, dry_run=True)), 4)
+        game.refresh_from_db()
+        self.assertEqual(game.round_num, 2)
+
+        repairs = events.rebuild_counters(game.pk)
+        self.assertEqual(sorted((field, new) for _, field, _, new in repairs), [
+            ('current_round', 2),
+            ('next_link_position', 1),
+            ('num_finished_current_round', 1),
+            ('round_num', 1),
+        ])
+        game.refresh_from_db()
+        player.refresh_from_db()
+        self.assertEqual((game.round_num, game.num_finished_current_round), (1, 1))
+        self.assertEqual(player.current_round, 2)
+        self.assertEqual(events.rebuild_counters(game.pk), [])
+
+    def test_games_without_complete_log_are_skipped(self):
+        """Games whose log doesn't start at their creation can't be rebuilt."""
+        game = build_game('logged', 2)
+        GameEvent.objects.filter(game=game, kind=GameEvent.CREATED).delete() #pylint: disable=no-member
+        self.assertIsNone(events.rebuild_counters(game.pk))
+        self.assertEqual(list(events.logged_games()), [])
+
+    def test_command_prints_repairs(self):
+        """The command should print each repair and a summary."""
+        game = build_game('logged', 2, rounds=1)
+        Game.objects.filter(pk=game.pk).update(round_num=0) #pylint: disable=no-member
+        out = io.StringIO()
+        call_command('repair_game_counters', stdout=out)
+        self.assertIn('game {0} round_num: 0 -> 1'.format(game.pk), out.getvalue())
+        self.assertIn('repaired games=1 checked=1', out.getvalue())
+# }}}
+
+# ChainLinkListTests {{{
+class ChainLinkListTests(TempMediaMixin, TestCase):
+    """Tests for the list of links kept on each chain."""
+
+    def owner_chain(self, game, position=0):
+        """Return the chain of the player at position in game."""
+        return Chain.objects.get(player__game=game, player__position=position) #pylint: disable=no-member
+
+    def test_new_links_are_appended(self):
+        """Adding links should add their entries to the chain's list, in order."""
+        game = build_game('listed', 2, rounds=2)
+        chain = self.owner_chain(game)
+        entries = json.loads(chain.links)
+        self.assertEqual([(entry['type'], entry['position']) for entry in entries],
+                         [('write', 0), ('draw', 1)])
+        self.assertEqual(entries[0]['name'], 'player0')
+        self.assertEqual(entries[0]['text'], WriteLink.objects.get(chain=chain).text) #pylint: disable=no-member
+        self.assertEqual(entries[1]['media'], DrawLink.objects.get(chain=chain).drawing.name) #pylint: disable=no-member
+
+    def test_show_chain_matches_link_rows(self):
+        """The chain page should show the same links from the list as from the rows."""
+        game = build_game('listed', 2, rounds=2)
+        player_id = Player.objects.get(game=game, position=0).pk #pylint: disable=no-member
+        url = reverse('drawwrite:showChain', args=[player_id])
+        from_list = self.client.get(url).content
+
+        Chain.objects.filter(pk=self.owner_chain(game).pk).update(links='[]') #pylint: disable=no-member
+        from_rows = self.client.get(url).content
+        self.assertEqual(from_list, from_rows)
+        self.assertIn(b'player0 wrote:', from_list)
+        self.assertIn(b'player1 drew:', from_list)
+
+    def test_play_falls_back_when_list_is_behind(self):
+        """The play page should still find the previous link if the list is behind."""
+        game = build_game('listed', 2, rounds=1)
+        player_id = Player.objects.get(game=game, position=0).pk #pylint: disable=no-member
+        Chain.objects.filter(player__game=game).update(links='[]') #pylint: disable=no-member
+        response = self.client.get(reverse('drawwrite:play', args=[player_id]))
+        self.assertEqual(response.context['prev_link_type'], 'write')
+        self.assertIsInstance(response.context['prev_link'], WriteLink)
+
+    def test_check_chains_finds_and_repairs(self):
+        """Lists that differ from the link rows should be found, then rebuilt."""
+        game = build_game('listed', 3, rounds=2)
+        chain = self.owner_chain(game, 1)
+        expected = chain.links
+        Chain.objects.filter(pk=chain.pk).update(links='[]') #pylint: disable=no-member
+
+        self.assertEqual(linklist.check_chains(batch_size=2), [chain.pk])
+        self.assertEqual(linklist.check_chains(batch_size=2, repair=True), [chain.pk])
+        chain.refresh_from_db()
+        self.assertEqual(json.loads(chain.links), json.loads(expected))
+        self.assertEqual(linklist.check_chains(), [])
+
+    def test_command_prints_inconsistent_chains(self):
+        """The command should print each chain whose list differs."""
+        game = build_game('listed', 2, rounds=1)
+        chain = self.owner_chain(game)
+        Chain.objects.filter(pk=chain.pk).update(links='[]') #pylint: disable=no-member
+        out = io.StringIO()
+        call_command('check_chain_links', stdout=out)
+        self.assertIn('chain {0} differs'.format(chain.pk), out.getvalue())
+        self.assertIn('checked inconsistent=1', out.getvalue())
+# }}}
+
+# AsgiTests {{{
+class AsgiTests(TransactionTestCase):
+    """Tests for serving DrawWrite over ASGI."""
+
+    def setUp(self):
+        """Make a handler, and check held requests often."""
+        self.handler = asgi.ASGIHandler(threads=2)
+        self.addCleanup(self.handler.executor.shutdown)
+        poll_override = self.settings(DRAWWRITE_LONG_POLL_INTERVAL=0.05)
+        poll_override.enable()
+        self.addCleanup(poll_override.disable)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def request(self, path, query=b''):
+        """Make a GET request through the handler, return (status, body, seconds)."""
+        sent = []
+        messages = [{'type': 'http.request', 'body': b''}]
+
+        async def receive():
+            """Return the request."""
+            return messages.pop()
+
+        async def send(message):
+            """Keep the response."""
+            sent.append(message)
+
+        start = time.perf_counter()
+        self.loop.run_until_complete(self.handler({
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': query,
+            'headers': [(b'host', b'testserver')],
+        }, receive, send))
+        return sent[0]['status'], sent[1]['body'], time.perf_counter() - start
+
+    def test_sync_views_are_served(self):
+        """Ordinary views should work through the handler."""
+        status, body, _ = self.request(reverse('drawwrite:index'))
+        self.assertEqual(status, 200)
+        self.assertIn(b'<form', body)
+
+    def test_status_without_wait_returns_at_once(self):
+        """Clients that don't ask to wait should get an answer straight away."""
+        game = build_game('asgi', 2, start=False)
+        player_id = Player.objects.filter(game=game).first().pk #pylint: disable=no-member
+        status, body, seconds = self.request(
+            reverse('drawwrite:checkGameStart', args=[player_id]))
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode('utf-8')),
+                         {'started': False, 'names': ['player0', 'player1']})
+        self.assertLess(seconds, 1)
+
+    def test_status_is_held_until_it_changes(self):
+        """A waiting client should get its answer as soon as the game starts."""
+        game = build_game('asgi', 2, start=False)
+        player_id = Player.objects.filter(game=game).first().pk #pylint: disable=no-member
+        starter = threading.Timer(0.2, services.start_game, [game])
+        starter.start()
+        self.addCleanup(starter.join)
+        status, body, seconds = self.request(
+            reverse('drawwrite:checkGameStart', args=[player_id]), b'wait=5')
+        self.assertEqual(status, 200)
+        self.assertTrue(json.loads(body.decode('utf-8'))['started'])
+        self.assertTrue(0.15 < seconds < 4, seconds)
+
+    def test_wait_is_capped(self):
+        """Nothing changing should hold a client no longer than the limit."""
+        game = build_game('asgi', 3)
+        with self.settings(DRAWWRITE_LONG_POLL_SECONDS=0.3):
+            status, _, seconds = self.request(
+                reverse('drawwrite:checkGameDone', args=[game.pk]), b'wait=60')
+        self.assertEqual(status, 200)
+        self.assertTrue(0.25 < seconds < 2, seconds)
+
+    def test_lifespan(self):
+        """The handler should answer the server's startup and shutdown."""
+        messages = [{'type': 'lifespan.shutdown'}, {'type': 'lifespan.startup'}]
+        sent = []
+
+        async def receive():
+            """Return the next message."""
+            return messages.pop()
+
+        async def send(message):
+            """Keep the reply."""
+            sent.append(message['type'])
+
+        self.loop.run_until_complete(self.handler({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+    def test_build_environ(self):
+        """Scopes should become WSGI environs with the usual header names."""
+        environ = asgi.build_environ({
+            'method': 'POST',
+            'path': '/create',
+            'query_string': b'a=1',
+            'headers': [(b'content-type', b'text/plain'), (b'x-thing', b'1'), (b'x-thing', b'2')],
+        }, b'body')
+        self.assertEqual(environ['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(environ['HTTP_X_THING'], '1,2')
+        self.assertEqual(environ['QUERY_STRING'], 'a=1')
+        self.assertEqual(environ['wsgi.input'].read(), b'body')
+# }}}
+
+# WarmUpTests {{{
+class WarmUpTests(TestCase):
+    """Tests for warming up fresh workers."""
+
+    def test_warm_up_reports_each_step(self):
+        """Warming up should cover every template, route, database and form."""
+        build_game('lobby', 2, start=False)
+        report = warmup.warm_up()
+        self.assertEqual(report['templates']['count'], 10)
+        self.assertEqual(report['urls']['count'], len(urls.urlpatterns))
+        self.assertEqual(report['databases']['count'], 1)
+        self.assertEqual(report['forms']['count'], 2)
+
+    def test_endpoint(self):
+        """The endpoint should warm up and say what it did."""
+        with self.settings(DRAWWRITE_WARM_UP_TOKEN='secret'):
+            response = self.client.get(reverse('drawwrite:warmUp'),
+                                       HTTP_X_WARM_UP_TOKEN='secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'templates', 'urls', 'databases', 'forms'})
+
+    def test_endpoint_needs_token(self):
+        """Callers without the token should get a 404, and nothing should run."""
+        url = reverse('drawwrite:warmUp')
+        with mock.patch.object(warmup, 'warm_up') as warm_up:
+            self.assertEqual(self.client.get(url).status_code, 404)
+            with self.settings(DRAWWRITE_WARM_UP_TOKEN='secret'):
+                self.assertEqual(self.client.get(url).status_code, 404)
+                response = self.client.get(url, HTTP_X_WARM_UP_TOKEN='guess')
+                self.assertEqual(response.status_code, 404)
+            self.assertFalse(warm_up.called)
+
+    def test_startup_can_be_turned_off(self):
+        """DRAWWRITE_WARM_UP = False should skip warming up at startup."""
+        with mock.patch.object(warmup, 'warm_up') as warm_up:
+            with self.settings(DRAWWRITE_WARM_UP=False):
+                warmup.warm_up_at_startup()
+            self.assertFalse(warm_up.called)
+            warmup.warm_up_at_startup()
+            self.assertTrue(warm_up.called)
+
+    def test_startup_failures_are_logged(self):
+        """A failing warm-up should not stop a worker from starting."""
+        with mock.patch.object(warmup, 'warm_up', side_effect=RuntimeError('db down')):
+            with mock.patch.object(warmup, 'LOG') as log:
+                warmup.warm_up_at_startup()
+        log.exception.assert_called_once_with('warm up failed')
+# }}}
+
+# AdmissionControlTests {{{
+class AdmissionControlTests(TestCase):
+    """Tests for rate limiting and load shedding."""
+
+    def setUp(self):
+        """Put the admission middleware first, with small limits."""
+        middleware_override = self.modify_settings(MIDDLEWARE={
+            'prepend': 'drawwrite.middleware.AdmissionControl',
+        })
+        middleware_override.enable()
+        self.addCleanup(middleware_override.disable)
+        limits_override = self.settings(DRAWWRITE_ADMISSION={
+            'checkRoundDone': admission.Limit('player', 2, 60, sheddable=True),
+            'createLink': admission.Limit('player', 2, 60),
+        })
+        limits_override.enable()
+        self.addCleanup(limits_override.disable)
+
+    def test_limiter_allows_a_burst_then_refills(self):
+        """A bucket should allow its limit at once, then one per interval."""
+        limiter = admission.RateLimiter()
+        limit = admission.Limit('ip', 2, 10)
+        self.assertEqual(limiter.acquire('a', limit, now=0), 0)
+        self.assertEqual(limiter.acquire('a', limit, now=0), 0)
+        self.assertEqual(limiter.acquire('a', limit, now=0), 5)
+        self.assertEqual(limiter.acquire('b', limit, now=0), 0)
+        self.assertEqual(limiter.acquire('a', limit, now=5), 0)
+
+    def test_limiter_forgets_least_recently_used_keys(self):
+        """Past max_keys, the oldest bucket should be dropped."""
+        limiter = admission.RateLimiter(max_keys=2)
+        limit = admission.Limit('ip', 1, 60)
+        for key in ('a', 'b', 'c'):
+            limiter.acquire(key, limit, now=0)
+        self.assertEqual(list(limiter.buckets), ['b', 'c'])
+        self.assertEqual(limiter.acquire('a', limit, now=0), 0)
+
+    def test_shedder_uses_mean_over_window(self):
+        """Slow queries should overload the shedder until they age out."""
+        shedder = admission.LoadShedder(50, window_seconds=10, min_queries=4)
+        shedder.record(0.4, 2, now=0)
+        self.assertFalse(shedder.overloaded(now=0))
+        shedder.record(0.4, 2, now=1)
+        self.assertTrue(shedder.overloaded(now=1))
+        shedder.record(0.004, 4, now=12)
+        self.assertFalse(shedder.overloaded(now=12))
+
+    def test_over_limit_gets_429_without_queries(self):
+        """Requests over the limit should get a 429 before touching the database."""
+        game = build_game('limited', 2)
+        player = Player.objects.filter(game=game).first() #pylint: disable=no-member
+        url = reverse('drawwrite:checkRoundDone', args=[player.pk])
+        for _ in range(2):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertContains(response, 'try again in 30 seconds', status_code=429)
+        self.assertEqual(len(queries), 0)
+
+        # Other players have their own limits.
+        other = Player.objects.filter(game=game).exclude(pk=player.pk).first() #pylint: disable=no-member
+        other_url = reverse('drawwrite:checkRoundDone', args=[other.pk])
+        self.assertEqual(self.client.get(other_url).status_code, 200)
+
+    def test_room_behind_one_address_can_play(self):
+        """
+        Players sharing an address behind NAT should be able to join one
+        game and poll for its end under the default limits.
+        """
+        with self.settings(DRAWWRITE_ADMISSION=urls.ADMISSION):
+            game = build_game('room', 1, start=False)
+            for num in range(20):
+                response = self.client.post(reverse('drawwrite:joinGame'), {
+                    'username': 'guest{0}'.format(num), 'gamename': game.name,
+                })
+                self.assertNotEqual(response.status_code, 429)
+            url = reverse('drawwrite:checkGameDone', args=[game.pk])
+            # A minute of polling from six players.
+            for _ in range(6 * urls.POLLS_PER_MINUTE):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_unlimited_views_are_left_alone(self):
+        """Views without a limit should never be turned away."""
+        game = build_game('limited', 2)
+        for _ in range(5):
+            response = self.client.get(reverse('drawwrite:showGame', args=[game.pk]))
+            self.assertEqual(response.status_code, 200)
+
+    def test_timing_with_slow_query_log(self):
+        """
+        Timing queries for shedding and for the slow query log at once
+        should record them, and leave the connections as they were.
+        """
+        game = build_game('timed', 2, start=False)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, 'slow.jsonl')
+        slow_log = self.modify_settings(MIDDLEWARE={'append': 'drawwrite.middleware.SlowQueryLog'})
+        with slow_log, self.settings(DRAWWRITE_SHED_DB_MS=1000, DRAWWRITE_SLOW_QUERY_MS=0,
+                                     DRAWWRITE_SLOW_QUERY_LOG=path):
+            response = self.client.get(reverse('drawwrite:showGame', args=[game.pk]))
+        self.assertEqual(response.status_code, 200)
+        with open(path) as log:
+            self.assertTrue(log.readlines())
+        self.assertNotIn('make_cursor', connection.__dict__)
+        self.assertNotIn('make_debug_cursor', connection.__dict__)
+
+    def test_slow_database_sheds_sheddable_views(self):
+        """While the database is slow only sheddable views should get a 503."""
+        game = build_game('shed', 2, start=False)
+        player = Player.objects.filter(game=game).first() #pylint: disable=no-member
+        with self.settings(DRAWWRITE_SHED_DB_MS=0, DRAWWRITE_SHED_MIN_QUERIES=1):
+            self.client.get(reverse('drawwrite:showGame', args=[game.pk]))
+            response = self.client.get(reverse('drawwrite:checkRoundDone', args=[player.pk]))
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '5')
+            response = self.client.get(reverse('drawwrite:showGame', args=[game.pk]))
+            self.assertEqual(response.status_code, 200)
+# }}}
+
+# CreateLinkJsonTests {{{
+class CreateLinkJsonTests(TempMediaMixin, TestCase):
+    """Tests for submitting links with an XHR."""
+
+    def submit(self, player_id, description):
+        """Submit a write link as an XHR, and return the parsed response."""
+        response = self.client.post(
+            reverse('drawwrite:createLink', args=[player_id]),
+            {'description': description},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response.status_code, response.json()
+
+    def test_round_waiting_then_next_link(self):
+        """
+        The first player to finish should be told to wait, and the last one
+        should get the next link to add to without another request.
+        """
+        game = build_game('xhr', 2)
+        first, second = Player.objects.filter(game=game).order_by('position') #pylint: disable=no-member
+
+        status, move = self.submit(first.pk, 'first words')
+        self.assertEqual(status, 200)
+        self.assertEqual(move, {
+            'state': 'roundWaiting',
+            'url': reverse('drawwrite:play', args=[first.pk]),
+            'poll_url': reverse('drawwrite:checkRoundDone', args=[first.pk]),
+        })
+
+        status, move = self.submit(second.pk, 'second words')
+        self.assertEqual(status, 200)
+        self.assertEqual(move['state'], 'add')
+        self.assertEqual(move['prev_link_type'], 'write')
+        self.assertEqual(move['prev_link'], {'text': 'first words'})
+
+    def test_last_link_waits_for_game(self):
+        """Finishing the last round should say the game is over."""
+        game = build_game('xhr', 2, rounds=1, extra_finishers=1)
+        last = Player.objects.get(game=game, position=1) #pylint: disable=no-member
+        response = self.client.post(
+            reverse('drawwrite:createLink', args=[last.pk]),
+            {'drawing': 'data:image/png;base64,iVBORw0KGgo='},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        move = response.json()
+        self.assertEqual(move['state'], 'finished')
+        self.assertEqual(move['url'], reverse('drawwrite:showGame', args=[game.pk]))
+
+    def test_repeated_submission_says_what_to_do(self):
+        """Submitting twice should not add a link, only repeat the next move."""
+        game = build_game('xhr', 2)
+        first = Player.objects.get(game=game, position=0) #pylint: disable=no-member
+        self.submit(first.pk, 'words')
+        status, move = self.submit(first.pk, 'words again')
+        self.assertEqual(status, 200)
+        self.assertEqual(move['state'], 'roundWaiting')
+        self.assertEqual(WriteLink.objects.filter(added_by=first).count(), 1) #pylint: disable=no-member
+
+    def test_missing_player(self):
+        """An unknown player should get a JSON 404, not a redirect."""
+        status, move = self.submit(987654, 'words')
+        self.assertEqual(status, 404)
+        self.assertEqual(move, {'error': 'Player Does Not Exist'})
+
+    def test_form_posts_still_redirect(self):
+        """Plain form posts should still be redirected to play."""
+        game = build_game('xhr', 2)
+        first = Player.objects.get(game=game, position=0) #pylint: disable=no-member
+        response = self.client.post(
+            reverse('drawwrite:createLink', args=[first.pk]),
+            {'description': 'words'},
+        )
+        self.assertRedirects(response, reverse('drawwrite:play', args=[first.pk]))
+# }}}
+
+# ApiContractTests {{{
+class ApiContractTests(TempMediaMixin, TestCase):
+    """
+    Pin down the requests and responses of the JSON API, which clients
+    outside this repository depend on.
+    """
+
+    def call(self, method, url_name, args=(), data=None, status=200, **kwargs):
+        """Make an API request, check its status, and return its JSON."""
+        url = reverse('drawwrite:' + url_name, args=args)
+        if method == 'GET':
+            response = self.client.get(url, data)
+        elif data is not None and 'content_type' not in kwargs and not any(
+                hasattr(value, 'read') for value in data.values()):
+            response = self.client.post(url, json.dumps(data), content_type='application/json')
+        else:
+            response = self.client.post(url, data, **kwargs)
+        self.assertEqual(response.status_code, status, response.content)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertNotIn(b', ', response.content)
+        return response.json()
+
+    def enter(self, url_name, game, player):
+        """Create or join game as player, and return their token."""
+        data = self.call('POST', url_name, data={'game': game, 'player': player}, status=201)
+        self.assertEqual(set(data), {'token', 'player', 'game'})
+        self.assertEqual(api.read_token(data['token']), data['player'])
+        return data['token']
+
+    def test_whole_game(self):
+        """Two players should be able to play a whole game through the API."""
+        ann = self.enter('apiCreateGame', 'api', 'ann')
+        bob = self.enter('apiJoinGame', 'api', 'bob')
+
+        self.assertEqual(self.call('GET', 'apiLobby', [bob]), {
+            'started': False, 'creator': False, 'players': ['ann', 'bob'],
+        })
+        self.assertEqual(self.call('POST', 'apiStartGame', [bob],
+                                   status=403), {'error': 'notCreator'})
+        self.assertEqual(self.call('GET', 'apiTask', [bob], status=409), {'error': 'notStarted'})
+        self.assertEqual(self.call('POST', 'apiStartGame', [ann]),
+                         {'state': 'add', 'type': 'write'})
+        self.assertEqual(self.call('GET', 'apiLobby', [bob]), {'started': True})
+
+        # Round one: both write.
+        self.assertEqual(self.call('POST', 'apiCreateLink', [ann], {'text': 'a cat'}, status=201),
+                         {'state': 'roundWaiting'})
+        self.assertEqual(self.call('POST', 'apiCreateLink', [bob], {'text': 'a dog'}, status=201),
+                         {'state': 'add', 'type': 'draw', 'prev': {'text': 'a cat'}})
+        self.assertEqual(self.call('GET', 'apiTask', [ann]),
+                         {'state': 'add', 'type': 'draw', 'prev': {'text': 'a dog'}})
+
+        # Repeats and the wrong type of link are refused.
+        self.assertEqual(self.call('POST', 'apiCreateLink', [ann], {'text': 'a cat'}, status=400),
+                         {'error': 'noDrawing'})
+        drawing = SimpleUploadedFile('a.png', b'GIF89a')
+        self.assertEqual(self.call('POST', 'apiCreateLink', [ann], {'drawing': drawing},
+                                   status=400), {'error': 'notPng'})
+
+        # Round two: both draw, which finishes the game.
+        drawing = SimpleUploadedFile('a.png', services.PNG_SIGNATURE + b'ann')
+        self.assertEqual(self.call('POST', 'apiCreateLink', [ann], {'drawing': drawing},
+                                   status=201), {'state': 'gameWaiting'})
+        drawing = SimpleUploadedFile('b.png', services.PNG_SIGNATURE + b'bob')
+        self.assertEqual(self.call('POST', 'apiCreateLink', [bob], {'drawing': drawing},
+                                   status=201), {'state': 'finished'})
+        self.assertEqual(self.call('POST', 'apiCreateLink', [bob], {'text': 'late'}, status=409),
+                         {'state': 'finished'})
+
+        game_id = Game.objects.get(name='api').pk #pylint: disable=no-member
+        results = self.call('GET', 'apiResults', [game_id])
+        self.assertEqual(set(results), {'name', 'page', 'pages', 'chains'})
+        self.assertEqual((results['name'], results['page'], results['pages']), ('api', 1, 1))
+        self.assertEqual([chain['player'] for chain in results['chains']], ['ann', 'bob'])
+        first, second = results['chains'][0]['links']
+        self.assertEqual(first, {'by': 'ann', 'text': 'a cat'})
+        self.assertEqual(set(second), {'by', 'drawing'})
+        self.assertEqual(second['by'], 'bob')
+
+    def test_results_are_paged(self):
+        """Results should come DRAWWRITE_API_PAGE_SIZE chains at a time."""
+        game = build_game('paged', 3, rounds=3)
+        with self.settings(DRAWWRITE_API_PAGE_SIZE=2):
+            first = self.call('GET', 'apiResults', [game.pk])
+            second = self.call('GET', 'apiResults', [game.pk], {'page': 2})
+            self.call('GET', 'apiResults', [game.pk], {'page': 3}, status=404)
+        self.assertEqual((first['pages'], len(first['chains'])), (2, 2))
+        self.assertEqual((second['page'], len(second['chains'])), (2, 1))
+        self.assertEqual(len(second['chains'][0]['links']), 3)
+
+    def test_unfinished_results(self):
+        """Results of games still being played should not be shown."""
+        game = build_game('playing', 2, rounds=1)
+        self.assertEqual(self.call('GET', 'apiResults', [game.pk], status=409),
+                         {'error': 'notFinished'})
+
+    def test_tokens_must_be_signed(self):
+        """Tokens with a bad signature, or for players that are gone, are refused."""
+        self.assertEqual(self.call('GET', 'apiLobby', ['1:forged'], status=403),
+                         {'error': 'badToken'})
+        self.assertEqual(self.call('GET', 'apiLobby', [api.get_signer().sign('987654')],
+                                   status=404), {'error': 'noPlayer'})
+
+    def test_entry_errors(self):
+        """Creating and joining should report what went wrong."""
+        self.enter('apiCreateGame', 'taken', 'ann')
+        self.assertEqual(self.call('POST', 'apiCreateGame', data={'game': 'taken', 'player': 'x'},
+                                   status=409), {'error': 'gameExists'})
+        self.assertEqual(self.call('POST', 'apiJoinGame', data={'game': 'taken', 'player': 'ann'},
+                                   status=409), {'error': 'nameTaken'})
+        self.assertEqual(self.call('POST', 'apiJoinGame', data={'game': 'nope', 'player': 'x'},
+                                   status=404), {'error': 'noGame'})
+        self.assertEqual(self.call('POST', 'apiCreateGame', data={'game': 'a b', 'player': 'x'},
+                                   status=400), {'error': 'badName'})
+        self.assertEqual(self.call('POST', 'apiCreateGame', data='[]',
+                                   content_type='application/json', status=400),
+                         {'error': 'badBody'})
+# }}}
+
+# ResumableUploadTests {{{
+class ResumableUploadTests(TempMediaMixin, TestCase):
+    """Tests for chunked drawing uploads and idempotent link submissions."""
+
+    def setUp(self):
+        """Make a game in its drawing round."""
+        super(ResumableUploadTests, self).setUp()
+        self.game = build_game('uploads', 2, rounds=1)
+        self.player = Player.objects.get(game=self.game, position=0) #pylint: disable=no-member
+        self.token = api.make_token(self.player)
+        self.drawing = services.PNG_SIGNATURE + bytes(range(256)) * 4
+
+    def start(self, size):
+        """Start an upload of size bytes and return its id."""
+        response = self.client.post(
+            reverse('drawwrite:apiStartUpload', args=[self.token]),
+            json.dumps({'size': size}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()['upload']
+
+    def put(self, upload_id, offset, data):
+        """Send a chunk, and return the status and the parsed response."""
+        response = self.client.put(
+            '{0}?offset={1}'.format(
+                reverse('drawwrite:apiUpload', args=[self.token, upload_id]), offset),
+            data,
+            content_type='application/octet-stream',
+        )
+        return response.status_code, response.json()
+
+    def submit(self, data, key=None):
+        """Submit a link as JSON, and return the response."""
+        extra = {'HTTP_IDEMPOTENCY_KEY': key} if key is not None else {}
+        return self.client.post(
+            reverse('drawwrite:apiCreateLink', args=[self.token]),
+            json.dumps(data),
+            content_type='application/json',
+            **extra
+        )
+
+    def test_resumed_upload(self):
+        """An interrupted upload should carry on from what was received."""
+        upload_id = self.start(len(self.drawing))
+        self.assertEqual(self.put(upload_id, 0, self.drawing[:600]),
+                         (200, {'received': 600, 'size': len(self.drawing)}))
+
+        # A chunk sent again, or from the wrong place, says where to carry on.
+        self.assertEqual(self.put(upload_id, 0, self.drawing[:600])[1]['received'], 600)
+        self.assertEqual(self.put(upload_id, 700, self.drawing[700:])[0], 409)
+        response = self.client.get(reverse('drawwrite:apiUpload', args=[self.token, upload_id]))
+        self.assertEqual(response.json(), {'received': 600, 'size': len(self.drawing)})
+
+        # Links can't be made from incomplete uploads.
+        response = self.submit({'upload': upload_id})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'error': 'uploadIncomplete', 'received': 600})
+
+        self.assertEqual(self.put(upload_id, 600, self.drawing[600:])[0], 200)
+        response = self.submit({'upload': upload_id})
+        self.assertEqual(response.status_code, 201)
+        link = DrawLink.objects.get(added_by=self.player) #pylint: disable=no-member
+        with default_storage.open(link.drawing.name, 'rb') as drawing:
+            self.assertEqual(drawing.read(), self.drawing)
+        self.assertFalse(Upload.objects.exists()) #pylint: disable=no-member
+        self.assertFalse(UploadChunk.objects.exists()) #pylint: disable=no-member
+
+    def test_limits(self):
+        """Uploads and chunks over the size limits should be refused."""
+        with self.settings(DRAWWRITE_UPLOAD_MAX_BYTES=100, DRAWWRITE_UPLOAD_CHUNK_BYTES=10):
+            response = self.client.post(
+                reverse('drawwrite:apiStartUpload', args=[self.token]),
+                json.dumps({'size': 101}),
+                content_type='application/json',
+            )
+            self.assertEqual(response.json(), {'error': 'badSize'})
+            upload_id = self.start(100)
+            self.assertEqual(self.put(upload_id, 0, b'x' * 11), (413, {'error': 'chunkTooLarge'}))
+
+    def test_uploads_belong_to_their_player(self):
+        """Other players should not see or use someone's upload."""
+        upload_id = self.start(10)
+        self.token = api.make_token(Player.objects.get(game=self.game, position=1)) #pylint: disable=no-member
+        self.assertEqual(self.put(upload_id, 0, b'x'), (404, {'error': 'noUpload'}))
+
+    def test_retry_with_idempotency_key(self):
+        """A retried submission should get the original response back."""
+        upload_id = self.start(len(self.drawing))
+        self.put(upload_id, 0, self.drawing)
+        first = self.submit({'upload': upload_id}, key='abc')
+        self.assertEqual(first.status_code, 201)
+
+        retry = self.submit({'upload': upload_id}, key='abc')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(DrawLink.objects.filter(added_by=self.player).count(), 1) #pylint: disable=no-member
+        self.assertEqual(IdempotencyKey.objects.count(), 1) #pylint: disable=no-member
+
+        # Without the key, a repeat is refused but says what to do.
+        self.assertEqual(self.submit({'upload': upload_id}).status_code, 409)
+
+    def test_retry_that_waited_for_the_chain(self):
+        """
+        A retry that missed the kept response, because it looked before the
+        original committed, should still get it once it has the chain.
+        """
+        upload_id = self.start(len(self.drawing))
+        self.put(upload_id, 0, self.drawing)
+        first = self.submit({'upload': upload_id}, key='abc')
+        remembered = uploads.remembered
+        looks = []
+
+        def remembered_late(player, key):
+            """Miss the kept response the first time."""
+            looks.append(key)
+            return None if len(looks) == 1 else remembered(player, key)
+
+        with mock.patch.object(uploads, 'remembered', side_effect=remembered_late):
+            retry = self.submit({'upload': upload_id}, key='abc')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(IdempotencyKey.objects.count(), 1) #pylint: disable=no-member
+
+    def test_uploads_only_for_drawings(self):
+        """Players whose task isn't a drawing should not start uploads."""
+        upload_id = self.start(len(self.drawing))
+        self.put(upload_id, 0, self.drawing)
+        self.submit({'upload': upload_id})
+        response = self.client.post(
+            reverse('drawwrite:apiStartUpload', args=[self.token]),
+            json.dumps({'size': 10}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['state'], 'gameWaiting')
+        self.assertFalse(Upload.objects.exists()) #pylint: disable=no-member
+
+    def test_abandoned_uploads_are_reaped(self):
+        """Uploads left unsubmitted past their timeout should be deleted."""
+        old = self.start(len(self.drawing))
+        self.put(old, 0, self.drawing[:100])
+        Upload.objects.filter(pk=old).update( #pylint: disable=no-member
+            time_created=timezone.now() - datetime.timedelta(hours=2))
+        fresh = self.start(len(self.drawing))
+        self.assertEqual(reaper.reap(dry_run=True)['uploads'], 1)
+        self.assertEqual(reaper.reap()['uploads'], 1)
+        self.assertEqual(list(Upload.objects.values_list('pk', flat=True)), [fresh]) #pylint: disable=no-member
+        self.assertFalse(UploadChunk.objects.filter(upload=old).exists()) #pylint: disable=no-member
+
+    def test_failed_submissions_are_not_kept(self):
+        """Refused submissions should not use up their key."""
+        self.assertEqual(self.submit({'text': 'not a drawing'}, key='abc').status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists()) #pylint: disable=no-member
+        response = self.client.post(
+            reverse('drawwrite:apiCreateLink', args=[self.token]),
+            {'drawing': SimpleUploadedFile('d.png', self.drawing)},
+            HTTP_IDEMPOTENCY_KEY='abc',
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_bad_keys_are_refused(self):
+        """Empty keys and keys over 64 characters should be refused."""
+        for key in ('', 'k' * 65):
+            response = self.submit({'text': 'words'}, key=key)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'badIdempotencyKey'})
+# }}}
+
+# NextTaskPrefetchTests {{{
+class NextTaskPrefetchTests(TestCase):
+    """Tests for the end of a round coming with each player's next task."""
+
+    def check(self, player_id):
+        """Poll for the end of player_id's round, and return the response."""
+        return self.client.get(reverse('drawwrite:checkRoundDone', args=[player_id]))
+
+    def test_waiting_has_no_task(self):
+        """Until the round ends there should be no next task."""
+        game = build_game('prefetch', 2, extra_finishers=1)
+        first = player_ids(game)[0]
+        data = self.check(first).json()
+        self.assertEqual(data, {'finished': False, 'still_playing': ['player1']})
+
+    def test_next_text(self):
+        """A player who draws next should get the text to draw."""
+        game = build_game('prefetch', 2, rounds=1)
+        first = player_ids(game)[0]
+        response = self.check(first)
+        self.assertEqual(response.json(), {
+            'finished': True,
+            'next': {
+                'state': 'add',
+                'url': reverse('drawwrite:play', args=[first]),
+                'prev_link_type': 'write',
+                'prev_link': {'text': 'text from player1'},
+            },
+        })
+        self.assertFalse(response.has_header('Link'))
+
+    def test_next_drawing_is_hinted(self):
+        """A player who writes next should get the drawing, with a preload hint."""
+        game = build_game('prefetch', 3, rounds=2)
+        first, second, _ = player_ids(game)
+        response = self.check(first)
+        move = response.json()['next']
+        self.assertEqual(move['prev_link_type'], 'draw')
+        drawing = move['prev_link']['drawing']
+        self.assertTrue(drawing.endswith('link-{0}.png'.format(second)))
+        self.assertEqual(response['Link'], '<{0}>; rel=preload; as=image'.format(drawing))
+
+    def test_play_page_can_switch_tasks(self):
+        """
+        The play page should carry both inputs, with the one that isn't
+        used hidden and left out of the form.
+        """
+        game = build_game('prefetch', 2, rounds=1)
+        first = player_ids(game)[0]
+        response = self.client.get(reverse('drawwrite:play', args=[first]))
+        self.assertContains(response, '<div class="writeInput hidden">')
+        self.assertContains(response, 'name="description" id="id_description" disabled')
+        self.assertContains(response, '<input id="imgDataHolder" type="hidden" name="drawing">')
+        self.assertContains(response, '<div class="waitingArea hidden">')
+# }}}
+
+# ChainPagingTests {{{
+@override_settings(DRAWWRITE_CHAIN_PAGE_SIZE=4)
+class ChainPagingTests(TempMediaMixin, TestCase):
+    """Tests for showing long chains a page at a time, four links a page."""
+
+    def test_first_page(self):
+        """The chain page should show the first page, and link to the rest."""
+        game = build_game('paged', 10, rounds=10)
+        player_id = Player.objects.get(game=game, position=0).pk #pylint: disable=no-member
+        response = self.client.get(reverse('drawwrite:showChain', args=[player_id]))
+        self.assertEqual(len(response.context['links']), 4)
+        self.assertContains(response, 'data-fragment-url="{0}?page=2"'.format(
+            reverse('drawwrite:showChainLinks', args=[player_id])))
+        self.assertContains(response, 'loading="lazy"')
+        # Two copies of the script would each append every fragment.
+        self.assertContains(response, 'js/page/chain.js', count=1)
+
+    def test_fragments(self):
+        """Each fragment should hold the next links, and say where the next one is."""
+        game = build_game('paged', 10, rounds=10)
+        player_id = Player.objects.get(game=game, position=0).pk #pylint: disable=no-member
+        url = reverse('drawwrite:showChainLinks', args=[player_id])
+
+        data = self.client.get(url + '?page=2').json()
+        self.assertEqual(data['next'], url + '?page=3')
+        self.assertEqual(data['html'].count('<h4>'), 4)
+        self.assertIn('text from player4', data['html'])
+
+        data = self.client.get(url + '?page=3').json()
+        self.assertIsNone(data['next'])
+        self.assertEqual(data['html'].count('<h4>'), 2)
+
+        self.assertEqual(self.client.get(url + '?page=4').status_code, 404)
+        response = self.client.get(reverse('drawwrite:showChain', args=[player_id]) + '?page=x')
+        self.assertEqual(response.status_code, 400)
+
+    def test_drawings_are_sized(self):
+        """Drawings should be shown at the size in their PNG header."""
+        game = build_game('sized', 2, rounds=1)
+        player = Player.objects.get(game=game, position=0) #pylint: disable=no-member
+        chain = Chain.objects.get(player__game=game, player__position=1) #pylint: disable=no-member
+        drawing = (services.PNG_SIGNATURE + b'\x00\x00\x00\rIHDR' +
+                   (540).to_bytes(4, 'big') + (500).to_bytes(4, 'big') + b'rest')
+        link = services.new_draw_link(chain, ContentFile(drawing, name='sized.png'), player)
+        self.assertEqual((link.width, link.height), (540, 500))
+        self.assertEqual(services.png_size(ContentFile(b'not a png')), (None, None))
+
+        owner = chain.player_id
+        response = self.client.get(reverse('drawwrite:showChain', args=[owner]))
+        self.assertContains(response, 'width="540" height="500"')
+
+        # The same should come from the link rows when the list is behind.
+        Chain.objects.filter(pk=chain.pk).update(links='[]') #pylint: disable=no-member
+        response = self.client.get(reverse('drawwrite:showChain', args=[owner]))
+        self.assertContains(response, 'width="540" height="500"')
+# }}}
+
+# ResultsPageTests {{{
+class ResultsPageTests(TestCase):
+    """Tests for showing every chain of a game at once."""
+
+    def test_page_has_every_chain(self):
+        """The page should stream out every chain, with every link, in order."""
+        game = build_game('results', 3, rounds=3)
+        response = self.client.get(reverse('drawwrite:showResults', args=[game.pk]))
+        self.assertTrue(response.streaming)
+        page = b''.join(response.streaming_content).decode('utf-8')
+        positions = [page.index("player{0}'s chain".format(num)) for num in range(3)]
+        self.assertEqual(positions, sorted(positions))
+        self.assertEqual(page.count('wrote:'), 6)
+        self.assertEqual(page.count('drew:'), 3)
+        self.assertIn('Back', page)
+
+    def test_queries_do_not_grow(self):
+        """A big game should take as many queries as a small one."""
+        small = build_game('small', 2, rounds=2)
+        big = build_game('big', 12, rounds=12)
+        for game in (small, big):
+            with self.assertNumQueries(2):
+                document = self.client.get(
+                    reverse('drawwrite:resultsDocument', args=[game.pk])).json()
+            self.assertEqual(len(document['chains']), game.num_players)
+            self.assertEqual(len(document['chains'][0]['links']), game.num_players)
+
+    def test_lists_behind(self):
+        """Chains whose lists are behind should be read from their link rows at once."""
+        game = build_game('behind', 4, rounds=4)
+        url = reverse('drawwrite:resultsDocument', args=[game.pk])
+        from_lists = self.client.get(url).json()
+        Chain.objects.filter(player__game=game).update(links='[]') #pylint: disable=no-member
+        with self.assertNumQueries(4):
+            from_rows = self.client.get(url).json()
+        self.assertEqual(from_lists, from_rows)
+        self.assertEqual(from_rows['chains'][0]['links'][0], {
+            'by': 'player0', 'text': 'text from player0',
+        })
+
+    def test_missing_game(self):
+        """Unknown games should not be found."""
+        response = self.client.get(reverse('drawwrite:resultsDocument', args=[987654]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('drawwrite:showResults', args=[987654]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_unfinished_game(self):
+        """Games still being played should not show their chains yet."""
+        game = build_game('unfinished', 3, rounds=2)
+        for url_name in ('showResults', 'resultsDocument'):
+            response = self.client.get(reverse('drawwrite:' + url_name, args=[game.pk]))
+            self.assertEqual(response.status_code, 404)
+# }}}
+
+# SearchTests {{{
+class SearchTests(TempMediaMixin, TestCase):
+    """Tests for finding chains by the words written in them."""
+
+    def play(self, name, texts, finish=True):
+        """
+        Return a game with a player for each of texts, where each chain
+        starts with one of texts, that has finished if finish is set.
+        """
+        game = build_game(name, len(texts), start=False)
+        services.start_game(game)
+        players = list(Player.objects.filter(game=game).order_by('position')) #pylint: disable=no-member
+        for player, text in zip(players, texts):
+            chain = services.new_chain(player)
+            services.new_write_link(chain, text, player)
+            services.player_finished(player)
+        if finish:
+            for _ in range(len(texts) - 1):
+                for player in players:
+                    add_next_link(player.pk)
+        game.refresh_from_db()
+        return game
+
+    def search(self, query, **params):
+        """Return the parsed results of searching for query."""
+        params['q'] = query
+        response = self.client.get(reverse('drawwrite:searchChains'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def chain_urls(self, document):
+        """Return the chain URLs of a page of results."""
+        return [result['chain_url'] for result in document['results']]
+
+    def chain_url(self, game, position):
+        """Return the chain URL of the player at position in game."""
+        player = Player.objects.get(game=game, position=position) #pylint: disable=no-member
+        return reverse('drawwrite:showChain', args=[player.pk])
+
+    def test_finds_chains_with_every_word(self):
+        """Only chains with every word of the query should be found."""
+        game = self.play('animals', ['a red fox', 'a red hen'])
+        self.assertEqual(len(self.search('RED')['results']), 2)
+        document = self.search('red, fox!')
+        self.assertEqual(self.chain_urls(document), [self.chain_url(game, 0)])
+        self.assertEqual(document['results'][0]['game'], 'animals')
+        self.assertEqual(document['results'][0]['player'], 'player0')
+        self.assertEqual(document['results'][0]['results_url'],
+                         reverse('drawwrite:showResults', args=[game.pk]))
+        self.assertEqual(self.search('blue fox')['results'], [])
+
+    def test_best_first(self):
+        """Chains where the words stand out should come first."""
+        game = self.play('ranked', [
+            'a fox walks past a long row of houses on a quiet street',
+            'fox',
+        ])
+        self.assertEqual(self.chain_urls(self.search('fox')),
+                         [self.chain_url(game, 1), self.chain_url(game, 0)])
+
+    def test_snippets_mark_words_and_escape_text(self):
+        """Snippets should be safe HTML with the matching words marked."""
+        self.play('markup', ['<b>fox</b> & hen', 'nothing'])
+        snippet = self.search('fox')['results'][0]['snippet']
+        self.assertEqual(snippet, '&lt;b&gt;<mark>fox</mark>&lt;/b&gt; &amp; hen')
+
+    def test_unfinished_games_are_hidden(self):
+        """Chains of games still being played should not be found."""
+        game = self.play('unfinished', ['a secret fox', 'a secret hen'], finish=False)
+        self.assertEqual(self.search('secret')['results'], [])
+        Game.objects.filter(pk=game.pk).update(round_num=game.num_players) #pylint: disable=no-member
+        self.assertEqual(len(self.search('secret')['results']), 2)
+
+    def test_later_links_are_indexed(self):
+        """Each write link should be searchable once its chain's game finishes."""
+        game = self.play('later', ['first', 'second', 'third'])
+        # In the third round, player2 writes on the chain that started with player1.
+        document = self.search('text from player2')
+        self.assertEqual(self.chain_urls(document), [self.chain_url(game, 1)])
+
+    def test_only_newest_candidates_are_ranked(self):
+        """Only the newest DRAWWRITE_SEARCH_CANDIDATES matches should be ranked."""
+        game = self.play('candidates', ['fox', 'a fox walks past a long row of houses'])
+        with self.settings(DRAWWRITE_SEARCH_CANDIDATES=1):
+            self.assertEqual(self.chain_urls(self.search('fox')), [self.chain_url(game, 1)])
+
+    def test_pages(self):
+        """Results should come a page at a time, up to the most pages."""
+        self.play('paged', ['same words', 'same words', 'same words'])
+        with self.settings(DRAWWRITE_SEARCH_PAGE_SIZE=2, DRAWWRITE_SEARCH_MAX_PAGES=3):
+            first = self.search('same')
+            self.assertEqual(first['page'], 1)
+            self.assertEqual(len(first['results']), 2)
+            second = self.client.get(first['next']).json()
+            self.assertEqual(second['page'], 2)
+            self.assertEqual(len(second['results']), 1)
+            self.assertIsNone(second['next'])
+            self.assertEqual(len(set(self.chain_urls(first) + self.chain_urls(second))), 3)
+            url = reverse('drawwrite:searchChains')
+            self.assertEqual(self.client.get(url, {'q': 'same', 'page': 4}).status_code, 404)
+            self.assertEqual(self.client.get(url, {'q': 'same', 'page': 'x'}).status_code, 404)
+            self.assertEqual(self.client.get(url, {'q': ' ?! '}).status_code, 400)
+
+    def test_reaped_games_are_forgotten(self):
+        """Deleting a stalled game should delete its chains' rows."""
+        game = self.play('stalled', ['gone fox', 'gone hen'], finish=False)
+        self.play('kept', ['kept fox', 'kept hen'])
+        Game.objects.filter(pk=game.pk).update( #pylint: disable=no-member
+            last_activity=timezone.now() - datetime.timedelta(days=2))
+        self.assertEqual(reaper.reap()['games'], 1)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM drawwrite_search')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_archived_games_stay_searchable(self):
+        """Archiving a game should keep its chains in the index."""
+        game = self.play('archived', ['old fox', 'old hen'])
+        for name in set(DrawLink.objects.values_list('drawing', flat=True)): #pylint: disable=no-member
+            default_storage.save(name, ContentFile(b'png'))
+        archive.archive_game(game)
+        document = self.search('old fox')
+        self.assertEqual(len(document['results']), 1)
+        response = self.client.get(document['results'][0]['chain_url'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_rebuild(self):
+        """Rebuilding the index should bring back live and archived chains."""
+        archived = self.play('archived', ['old fox', 'old hen'])
+        for name in set(DrawLink.objects.values_list('drawing', flat=True)): #pylint: disable=no-member
+            default_storage.save(name, ContentFile(b'png'))
+        archive.archive_game(archived)
+        self.play('live', ['new fox', 'new hen'])
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM drawwrite_search')
+        self.assertEqual(self.search('fox')['results'], [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(len(self.search('fox')['results']), 2)
+        self.assertEqual(len(self.search('old')['results']), 2)
+# }}}
@@ -0,0 +1,97 @@
+"""Resumable drawing uploads and idempotent submissions for the API.
+
+A client starts an Upload with the drawing's size, then sends it in
+chunks, each starting where the bytes received so far end. After a
+failure it asks how much was received and sends only the rest. The
+finished upload is taken, and deleted, when the link is submitted, and
+uploads that are never submitted are deleted by the reaper once they are
+DRAWWRITE_UPLOAD_TIMEOUT_MINUTES old.
+
+Requests made with an Idempotency-Key header have their response kept, so
+a retry of a submission that went through, but whose response was lost,
+gets the same response back instead of an error.
+"""
+
+# Imports {{{
+from django.conf import settings
+
+from .models import IdempotencyKey, Upload, UploadChunk
+from . import kvlog, sharding
+# }}}
+
+LOG = kvlog.get_logger(__name__)
+
+# Limits {{{
+def max_size():
+    """Return the largest upload allowed, from DRAWWRITE_UPLOAD_MAX_BYTES."""
+    return getattr(settings, 'DRAWWRITE_UPLOAD_MAX_BYTES', 5 * 1024 * 1024)
+
+def max_chunk_size():
+    """Return the largest chunk allowed, from DRAWWRITE_UPLOAD_CHUNK_BYTES."""
+    return getattr(settings, 'DRAWWRITE_UPLOAD_CHUNK_BYTES', 256 * 1024)
+# }}}
+
+# Uploads {{{
+def start(player, size):
+    """Return a new, empty Upload of size bytes for player."""
+    upload = Upload.objects.create(player=player, size=size) #pylint: disable=no-member
+    LOG.debug('started upload', upload_id=upload.pk, player_id=player.pk, size=size)
+    return upload
+
+def get(player, upload_id):
+    """Return player's Upload upload_id, or None."""
+    return Upload.objects.filter(pk=upload_id, player=player).first() #pylint: disable=no-member
+
+@sharding.atomic
+def add_chunk(player, upload_id, offset, data):
+    """
+    Add data to player's Upload upload_id if it starts at offset, the end
+    of what was received so far, and fits. Return the upload, whether or
+    not the chunk was added, or None if there is no such upload.
+    """
+    upload = Upload.objects.select_for_update().filter( #pylint: disable=no-member
+        pk=upload_id,
+        player=player,
+    ).first()
+    if upload is None:
+        return None
+    if offset != upload.received or upload.received + len(data) > upload.size:
+        LOG.info('chunk does not fit upload', upload_id=upload.pk, offset=offset,
+                 length=len(data), received=upload.received, size=upload.size)
+        return upload
+    UploadChunk.objects.create(upload=upload, offset=offset, data=data) #pylint: disable=no-member
+    upload.received += len(data)
+    upload.save(update_fields=['received'])
+    return upload
+
+def take(upload):
+    """
+    Return the bytes of a complete upload and delete it. Must be called in
+    a transaction on the current shard, so that the upload stays if the
+    link it is used for isn't added.
+    """
+    chunks = UploadChunk.objects.filter(upload=upload).order_by('offset') #pylint: disable=no-member
+    data = b''.join(bytes(chunk.data) for chunk in chunks)
+    UploadChunk.objects.filter(upload=upload).delete() #pylint: disable=no-member
+    Upload.objects.filter(pk=upload.pk).delete() #pylint: disable=no-member
+    return data
+# }}}
+
+# Idempotency keys {{{
+def remembered(player, key):
+    """Return the IdempotencyKey that player used key for, or None."""
+    return IdempotencyKey.objects.filter(player=player, key=key).first() #pylint: disable=no-member
+
+def remember(player, key, response):
+    """
+    Keep response as the one for player's key. Raises IntegrityError if
+    the key was already used, so it must be called in the transaction
+    that made the response.
+    """
+    IdempotencyKey.objects.create( #pylint: disable=no-member
+        player=player,
+        key=key,
+        status=response.status_code,
+        response=response.content.decode('utf-8'),
+    )
+# }}}
@@ -2,7 +2,8 @@
 
 from django.conf.urls import url
 
-from . import views
+from . import api, views
+from .admission import Limit
 
 app_name = "drawwrite" #pylint: disable=invalid-name
 urlpatterns = [ #pylint: disable=invalid-name
@@ -24,6 +25,71 @@ urlpatterns = [ #pylint: disable=invalid-name
         name='showGame'),
     url(r'^showChain/(?P<player_id>[0-9]+)$', views.show_chain,
         name='showChain'),
+    url(r'^showChain/(?P<player_id>[0-9]+)/links$', views.show_chain_links,
+        name='showChainLinks'),
+    url(r'^showResults/(?P<game_id>[0-9]+)$', views.show_results,
+        name='showResults'),
+    url(r'^showResults/(?P<game_id>[0-9]+)\.json$', views.results_document,
+        name='resultsDocument'),
     url(r'^getAvailableGames$', views.get_available_games,
-        name='getAvailableGames')
+        name='getAvailableGames'),
+    url(r'^search$', views.search_chains, name='searchChains'),
+    url(r'^archive/(?P<game_id>[0-9]+)/(?P<member>[0-9]+-[0-9]+\.png)$',
+        views.show_archived_drawing, name='showArchivedDrawing'),
+    url(r'^gameEvents/(?P<game_id>[0-9]+)$', views.game_events,
+        name='gameEvents'),
+    url(r'^warmUp$', views.warm_up, name='warmUp'),
+
+    # The JSON API, see drawwrite.api.
+    url(r'^api/v1/games$', api.create_game, name='apiCreateGame'),
+    url(r'^api/v1/games/join$', api.join_game, name='apiJoinGame'),
+    url(r'^api/v1/players/(?P<token>[0-9]+:[\w-]+)/lobby$', api.lobby,
+        name='apiLobby'),
+    url(r'^api/v1/players/(?P<token>[0-9]+:[\w-]+)/start$', api.start_game,
+        name='apiStartGame'),
+    url(r'^api/v1/players/(?P<token>[0-9]+:[\w-]+)/task$', api.current_task,
+        name='apiTask'),
+    url(r'^api/v1/players/(?P<token>[0-9]+:[\w-]+)/uploads$', api.start_upload,
+        name='apiStartUpload'),
+    url(r'^api/v1/players/(?P<token>[0-9]+:[\w-]+)/uploads/(?P<upload_id>[0-9]+)$',
+        api.upload_chunk, name='apiUpload'),
+    url(r'^api/v1/players/(?P<token>[0-9]+:[\w-]+)/links$', api.create_link,
+        name='apiCreateLink'),
+    url(r'^api/v1/games/(?P<game_id>[0-9]+)/results$', api.results,
+        name='apiResults'),
 ]
+
+# How often each client may call each view, by URL name, see
+# drawwrite.admission. The polling views are sheddable. The pages poll
+# every 2.5 seconds, and long polls over ASGI check about once a second.
+POLLS_PER_MINUTE = 24
+
+# The most players expected in one game. They are usually in one room, so
+# they often share an address behind NAT, and per address limits allow
+# that many players.
+PLAYERS_PER_ROOM = 16
+
+ADMISSION = {
+    # Each player may retry a taken name or game a couple of times.
+    'joinGame': Limit('ip', 3 * PLAYERS_PER_ROOM, 60),
+    'createGame': Limit('ip', 3 * PLAYERS_PER_ROOM, 60),
+    'checkGameStart': Limit('player', 120, 60, sheddable=True),
+    'startGame': Limit('player', 10, 60),
+    'createLink': Limit('player', 10, 60),
+    'checkRoundDone': Limit('player', 120, 60, sheddable=True),
+    # Everyone in a game polls for its end, with room to reload the page.
+    'checkGameDone': Limit('game', 2 * POLLS_PER_MINUTE * PLAYERS_PER_ROOM, 60, sheddable=True),
+    'getAvailableGames': Limit('ip', 6 * PLAYERS_PER_ROOM, 60, sheddable=True),
+    'searchChains': Limit('ip', 30, 60, sheddable=True),
+    'warmUp': Limit('ip', 10, 60),
+    'gameEvents': Limit('game', 2 * POLLS_PER_MINUTE * PLAYERS_PER_ROOM, 60, sheddable=True),
+    'apiCreateGame': Limit('ip', 3 * PLAYERS_PER_ROOM, 60),
+    'apiJoinGame': Limit('ip', 3 * PLAYERS_PER_ROOM, 60),
+    'apiLobby': Limit('player', 120, 60, sheddable=True),
+    'apiStartGame': Limit('player', 10, 60),
+    'apiTask': Limit('player', 120, 60, sheddable=True),
+    'apiStartUpload': Limit('player', 10, 60),
+    'apiUpload': Limit('player', 240, 60),
+    'apiCreateLink': Limit('player', 10, 60),
+    'apiResults': Limit('game', 120, 60),
+}
@@ -1,32 +1,46 @@
 """All the views for DrawWrite."""
 
 # Imports {{{
-import logging
-
 from base64 import b64decode
 
 from itertools import zip_longest
 
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.paginator import InvalidPage, Paginator
 from django.db import IntegrityError
-from django.http import HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    HttpResponseNotFound,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.http import urlencode
 
 from drawwrite.forms import CreateGameForm, JoinGameForm
 from drawwrite.models import Chain, Game, DrawLink, Player, WriteLink
 
-from . import services
-from .bracefmt import BraceFormatter as __
+from . import archive, events, kvlog, linklist, search, services, sharding, warmup
 # }}}
 
-LOG = logging.getLogger(__name__)
+LOG = kvlog.get_logger(__name__)
+
+# The polling endpoints get their own logger so that they can be sampled
+# separately, see DRAWWRITE_LOG_SAMPLING.
+POLL_LOG = kvlog.get_logger(__name__ + '.polling')
 
 # index {{{
 def index(request):
     """
     The front page of the app.
     """
-    LOG.debug("enter index")
+    LOG.debug('enter index')
 
     # Create the two forms that we'll put on this page.
     create_form = CreateGameForm()
@@ -43,15 +57,16 @@ def index(request):
 # }}}
 
 # join_game {{{
+@sharding.shard_by()
 def join_game(request):
     """
     Proccess data that a user sends when they want to join a game.
     """
-    LOG.debug('enter')
+    LOG.debug('enter join game view')
 
     # Send all non-POSTs to the index.
     if request.method != 'POST':
-        LOG.info(__('attempted non-supported method {0}', request.method))
+        LOG.info('attempted non-supported method', method=request.method)
         request.session['error_title'] = 'Unsupported method'
         request.session['error_description'] = (
             'You\'re not allowed to send {0} requests to that endpoint.'.format(request.method),
@@ -63,11 +78,11 @@ def join_game(request):
 
     # Invalid forms redirect to the index with an error.
     if not form.is_valid():
-        LOG.debug(__(
-            'name {0} or gamename {1} invalid',
-            form.data['username'],
-            form.data['gamename'],
-        ))
+        LOG.debug(
+            'name or gamename invalid',
+            username=form.data.get('username'),
+            gamename=form.data.get('gamename'),
+        )
         request.session['error_title'] = 'Invalid input'
         request.session['error_description'] = ' '.join((
             'Your Name and the Game Name must only contain letters, numbers,',
@@ -78,6 +93,7 @@ def join_game(request):
     # Valid forms are processed.
     gamename = form.cleaned_data['gamename']
     username = form.cleaned_data['username']
+    sharding.set_shard(sharding.shard_for_name(gamename))
 
     # Get the game. On error, add error objects to the session and redirect
     # to index.
@@ -88,12 +104,12 @@ def join_game(request):
         started=False,
     )
     if len(games) > 1:
-        LOG.error(__('somehow, two games with name {0} are being created', gamename))
+        LOG.error('somehow, two games with the same name are being created', gamename=gamename)
         request.session['error_title'] = 'Non-unique game name'
         request.session['error_description'] = 'Could not find a unique game for you to join'
         return redirect('drawwrite:index')
     if len(games) < 1:
-        LOG.error(__('tried to join non-existant game {0}', gamename))
+        LOG.error('tried to join non-existant game', gamename=gamename)
         request.session['error_title'] = 'Non-existent game'
         request.session['error_description'] = ' '.join((
             'The game that you attempted to join, {0},'.format(gamename),
@@ -101,15 +117,23 @@ def join_game(request):
         ))
         return redirect('drawwrite:index')
     game = games[0]
-    LOG.debug(__('got game for player {0}', username))
+    LOG.debug('got game for player', username=username)
 
     # Add a player to the game. On error, add error objects to the session and
     # redirect to index.
     player = None
     try:
         player = services.new_player(game, username, False)
+    except services.GameNotFound:
+        LOG.info('game was removed before player could join', username=username, gamename=gamename)
+        request.session['error_title'] = 'Non-existent game'
+        request.session['error_description'] = ' '.join((
+            'The game that you attempted to join, {0},'.format(gamename),
+            'was closed for inactivity. Please join or start another game.',
+        ))
+        return redirect('drawwrite:index')
     except services.GameAlreadyStarted:
-        LOG.debug(__('could not add {0} to game {1}', username, game.name))
+        LOG.debug('could not add player to game', username=username, gamename=game.name)
         request.session['error_title'] = 'Game started'
         request.session['error_description'] = ' '.join((
             'The game that you attempted to join has already started. Please',
@@ -120,11 +144,11 @@ def join_game(request):
     #   already taken. There are plenty of other explanations that I'm
     #   silencing by doing this.
     except IntegrityError:
-        LOG.exception(__(
-            'player with {0} already exists in game {1}',
-            username,
-            gamename,
-        ))
+        LOG.exception(
+            'player already exists in game',
+            username=username,
+            gamename=gamename,
+        )
         request.session['error_title'] = 'Player exists'
         request.session['error_description'] = ' '.join((
             'The player name that you entered is already in use in the game',
@@ -139,6 +163,7 @@ def join_game(request):
 # }}}
 
 # create_game {{{
+@sharding.shard_by()
 def create_game(request):
     """
     Create a game according to the values the user specified in the form.
@@ -147,7 +172,7 @@ def create_game(request):
 
     # Send all non-POSTs to the index.
     if request.method != 'POST':
-        LOG.debug(__('attempted non-supported method {0}', request.method))
+        LOG.debug('attempted non-supported method', method=request.method)
         return redirect('drawwrite:index')
 
     # Get the form from the POSTed data.
@@ -155,15 +180,7 @@ def create_game(request):
 
     # Invalid forms redirect to the index with an error.
     if not form.is_valid():
-        #LOG.debug(__(
-        #    'username {0} or gamename {1} invalid',
-        #    form.data['username'],
-        #    form.data['gamename'],
-        #))
-        LOG.debug(__(
-            'form error: {0}',
-            form.errors,
-        ))
+        LOG.debug('form error', errors=form.errors)
         request.session['error_title'] = 'Invalid input'
         request.session['error_description'] = ' '.join((
             'Your Name and the Game Name must only contain letters, numbers,',
@@ -174,11 +191,17 @@ def create_game(request):
     # Valid forms are processed.
     gamename = form.cleaned_data['gamename']
     username = form.cleaned_data['username']
+    sharding.set_shard(sharding.shard_for_name(gamename))
 
     # Create game. On error, add error objects to the session and redirect
     # to index.
     # TODO handle other errors that could happen?
-    game = services.new_game(gamename)
+    round_minutes = form.cleaned_data['round_minutes']
+    game = services.new_game(
+        gamename,
+        pipelined=form.cleaned_data['pipelined'],
+        round_seconds=round_minutes * 60 if round_minutes else None,
+    )
     if game is None:
         request.session['error_title'] = 'Game being created'
         request.session['error_description'] = (
@@ -199,7 +222,7 @@ def create_game(request):
         request.session['error_description'] = exception.message()
         return redirect('drawwrite:index')
     except IntegrityError:
-        LOG.error(__('a new game has an invalid player {0}', username))
+        LOG.error('a new game has an invalid player', username=username)
         request.session['error_title'] = 'Player name taken'
         request.session['error_description'] = ' '.join((
             'The player name that you entered, {0},'.format(username),
@@ -214,6 +237,7 @@ def create_game(request):
 # }}}
 
 # play {{{
+@sharding.shard_by('player_id')
 def play(request, player_id):
     """
     The page on which players play the game.
@@ -226,81 +250,138 @@ def play(request, player_id):
     try:
         player = Player.objects.get(pk=player_id) #pylint: disable=no-member
     except Player.DoesNotExist: #pylint: disable=no-member
-        LOG.error(__('non-existant player attempt: {0}', player_id))
+        LOG.error('non-existant player attempt', player_id=player_id)
         request.session['error_title'] = 'Player Does Not Exist'
         request.session['error_description'] = ' '.join((
             'You attempted to access a non-existant player. Plase do not',
             'do that.',
         ))
         return redirect('drawwrite:index')
-    LOG.debug(__('successfully retreived player {0}', player_id))
+    LOG.debug('successfully retreived player', player_id=player_id)
 
     # Get the game from the player object.
     game = player.game
-    LOG.debug(__('successfully retreived game for player {0}', player_id))
+    LOG.debug('successfully retreived game', player_id=player_id, game_id=game.pk)
 
     # If the game hasn't started, show the player the waiting screen.
     if not game.started:
-        LOG.debug(__('game for player {0} has not started', player_id))
+        LOG.debug('game has not started', player_id=player_id)
 
         # Get a list of all players in this game.
         all_players = Player.objects.filter(game=game) #pylint: disable=no-member
-        LOG.debug(__('got players in game with player {0}', player_id))
+        LOG.debug('got players in game', player_id=player_id)
 
         # Get the creator of the game.
         creator = None
         for player in all_players:
             if player.was_creator:
                 creator = player
-        LOG.debug(__('creator of game is {0}', creator.name))
+        LOG.debug('found creator of game', creator=creator.name)
 
         # Render the waiting screen with all of those players.
-        LOG.debug(__('showing player {0} the waiting screen', player_id))
+        LOG.debug('showing the waiting screen', player_id=player_id)
         return render(request, 'drawwrite/waiting.html', {
             'all_players' : all_players,
             'player_id' : player_id,
             'created' : player.was_creator,
             'creator' : creator,
         })
-    LOG.debug(__('game for player {0} has started', player_id))
+    LOG.debug('game has started', player_id=player_id)
 
-    # The game has started. Check if it's also finished.
-    if game.round_num >= game.num_players:
+    # Work out what the player does next.
+    move = next_move(player)
+    if move['state'] == 'finished':
         LOG.debug('game finished, redirect to view page')
         return redirect('drawwrite:showGame', game.pk)
+    if move['state'] == 'gameWaiting':
+        LOG.debug('show game finished waiting page')
+        return render(request, 'drawwrite/gameWaiting.html', {
+            'game_id' : game.pk,
+        })
+    if move['state'] == 'roundWaiting':
+        LOG.debug('show waiting page', player_id=player_id)
+        return render(request, 'drawwrite/roundWaiting.html', {
+            'player_id' : player_id,
+        })
+    if move['state'] == 'outOfSync':
+        # TODO come up with a better thing to show the user in this case
+        return HttpResponseBadRequest()
+    if move['state'] == 'noChainOwner':
+        request.session['error_title'] = 'Player Does Not Exist'
+        request.session['error_description'] = ' '.join((
+            'You tried to get a player that does not exist. Sorry for',
+            'the inconvenience.',
+        ))
+        return redirect('drawwrite:index')
+
+    # Show the player a page to add the next link type.
+    LOG.debug('exit add to chain view')
+    return render(request, 'drawwrite/chainAdd.html', {
+        'prev_link_type': move['prev_link_type'],
+        'prev_link': move['prev_link'],
+        'player_id': player_id,
+    })
+# }}}
+
+# next_move {{{
+def next_move(player):
+    """
+    Return what the player of a started game does next, as a dict whose
+    'state' is one of:
+
+    finished: the game is over.
+    gameWaiting: wait for the others to finish the game.
+    roundWaiting: wait for the next chain to be ready.
+    add: add a link after 'prev_link' of 'prev_link_type' ('' and None
+        for the first link).
+    outOfSync, noChainOwner: the game's rows disagree.
+
+    The player's game is used as it is, so after services.player_finished
+    no queries are needed to find out whether to wait.
+    """
+    game = player.game
+    player_id = player.pk
+
+    # Check if the game is finished.
+    if game.round_num >= game.num_players:
+        return {'state': 'finished'}
+
+    # Players of pipelined games move through the rounds at their own pace,
+    # so their own round decides which chain they add to.
+    round_num = player.current_round if game.pipelined else game.round_num
+
+    # Players of pipelined games who have added to every chain wait for the
+    # others to finish.
+    if game.pipelined:
+        if player.current_round >= game.num_players:
+            return {'state': 'gameWaiting'}
 
     # The game has started, so decide whether to show the waiting page.
-    if player.current_round == game.round_num + 1:
+    elif player.current_round == game.round_num + 1:
 
         # If the player's round equals the number of players in the game,
-        # show the 'wait for game completion' game.
-        if player.current_round == player.game.num_players:
-            LOG.debug('show game finished waiting page')
-            return render(request, 'drawwrite/gameWaiting.html', {
-                'game_id' : game.pk,
-            })
+        # wait for the game to be completed.
+        if player.current_round == game.num_players:
+            return {'state': 'gameWaiting'}
 
-        # If the game isn't finished, show the waiting page for the next round.
-        LOG.debug('show waiting page, this user is done with current round')
-        return render(request, 'drawwrite/roundWaiting.html', {
-            'player_id' : player_id,
-        })
+        # If the game isn't finished, wait for the next round.
+        LOG.debug('this user is done with current round', player_id=player_id)
+        return {'state': 'roundWaiting'}
 
     # If the player's round doesn't equal the game's round, something is fishy.
     elif not player.current_round == game.round_num:
-        LOG.error(__(
-            'player {0} has round {1}, while game {2} has round {3}',
-            player_id,
-            player.current_round,
-            game.pk,
-            game.round_num,
-        ))
-        # TODO come up with a better thing to show the user in this case
-        return HttpResponseBadRequest()
+        LOG.error(
+            'player round is out of sync with game round',
+            player_id=player_id,
+            player_round=player.current_round,
+            game_id=game.pk,
+            game_round=game.round_num,
+        )
+        return {'state': 'outOfSync'}
 
     # Figure out which position's chain this player should have access to next.
-    chain_pos_to_get = (player.position + game.round_num) % game.num_players
-    LOG.debug(__('player {0} needs position {1}s chain', player_id, chain_pos_to_get))
+    chain_pos_to_get = (player.position + round_num) % game.num_players
+    LOG.debug('player needs chain', player_id=player_id, position=chain_pos_to_get)
 
     # Get the owner of the chain that player will edit.
     chain_owner = None
@@ -311,92 +392,145 @@ def play(request, player_id):
             position=chain_pos_to_get,
         )
     except Player.DoesNotExist: #pylint: disable=no-member
-        LOG.error(__(
-            'player with game {0} and pos {1} does not exist',
-            game.pk,
-            chain_pos_to_get,
-        ))
-        request.session['error_title'] = 'Player Does Not Exist'
-        request.session['error_description'] = ' '.join((
-            'You tried to get a player that does not exist. Sorry for',
-            'the inconvenience.',
-        ))
-        return redirect('drawwrite:index')
-    LOG.debug(__('got chain_owner ({0}) for player {1}', chain_owner.pk, player_id))
+        LOG.error(
+            'chain owner does not exist',
+            game_id=game.pk,
+            position=chain_pos_to_get,
+        )
+        return {'state': 'noChainOwner'}
+    LOG.debug('got chain owner', chain_owner_id=chain_owner.pk, player_id=player_id)
 
     # Get the chain for the player.
     chain = None
     try:
         chain = Chain.objects.get(player=chain_owner) #pylint: disable=no-member
     except Chain.DoesNotExist: #pylint: disable=no-member
+        # In pipelined games the chain's owner may not have started it yet.
+        if chain_owner.pk != player.pk:
+            LOG.debug('chain is not started', player_id=player_id)
+            return {'state': 'roundWaiting'}
+
         # Make a chain for this player.
         chain = services.new_chain(player)
-    LOG.debug(__('got chain for user {0}', player_id))
+    LOG.debug('got chain', player_id=player_id)
 
-    # If the chain has no links, show the player a screen to enter their first
-    # text link.
+    # In pipelined games, wait for the previous player to add to the chain.
+    if chain.next_link_position < round_num:
+        LOG.debug('chain is not ready', player_id=player_id)
+        return {'state': 'roundWaiting'}
+
+    # If the chain has no links, the player enters their first text link.
     if chain.next_link_position == 0:
-        LOG.debug(__('returning page for first link for user {0}', player_id))
-        return render(request, 'drawwrite/chainAdd.html', {
-            'prev_link_type': '',
-            'prev_link': None,
-            'player_id': player_id,
-        })
+        LOG.debug('player adds first link', player_id=player_id)
+        return {'state': 'add', 'prev_link_type': '', 'prev_link': None}
 
     # Figure out what type of link the player needs to make.
     prev_link_pos = chain.next_link_position - 1
-    prev_link = None
-    prev_link_type = ''
-    if prev_link_pos % 2 == 0:
-        prev_link_type = 'write'
-        prev_link = WriteLink.objects.get( #pylint: disable=no-member
+    prev_link_type = 'write' if prev_link_pos % 2 == 0 else 'draw'
+
+    # The previous link is the last one in the chain's list, unless the list
+    # is behind, in which case look it up.
+    prev_link = linklist.previous_link(chain)
+    if prev_link is False:
+        link_model = WriteLink if prev_link_type == 'write' else DrawLink
+        prev_link = link_model.objects.get( #pylint: disable=no-member
             chain=chain,
             link_position=prev_link_pos
         )
-    else:
-        prev_link_type = 'draw'
-        prev_link = DrawLink.objects.get( #pylint: disable=no-member
-            chain=chain,
-            link_position=prev_link_pos
-        )
-
-    # Show the player a page to add the next link type.
-    LOG.debug('exit add to chain view')
-    return render(request, 'drawwrite/chainAdd.html', {
+    return {
+        'state': 'add',
         'prev_link_type': prev_link_type,
         'prev_link': prev_link,
-        'player_id': player_id,
-    })
+    }
+# }}}
+
+# move_json {{{
+# The states of next_move that mean the game's rows disagree.
+MOVE_ERRORS = ('outOfSync', 'noChainOwner')
+
+def move_data(player):
+    """
+    Return a dict describing what the player does next, see next_move, with
+    the 'url' of the page that shows it. Waiting states come with the
+    'poll_url' to check for the wait being over.
+    """
+    move = next_move(player)
+    data = {
+        'state': move['state'],
+        'url': reverse('drawwrite:play', args=[player.pk]),
+    }
+    if move['state'] == 'finished':
+        data['url'] = reverse('drawwrite:showGame', args=[player.game.pk])
+    elif move['state'] == 'gameWaiting':
+        data['poll_url'] = reverse('drawwrite:checkGameDone', args=[player.game.pk])
+    elif move['state'] == 'roundWaiting':
+        data['poll_url'] = reverse('drawwrite:checkRoundDone', args=[player.pk])
+    elif move['state'] == 'add':
+        prev_link = move['prev_link']
+        data['prev_link_type'] = move['prev_link_type']
+        if prev_link is None:
+            data['prev_link'] = None
+        elif move['prev_link_type'] == 'write':
+            data['prev_link'] = {'text': prev_link.text}
+        else:
+            data['prev_link'] = {'drawing': prev_link.drawing.url}
+    return data
+
+def move_json(player):
+    """Return a JsonResponse of move_data, with a 409 for the error states."""
+    data = move_data(player)
+    return JsonResponse(data, status=409 if data['state'] in MOVE_ERRORS else 200)
+# }}}
+
+# wait_over {{{
+def wait_over(player):
+    """
+    Return the response saying that the player's wait is over, along with
+    their 'next' move from move_data, so that the client can show it
+    without loading play. A drawing to add after is hinted for preloading.
+    """
+    # Before the first round there was nothing to wait for, and the
+    # player's chain may not be made yet.
+    if player.current_round == 0:
+        return JsonResponse({'finished': True})
+
+    data = move_data(player)
+    response = JsonResponse({'finished': True, 'next': data})
+    prev_link = data.get('prev_link')
+    if prev_link is not None and 'drawing' in prev_link:
+        response['Link'] = '<{0}>; rel=preload; as=image'.format(prev_link['drawing'])
+    return response
 # }}}
 
 # check_game_start {{{
+@sharding.shard_by('player_id')
 def check_game_start(request, player_id): #pylint: disable=unused-argument
     """Check if the passed player's game has started."""
 
-    LOG.debug(__('checking game status for player {0}', player_id))
+    POLL_LOG.debug('checking game status', player_id=player_id)
 
     # Get the player.
     player = None
     try:
         player = Player.objects.get(pk=player_id) #pylint: disable=no-member
     except Player.DoesNotExist: #pylint: disable=no-member
-        LOG.error(__('non-existant player: {0}', player_id))
+        POLL_LOG.error('non-existant player', player_id=player_id)
         return HttpResponseBadRequest()
-    LOG.debug(__('successfully found player {0}', player_id))
+    POLL_LOG.debug('successfully found player', player_id=player_id)
 
     # If the player's game has not started, return an updated list of names.
     if not player.game.started:
-        LOG.debug(__('player {0} game has not started', player_id))
+        POLL_LOG.debug('game has not started', player_id=player_id)
 
         # Get all the players in the game.
         all_players = Player.objects.filter(game=player.game) #pylint: disable=no-member
-        LOG.debug(__('got all players in game with {0}', player_id))
+        POLL_LOG.debug('got all players in game', player_id=player_id)
 
         # Create a list of all player names.
         names = []
         for player in all_players:
             names.append(player.name)
-        LOG.debug('made list of all player names')
+        POLL_LOG.debug('made list of all player names')
 
         # Return the data we need.
         return JsonResponse({'started': False, 'names': names})
@@ -406,10 +540,11 @@ def check_game_start(request, player_id): #pylint: disable=unused-argument
 # }}}
 
 # start_game {{{
+@sharding.shard_by('player_id')
 def start_game(request, player_id):
     """Start the game of the player identified by player_id"""
 
-    LOG.debug(__('starting game of player {0}', player_id))
+    LOG.debug('starting game of player', player_id=player_id)
 
     # Make sure method is POST.
     if not request.method == 'POST':
@@ -421,9 +556,9 @@ def start_game(request, player_id):
     try:
         player = Player.objects.get(pk=player_id) #pylint: disable=no-member
     except Player.DoesNotExist: #pylint: disable=no-member
-        LOG.error(__('non-existant player {0}', player_id))
+        LOG.error('non-existant player', player_id=player_id)
         return HttpResponseBadRequest()
-    LOG.debug(__('successfully got player {0}', player_id))
+    LOG.debug('successfully got player', player_id=player_id)
 
     # Set the player's game to 'started'.
     services.start_game(player.game)
@@ -435,36 +570,46 @@ def start_game(request, player_id):
 # }}}
 
 # create_link {{{
+@sharding.shard_by('player_id')
+@sharding.atomic
 def create_link(request, player_id):
     """
     Accept POST data and create a new link in the chain that player_id should
     be adding to.
+
+    XHR submissions get what the player does next as JSON, see move_json,
+    instead of being redirected to play.
     """
-    LOG.debug(__('creating link for player {0}', player_id))
+    LOG.debug('creating link', player_id=player_id)
+    wants_json = request.is_ajax()
 
     # Only accept POSTs
     if not request.method == 'POST':
         LOG.error('should have POSTed data')
         return HttpResponseNotAllowed(['POST'])
-    LOG.debug(__('got POST data for player {0}', player_id))
+    LOG.debug('got POST data', player_id=player_id)
 
     # Get the player.
     player = None
     try:
         player = Player.objects.get(pk=player_id) #pylint: disable=no-member
     except Player.DoesNotExist: #pylint: disable=no-member
-        LOG.error(__('non-existant player {0}', player_id))
+        LOG.error('non-existant player', player_id=player_id)
+        if wants_json:
+            return JsonResponse({'error': 'Player Does Not Exist'}, status=404)
         request.session['error_title'] = 'Player Does Not Exist'
         request.session['error_description'] = ' '.join((
             'The player that you tried to create a link for does not exist.',
             'We apologize for the inconvenience.',
         ))
         return redirect('drawwrite:index')
-    LOG.debug(__('got the player with pk {0}', player_id))
+    LOG.debug('got the player', player_id=player_id)
 
     # Calculate the position of the player that this player_id is adding to.
-    chain_owner_pos = (player.position + player.game.round_num) % player.game.num_players
-    LOG.debug(__('player {0} needs chain of player {1}', player_id, chain_owner_pos))
+    # Players of pipelined games add to chains at their own pace.
+    round_num = player.current_round if player.game.pipelined else player.game.round_num
+    chain_owner_pos = (player.position + round_num) % player.game.num_players
+    LOG.debug('player needs chain', player_id=player_id, position=chain_owner_pos)
 
     # Get the owner of the chain this player is adding to.
     try:
@@ -474,25 +619,30 @@ def create_link(request, player_id):
             position=chain_owner_pos,
         )
     except Player.DoesNotExist: #pylint: disable=no-member
-        LOG.error(__(
-            'player with game {0} and position {1} does not exist',
-            player.game.pk,
-            chain_owner_pos,
-        ))
+        LOG.error(
+            'chain owner does not exist',
+            game_id=player.game.pk,
+            position=chain_owner_pos,
+        )
+        if wants_json:
+            return JsonResponse({'error': 'Player Does Not Exist'}, status=409)
         request.session['error_title'] = 'Player Does Not Exist'
         request.session['description'] = ' '.join((
             'You attempted to access a player that does not exist. We are',
             'sorry for the inconvenience.',
         ))
         return redirect('drawwrite:index')
-    LOG.debug(__('successfully got chain owner for player {0}', player_id))
+    LOG.debug('successfully got chain owner', player_id=player_id)
 
-    # Get the player's chain.
+    # Get the player's chain, and lock it so that only one submission adds
+    # to it.
     chain = None
     try:
-        chain = Chain.objects.get(player=chain_owner) #pylint: disable=no-member
+        chain = Chain.objects.select_for_update().get(player=chain_owner) #pylint: disable=no-member
     except Chain.DoesNotExist: #pylint: disable=no-member
-        LOG.error(__('player {0} should have a chain but does not', player_id))
+        LOG.error('player should have a chain but does not', player_id=player_id)
+        if wants_json:
+            return JsonResponse({'error': 'Player Has No Chain'}, status=409)
         request.session['error_title'] = 'Player Has No Chain'
         request.session['error_description'] = ' '.join((
             'The player that you tried to create a link for does not have',
@@ -500,19 +650,30 @@ def create_link(request, player_id):
             'the inconvenience.',
         ))
         return redirect('drawwrite:index')
-    LOG.debug(__('got the chain for player with pk {0}', player_id))
+    LOG.debug('got the chain', player_id=player_id)
+
+    # The chain may not be ready yet in pipelined games, or the link may
+    # have been submitted twice or filled in after the round's deadline.
+    # Either way, play shows what to do next.
+    if chain.next_link_position != round_num:
+        LOG.info(
+            'chain is not waiting for this player',
+            player_id=player_id,
+            round=round_num,
+            next_link_position=chain.next_link_position,
+        )
+        if wants_json:
+            return move_json(player)
+        return redirect('drawwrite:play', player_id)
 
     # Figure out what type of link to make.
     if chain.next_link_position % 2 == 0:
         # The POST data needs to have the 'description' field or something
         # is wrong.
         if 'description' not in request.POST.keys():
-            LOG.error(' '.join((
-                'should be making write link, but did not receive any',
-                'writing in the POSTed data',
-            )))
+            LOG.error('should be making write link, but did not receive a description')
             return HttpResponseBadRequest()
-        LOG.debug(__('making new write link for player {0}', player_id))
+        LOG.debug('making new write link', player_id=player_id)
 
         # Make the new write link.
         services.new_write_link(chain, request.POST.get('description'), player)
@@ -521,17 +682,14 @@ def create_link(request, player_id):
         # The POST data needs to have the 'drawing' field or something
         # is wrong.
         if 'drawing' not in request.POST.keys():
-            LOG.error(' '.join((
-                'should be making a draw link, but did not receive any',
-                'drawing data in the POSTed data',
-            )))
+            LOG.error('should be making a draw link, but did not receive a drawing')
             return HttpResponseBadRequest()
         LOG.debug('got image data to save')
 
         # Make sure the data starts with 'data:image/png;base64,'
         data_string = request.POST.get('drawing')
         if not data_string.startswith('data:image/png;base64,'):
-            LOG.error(__('got bad image data: started with {0}', data_string[0:15]))
+            LOG.error('got bad image data', prefix=data_string[0:15])
             return HttpResponseBadRequest()
         LOG.debug('got good(ish) image data')
 
@@ -546,49 +704,57 @@ def create_link(request, player_id):
         # Make a file-like object out of the data.
         file_name = "link-{0}-{1}.png".format(player_id, chain.next_link_position)
         file_obj = ContentFile(binary_data, name=file_name)
-        LOG.debug(__('made file with name {0}', file_name))
+        LOG.debug('made file', file_name=file_name)
 
         # Make the draw link.
         services.new_draw_link(chain, file_obj, player)
-        LOG.debug(__('created draw link, file has name {0}', file_name))
+        LOG.debug('created draw link', file_name=file_name)
 
     # Increase the 'num_players_finished_current_round' of this game.
-    services.player_finished(player)
+    services.player_finished(player, round_num)
 
-    # Redirect to 'play'.
+    # Say what to do next, or redirect to 'play' to show it.
+    if wants_json:
+        return move_json(player)
     return redirect('drawwrite:play', player_id)
 # }}}
 
 # check_round_done {{{
+@sharding.shard_by('player_id')
 def check_round_done(request, player_id):
     """
     Check if the round of the current game is completed. Return a javascript
-    object that has a list of every player's name that has not completed the round.
+    object that has a list of every player's name that has not completed the round,
+    or, once it is completed, the player's next move.
     """
-    LOG.debug(__('checking if round is completed for player {0}', player_id))
+    POLL_LOG.debug('checking if round is completed', player_id=player_id)
 
-    # Get the player.
+    # Get the player, along with their game.
     player = None
     try:
-        player = Player.objects.get(pk=player_id) #pylint: disable=no-member
+        player = Player.objects.select_related('game').get(pk=player_id) #pylint: disable=no-member
     except Player.DoesNotExist: #pylint: disable=no-member
-        LOG.error('attempted to get player that does not exist')
+        POLL_LOG.error('attempted to get player that does not exist', player_id=player_id)
         request.session['error_title'] = 'Player Does Not Exist'
         request.session['error_description'] = ' '.join((
             'The player that you attempted to get does not exist. We are',
             'sorry for the inconvenience.',
         ))
         return redirect('drawwrite:index')
-    LOG.debug(__('successfully got player {0}', player_id))
+    POLL_LOG.debug('successfully got player', player_id=player_id)
+
+    # Pipelined games have no rounds to wait for, only the next chain.
+    if player.game.pipelined:
+        return check_chain_ready(player)
 
     # Check if the game round equals the player's round. If so, then the
     # player is allowed to move on. Otherwise, they're not.
     if player.game.round_num == player.current_round:
-        LOG.debug('round is completed')
+        POLL_LOG.debug('round is completed', player_id=player_id)
 
-        # Return an object saying that the round is done.
-        return JsonResponse({'finished': True})
-    LOG.debug('round is not completed')
+        # Return an object saying that the round is done, and what's next.
+        return wait_over(player)
+    POLL_LOG.debug('round is not completed', player_id=player_id)
 
     # Get all players in the game who have not completed the
     # current round.
@@ -599,15 +765,15 @@ def check_round_done(request, player_id):
             current_round__lt=player.current_round,
         )
     except BaseException as exception:
-        LOG.error(exception)
+        POLL_LOG.error('could not get players still playing', exception=exception)
         raise
-    LOG.debug('got list of players still playing')
+    POLL_LOG.debug('got list of players still playing')
 
     # Turn the players into a list of names.
     names_still_playing = []
     for player in players_still_playing:
         names_still_playing.append(player.name)
-    LOG.debug('got list of names of players still playing')
+    POLL_LOG.debug('got list of names of players still playing')
 
     # Return an object saying that the round is not done.
     return JsonResponse({
@@ -616,21 +782,57 @@ def check_round_done(request, player_id):
     })
 # }}}
 
+# check_chain_ready {{{
+def check_chain_ready(player):
+    """
+    Return whether the chain that a player of a pipelined game adds to next
+    is ready for them, and if not, who it is waiting for. Players who have
+    added to every chain move on to wait for the end of the game.
+    """
+    game = player.game
+    if player.current_round >= game.num_players:
+        POLL_LOG.debug('player has added to every chain', player_id=player.pk)
+        return wait_over(player)
+
+    # The chain is ready once it has a link for each round before this one.
+    position = (player.position + player.current_round) % game.num_players
+    ready = Chain.objects.filter( #pylint: disable=no-member
+        player__game=game,
+        player__position=position,
+        next_link_position__gte=player.current_round,
+    ).exists()
+    if ready:
+        POLL_LOG.debug('chain is ready', player_id=player.pk)
+        return wait_over(player)
+
+    # The previous link in that chain belongs to the next player along.
+    waiting_for = Player.objects.filter( #pylint: disable=no-member
+        game=game,
+        position=(player.position + 1) % game.num_players,
+    ).values_list('name', flat=True)
+    POLL_LOG.debug('chain is not ready', player_id=player.pk)
+    return JsonResponse({
+        'finished': False,
+        'still_playing': list(waiting_for),
+    })
+# }}}
+
 # check_game_done {{{
+@sharding.shard_by('game_id')
 def check_game_done(request, game_id): #pylint: disable=unused-argument
     """Check if the game with the passed game_id is finished."""
 
-    LOG.debug(__('checking if game {0} is done', game_id))
+    POLL_LOG.debug('checking if game is done', game_id=game_id)
 
     # Get the game.
     game = None
     try:
         game = Game.objects.get(pk=game_id) #pylint: disable=no-member
     except Game.DoesNotExist: #pylint: disable=no-member
-        LOG.error(__('tried to get non-existant game {0}', game_id))
+        POLL_LOG.error('tried to get non-existant game', game_id=game_id)
         # TODO better error stuff
         return HttpResponseBadRequest
-    LOG.debug(__('got game {0}', game_id))
+    POLL_LOG.debug('got game', game_id=game_id)
 
     # Check if the round equals the number of players.
     if game.round_num == game.num_players:
@@ -644,15 +846,15 @@ def check_game_done(request, game_id): #pylint: disable=unused-argument
             current_round=game.round_num,
         )
     except BaseException as exception:
-        LOG.error(exception)
+        POLL_LOG.error('could not get players still playing', exception=exception)
         raise
-    LOG.debug('got list of players still playing')
+    POLL_LOG.debug('got list of players still playing')
 
     # Turn that list of players into a list of names.
     names_still_playing = []
     for player in players_still_playing:
         names_still_playing.append(player.name)
-    LOG.debug('created list of names of players still playing')
+    POLL_LOG.debug('created list of names of players still playing')
 
     # Return an object saying that the round is not done.
     return JsonResponse({
@@ -662,20 +864,30 @@ def check_game_done(request, game_id): #pylint: disable=unused-argument
 # }}}
 
 # show_game {{{
+@sharding.shard_by('game_id')
 def show_game(request, game_id):
     """Show a completed game."""
 
-    LOG.debug(__('showing game {0}', game_id))
+    LOG.debug('showing game', game_id=game_id)
 
-    # Get the game.
+    # Get the game. Games that are no longer in the database may have been
+    # archived.
     game = None
     try:
         game = Game.objects.get(pk=game_id) #pylint: disable=no-member
     except Game.DoesNotExist: #pylint: disable=no-member
-        LOG.error(__('tried to get non-existant game {0}', game_id))
-        # TODO better error here
-        return HttpResponseBadRequest()
-    LOG.debug(__('got game {0}', game_id))
+        archived = archive.get_archived_game(game_id)
+        if archived is None:
+            LOG.error('tried to get non-existant game', game_id=game_id)
+            # TODO better error here
+            return HttpResponseBadRequest()
+        LOG.debug('showing archived game', game_id=game_id)
+        return render(request, 'drawwrite/game.html', {
+            'players': archive.archived_players(archived),
+            'game_id': archived.original_id,
+            'game_name': archived.name,
+        })
+    LOG.debug('got game', game_id=game_id)
 
     # Get all players associated with that game.
     players = Player.objects.filter(game=game) #pylint: disable=no-member
@@ -684,39 +896,119 @@ def show_game(request, game_id):
     # Change gameName to game_name
     return render(request, 'drawwrite/game.html', {
         'players': players,
+        'game_id': game.pk,
         'game_name': game.name,
     })
 # }}}
 
 # show_chain {{{
-def show_chain(request, player_id):
-    """Show a completed chain."""
+def chain_page_size():
+    """Return how many links each page of a chain shows, from DRAWWRITE_CHAIN_PAGE_SIZE."""
+    return getattr(settings, 'DRAWWRITE_CHAIN_PAGE_SIZE', 6)
 
-    LOG.debug(__('showing chain of player {0}', player_id))
-
-    # Get the player.
+def chain_page(request, player_id):
+    """
+    Return the player whose chain it is and the page of its links asked for
+    by the 'page' query parameter, or None if there is no such chain or
+    page. Players that are no longer in the database may have been archived.
+    """
+    # Get the player, along with the game that the template links back to.
     player = None
     try:
-        player = Player.objects.get(pk=player_id) #pylint: disable=no-member
+        player = Player.objects.select_related('game').get(pk=player_id) #pylint: disable=no-member
     except Player.DoesNotExist: #pylint: disable=no-member
-        LOG.error(__('tried to get non-existant player {0}', player_id))
-        # TODO better error messege
-        return HttpResponseBadRequest()
-    LOG.debug(__('got player {0}', player_id))
+        archived = archive.get_archived_game_for_player(player_id)
+        archived_chain = archive.archived_chain(archived, player_id) if archived else None
+        if archived_chain is None:
+            LOG.error('tried to get non-existant player', player_id=player_id)
+            return None
+        LOG.debug('showing archived chain', player_id=player_id)
+        player, links = archived_chain
+    else:
+        LOG.debug('got player', player_id=player_id)
+
+        # Get the chain.
+        chain = None
+        try:
+            chain = Chain.objects.get(player=player) #pylint: disable=no-member
+        except Chain.DoesNotExist: #pylint: disable=no-member
+            LOG.error('tried to get non-existant chain', player_id=player_id)
+            return None
+        LOG.debug('got chain', player_id=player_id)
+
+        # The chain's own list has every link, unless it is behind.
+        links = linklist.load(chain)
+        if links is None:
+            links = query_links(chain)
+        LOG.debug('made list of all links', player_id=player_id)
 
-    # Get the chain.
-    chain = None
     try:
-        chain = Chain.objects.get(player=player) #pylint: disable=no-member
-    except Chain.DoesNotExist: #pylint: disable=no-member
-        LOG.error(__('tried to get non-existant chain for player {0}', player_id))
-        # TODO better error message
+        page = Paginator(links, chain_page_size()).page(request.GET.get('page', 1))
+    except InvalidPage:
+        LOG.error('tried to get non-existant chain page', player_id=player_id)
+        return None
+    return player, page
+
+@sharding.shard_by('player_id')
+def show_chain(request, player_id):
+    """
+    Show a completed chain, a page of links at a time. The page loads the
+    pages after the first from show_chain_links as they are scrolled to.
+    """
+
+    LOG.debug('showing chain', player_id=player_id)
+
+    found = chain_page(request, player_id)
+    if found is None:
+        # TODO better error messege
         return HttpResponseBadRequest()
-    LOG.debug(__('got chain for player {0}', player_id))
+    player, page = found
+
+    # Render the chain view.
+    return render(request, 'drawwrite/chain.html', {
+        'links': page.object_list,
+        'page': page,
+        'player': player,
+    })
+
+@sharding.shard_by('player_id')
+def show_chain_links(request, player_id):
+    """
+    Return a page of a chain's links as an HTML fragment for the chain page
+    to append, along with the URL of the next page, if any.
+    """
+    found = chain_page(request, player_id)
+    if found is None:
+        return HttpResponseNotFound()
+    player, page = found
+
+    next_url = None
+    if page.has_next():
+        next_url = '{0}?page={1}'.format(
+            reverse('drawwrite:showChainLinks', args=[player.pk]),
+            page.next_page_number(),
+        )
+    return JsonResponse({
+        'html': render_to_string('drawwrite/chainLinks.html', {
+            'links': page.object_list,
+            'page': page,
+        }, request),
+        'next': next_url,
+    })
+# }}}
+
+# query_links {{{
+def query_links(chain):
+    """Return the links of chain in order, read from the link tables."""
 
-    # Get all the write links and all the draw links.
-    write_links = WriteLink.objects.filter(chain=chain) #pylint: disable=no-member
-    draw_links = DrawLink.objects.filter(chain=chain) #pylint: disable=no-member
+    # Get all the write links and all the draw links, with their authors so
+    # that the template doesn't query once per link.
+    write_links = WriteLink.objects.filter( #pylint: disable=no-member
+        chain=chain,
+    ).select_related('added_by').order_by('link_position')
+    draw_links = DrawLink.objects.filter( #pylint: disable=no-member
+        chain=chain,
+    ).select_related('added_by').order_by('link_position')
 
     # Make a list of all the links in the chain.
     links = []
@@ -725,23 +1017,231 @@ def show_chain(request, player_id):
             links.append(write)
         if draw is not None:
             links.append(draw)
-    LOG.debug(__('made list of all links for player {0}', player_id))
+    return links
+# }}}
 
+# show_results {{{
+# Where results.html takes the chains, which are streamed in one at a time.
+RESULTS_CHAINS = '<!-- chains -->'
 
-    # Render the chain view.
-    return render(request, 'drawwrite/chain.html', {
-        'links': links,
-        'player': player,
+def game_results(game):
+    """
+    Return (player, links) pairs for every player of game, in order, and the
+    links of their chain. However big the game, this takes one query for
+    the players along with their chains, and two more for the link rows of
+    any chains whose lists are behind.
+    """
+    players = Player.objects.filter( #pylint: disable=no-member
+        game=game,
+    ).select_related('chain').order_by('position')
+
+    results = []
+    behind = []
+    for player in players:
+        try:
+            chain = player.chain
+        except Chain.DoesNotExist: #pylint: disable=no-member
+            results.append((player, []))
+            continue
+        links = linklist.load(chain)
+        if links is None:
+            behind.append(chain.pk)
+        results.append((player, links))
+
+    if behind:
+        lists = linklist.expected_lists(behind)
+        results = [
+            (player, [linklist.as_link(entry) for entry in lists[player.chain.pk]]
+             if links is None else links)
+            for player, links in results
+        ]
+    return results
+
+def results_for(game_id):
+    """
+    Return the name and game_results of game_id, from the database or its
+    archive, or None if there is no such game or it hasn't finished.
+    """
+    game = Game.objects.filter(pk=game_id).first() #pylint: disable=no-member
+    if game is not None:
+        if game.round_num < game.num_players:
+            LOG.info('tried to get results of unfinished game', game_id=game_id)
+            return None
+        return game.name, game_results(game)
+    archived = archive.get_archived_game(game_id)
+    if archived is None:
+        LOG.error('tried to get results of non-existant game', game_id=game_id)
+        return None
+    LOG.debug('showing archived results', game_id=game_id)
+    return archived.name, archive.archived_results(archived)
+
+@sharding.shard_by('game_id')
+def show_results(request, game_id):
+    """
+    Show every chain of a game on one page. Everything is read before the
+    response starts, and the page is then streamed out a chain at a time.
+    """
+    LOG.debug('showing results', game_id=game_id)
+
+    found = results_for(game_id)
+    if found is None:
+        return HttpResponseNotFound()
+    name, results = found
+
+    head, tail = render_to_string('drawwrite/results.html', {
+        'game_id': game_id,
+        'game_name': name,
+    }, request).split(RESULTS_CHAINS)
+
+    def stream():
+        """Yield the page, a chain at a time."""
+        yield head
+        for player, links in results:
+            yield render_to_string('drawwrite/resultsChain.html', {
+                'player': player,
+                'links': links,
+            })
+        yield tail
+    return StreamingHttpResponse(stream())
+
+def link_document(link):
+    """Return the JSON form of one of the links of game_results."""
+    if link.drawing:
+        document = {'by': link.added_by.name, 'drawing': link.drawing.url}
+        if link.width is not None:
+            document['width'] = link.width
+            document['height'] = link.height
+        return document
+    return {'by': link.added_by.name, 'text': link.text}
+
+@sharding.shard_by('game_id')
+def results_document(request, game_id): #pylint: disable=unused-argument
+    """Return every chain of a game, with its links, as one JSON document."""
+    found = results_for(game_id)
+    if found is None:
+        return HttpResponseNotFound()
+    name, results = found
+    return JsonResponse({
+        'name': name,
+        'chains': [
+            {'player': player.name, 'links': [link_document(link) for link in links]}
+            for player, links in results
+        ],
+    })
+# }}}
+
+# show_archived_drawing {{{
+@sharding.shard_by('game_id')
+def show_archived_drawing(request, game_id, member): #pylint: disable=unused-argument
+    """Serve one drawing out of an archived game's packed file."""
+
+    LOG.debug('showing archived drawing', game_id=game_id, member=member)
+    archived = archive.get_archived_game(game_id)
+    if archived is None:
+        LOG.error('tried to get drawing from non-existant archive', game_id=game_id)
+        return HttpResponseNotFound()
+    try:
+        data = archive.read_archived_drawing(archived, member)
+    except KeyError:
+        LOG.error('archive has no such drawing', game_id=game_id, member=member)
+        return HttpResponseNotFound()
+
+    # Archived drawings never change.
+    response = HttpResponse(data, content_type='image/png')
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+# }}}
+
+# game_events {{{
+@sharding.shard_by('game_id')
+def game_events(request, game_id):
+    """
+    Return the game's events after the id in the 'after' query parameter,
+    along with the cursor to pass as 'after' next time.
+    """
+    POLL_LOG.debug('getting game events', game_id=game_id)
+
+    try:
+        cursor = int(request.GET.get('after', 0))
+    except ValueError:
+        POLL_LOG.error('got bad event cursor', game_id=game_id)
+        return HttpResponseBadRequest()
+
+    page, more = events.events_after(game_id, cursor)
+    if not page and not Game.objects.filter(pk=game_id).exists(): #pylint: disable=no-member
+        POLL_LOG.error('tried to get events of non-existant game', game_id=game_id)
+        return HttpResponseNotFound()
+
+    return JsonResponse({
+        'events': page,
+        'cursor': page[-1]['id'] if page else cursor,
+        'more': more,
     })
 # }}}
 
+# warm_up {{{
+def warm_up(request):
+    """
+    Do the one-time work of a fresh worker, and return what was warmed and
+    how long it took. Load balancers can call this before sending traffic,
+    with the DRAWWRITE_WARM_UP_TOKEN setting in an X-Warm-Up-Token header.
+    Everyone else, and everyone when the setting is unset, gets a 404.
+    """
+    if not warmup.authorized(request):
+        LOG.info('refused to warm up')
+        return HttpResponseNotFound()
+    LOG.debug('warming up')
+    return JsonResponse(warmup.warm_up())
+# }}}
+
 # get_available_games {{{
 def get_available_games(request):
     """Return a list of game names that may be joined."""
-    being_created = Game.objects.filter(started=False) #pylint: disable=no-member
-    options = []
-    for game in being_created:
-        options.append(game.name)
-    LOG.debug('returning list of available games')
+    options = services.available_games()
+    POLL_LOG.debug('returning list of available games')
+
     return JsonResponse({'options': options})
 # }}}
+
+# search_chains {{{
+def search_chains(request):
+    """
+    Return a page of the chains of finished games whose write links have
+    every word of the 'q' parameter, best first, with a snippet of each and
+    the URL of the next page, if any.
+    """
+    query = request.GET.get('q', '').strip()
+    if not search.terms(query):
+        return HttpResponseBadRequest()
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        return HttpResponseNotFound()
+    if page < 1 or page > search.max_pages():
+        return HttpResponseNotFound()
+
+    results, more = search.search(query, page)
+    LOG.debug('searched chains', page=page, results=len(results))
+    next_url = None
+    if more and page < search.max_pages():
+        next_url = '{0}?{1}'.format(
+            reverse('drawwrite:searchChains'),
+            urlencode({'q': query, 'page': page + 1}),
+        )
+    return JsonResponse({
+        'query': query,
+        'page': page,
+        'results': [
+            {
+                'game': result['game'],
+                'player': result['player'],
+                'snippet': escape(result['snippet']).replace(
+                    search.MATCH_START, '<mark>').replace(search.MATCH_END, '</mark>'),
+                'chain_url': reverse('drawwrite:showChain', args=[result['player_id']]),
+                'results_url': reverse('drawwrite:showResults', args=[result['game_id']]),
+            }
+            for result in results
+        ],
+        'next': next_url,
+    })
+# }}}
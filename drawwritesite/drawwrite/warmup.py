@@ -0,0 +1,129 @@
+"""Do the one-time work of a fresh worker before its first real request.
+
+warm_up compiles the app's templates, resolves every drawwrite URL,
+renders the forms, connects to every database and lists the available
+games. The WSGI and ASGI entry points call it at startup unless
+DRAWWRITE_WARM_UP is False, and the warmUp endpoint runs it on demand for
+callers that have DRAWWRITE_WARM_UP_TOKEN, see authorized.
+
+Compiled templates are only kept when Django uses the cached template
+loader, which it does by default when DEBUG is off. Database connections
+are only kept for later requests when CONN_MAX_AGE is set.
+"""
+
+# Imports {{{
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import NoReverseMatch, get_resolver, resolve, reverse
+from django.utils.crypto import constant_time_compare
+
+from . import kvlog
+# }}}
+
+LOG = kvlog.get_logger(__name__)
+
+# Values for the URL arguments of drawwrite's routes that make each one
+# reversible. Arguments not listed here get '1'.
+SAMPLE_URL_ARGUMENTS = {
+    'member': '0-0.png',
+    'token': '0:0',
+}
+
+# The steps {{{
+def warm_templates():
+    """Load, and so compile, every drawwrite template. Return how many."""
+    directory = os.path.join(apps.get_app_config('drawwrite').path, 'templates', 'drawwrite')
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.html'))
+    for name in names:
+        get_template('drawwrite/{0}'.format(name))
+    return len(names)
+
+def warm_urls():
+    """
+    Reverse and resolve every drawwrite route. Return how many. The routes
+    are found through the root URLconf, as drawwrite.urls imports the views,
+    which import this module.
+    """
+    _, resolver = get_resolver().namespace_dict['drawwrite']
+    warmed = 0
+    for pattern in resolver.url_patterns:
+        kwargs = {
+            name: SAMPLE_URL_ARGUMENTS.get(name, '1')
+            for name in pattern.regex.groupindex
+        }
+        try:
+            path = reverse('drawwrite:{0}'.format(pattern.name), kwargs=kwargs)
+        except NoReverseMatch:
+            LOG.warning('could not warm up url', name=pattern.name)
+            continue
+        resolve(path)
+        warmed += 1
+    return warmed
+
+def warm_databases():
+    """Connect to every configured database. Return how many."""
+    for alias in settings.DATABASES:
+        connections[alias].ensure_connection()
+    return len(settings.DATABASES)
+
+def warm_forms():
+    """
+    Build and render the index page's forms, which also lists the games
+    that may be joined on every shard. Return how many forms.
+    """
+    from .forms import CreateGameForm, JoinGameForm
+    forms = (CreateGameForm(), JoinGameForm())
+    for form in forms:
+        str(form)
+    return len(forms)
+# }}}
+
+# warm_up {{{
+STEPS = (
+    ('templates', warm_templates),
+    ('urls', warm_urls),
+    ('databases', warm_databases),
+    ('forms', warm_forms),
+)
+
+def warm_up():
+    """
+    Run every warm-up step. Return a dict with, for each step, how many
+    things it warmed and how long it took.
+    """
+    report = {}
+    for name, step in STEPS:
+        start = time.perf_counter()
+        count = step()
+        report[name] = {'count': count, 'seconds': time.perf_counter() - start}
+    LOG.info('warmed up', **{name: entry['count'] for name, entry in report.items()})
+    return report
+
+def authorized(request):
+    """
+    Return whether request may run the warm up, which it may only when it
+    has DRAWWRITE_WARM_UP_TOKEN in its X-Warm-Up-Token header.
+    """
+    token = getattr(settings, 'DRAWWRITE_WARM_UP_TOKEN', None)
+    if not token:
+        return False
+    return constant_time_compare(request.META.get('HTTP_X_WARM_UP_TOKEN', ''), token)
+
+def warm_up_at_startup():
+    """
+    Warm up, unless DRAWWRITE_WARM_UP is False. Failures are logged rather
+    than raised, so that a worker still starts when, say, a database is
+    briefly unreachable.
+    """
+    if not getattr(settings, 'DRAWWRITE_WARM_UP', True):
+        return
+    try:
+        warm_up()
+    except Exception: #pylint: disable=broad-except
+        LOG.exception('warm up failed')
+# }}}
@@ -0,0 +1,22 @@
+"""
+ASGI config for drawwritesite project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+for any ASGI 3 server, for instance::
+
+    uvicorn drawwritesite.asgi:application
+"""
+
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drawwritesite.settings")
+django.setup(set_prefix=False)
+
+from drawwrite.asgi import ASGIHandler #pylint: disable=wrong-import-position
+from drawwrite.warmup import warm_up_at_startup #pylint: disable=wrong-import-position
+
+application = ASGIHandler()
+
+warm_up_at_startup()
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drawwritesite.settings")
 
 application = get_wsgi_application()
+
+from drawwrite.warmup import warm_up_at_startup #pylint: disable=wrong-import-position
+
+warm_up_at_startup()